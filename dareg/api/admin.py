@@ -4,7 +4,6 @@ from typing import Any
 from django.contrib import admin
 
 from django.urls import reverse
-from onedata_wrapper.models.filesystem.entry_request import EntryRequest
 
 from .models import (
     Facility,
@@ -13,13 +12,13 @@ from .models import (
     Dataset,
     Schema,
     Language,
-    UserProfile, Instrument, Experiment
+    UserProfile, Instrument, Experiment, Job, JobStatus, Reservation
 )
-from onedata_api.middleware import create_new_dataset, create_public_share, establish_dataset
+from onedata_api.provisioning import enqueue_batch
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.http import HttpRequest
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from guardian.admin import GuardedModelAdmin
 
 from knox import crypto 
@@ -159,71 +158,57 @@ class DatasetAdmin(BaseModelAdmin):
         return format_html(f"<a href=\"https://{ONEZONE_HOST}/share/{obj.onedata_share_id}\">Public share {obj.name}</a>")
     onedata_share_link.short_description = 'OneData Public Share'
 
+    def enqueue_batch(self, request, queryset, action, description):
+        job = enqueue_batch(action, queryset, request.user)
+        url = reverse('admin:api_job_change', args=[job.pk])
+        self.message_user(request, format_html('{} for {} datasets scheduled, see <a href="{}">job progress</a>.',
+                                               description, job.total, url), level='SUCCESS')
+
     def create_onedata_share(self, request, queryset):
-        for dataset in queryset:
-            if dataset.onedata_share_id == "":
-                if dataset.onedata_file_id == "":
-                    self.message_user(request, f"Failed to create public share for {dataset}. Dataset doesn't have any supported space.", level='ERROR')
-                    return
-                print(f"Creating public share for {dataset}", flush=True)
-                share, error = create_public_share(dataset.project, dataset.name, dataset.description, EntryRequest(file_id=dataset.onedata_file_id))
-                if error is not None:
-                    self.message_user(request, f"Failed to create public share for {dataset}. {error}", level='ERROR')
-                    return
-                if share.share_id is None:
-                    self.message_user(request, f"Failed to create public share for {dataset}.", level='ERROR')
-                    return
-                dataset.onedata_share_id = share.share_id
-                dataset.save()
-                self.message_user(request, f"Public share for {dataset} created successfully.", level='SUCCESS')
-            else:
-                self.message_user(request, f"Public share for {dataset} already exists.", level='WARNING')
+        self.enqueue_batch(request, queryset, 'share', 'Creating OneData shares')
     create_onedata_share.short_description = 'Create OneData Share'
 
     def create_dataset(self, request, queryset):
-        for dataset in queryset:
-            if dataset.onedata_dataset_id == "":
-                if dataset.onedata_file_id == "":
-                    self.message_user(request, f"Failed to create dataset for {dataset}. Dataset doesn't have any directory.", level='ERROR')
-                    return
-                print(f"Creating dataset for {dataset}", flush=True)
-                visit_id, error = establish_dataset(dataset.project, dataset.onedata_file_id)
-                if error is not None:
-                    self.message_user(request, f"Failed to create dataset for {dataset}. {error}", level='ERROR')
-                    return
-                if visit_id is None:
-                    self.message_user(request, f"Failed to create dataset for {dataset}.", level='ERROR')
-                    return
-                dataset.onedata_dataset_id = visit_id
-                dataset.save()
-                self.message_user(request, f"Visit folder for {dataset} created successfully.", level='SUCCESS')
-            else:
-                self.message_user(request, f"Visit folder for {dataset} already exists.", level='WARNING')
+        self.enqueue_batch(request, queryset, 'dataset', 'Creating OneData datasets')
     create_dataset.short_description = 'Create OneData Dataset'
 
     def create_onedata_folder(self, request, queryset):
-        for dataset in queryset:
-            if dataset.onedata_file_id == "":
-                if dataset.onedata_space_id == "":
-                    self.message_user(request, f"Failed to create visit folder for {dataset}. Dataset doesn't have any supported space.", level='ERROR')
-                    return
-                print(f"Creating visit folder for {dataset}", flush=True)
-                folder, error = create_new_dataset(dataset.project, dataset.name)
-                if error is not None:
-                    self.message_user(request, f"Failed to create visit folder for {dataset}. {error}", level='ERROR')
-                    return
-                if folder is None:
-                    self.message_user(request, f"Failed to create visit folder for {dataset}. Please contact the administrator of DAREG.", level='ERROR')
-                    return
-                dataset.onedata_file_id = folder.file_id
-                dataset.save()
-                self.message_user(request, f"Visit folder for {dataset} created successfully.", level='SUCCESS')
-            else:
-                self.message_user(request, f"Visit folder for {dataset} already exists.", level='WARNING')
+        self.enqueue_batch(request, queryset, 'folder', 'Creating OneData folders')
     create_onedata_folder.short_description = 'Create OneData Folder'
     actions = ['create_onedata_share', 'create_dataset', 'create_onedata_folder']
 
 
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'status', 'progress', 'attempts', 'created', 'modified', 'created_by')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('kind', 'status', 'progress', 'attempts', 'max_attempts', 'run_after', 'payload', 'dataset',
+                       'failures', 'last_error', 'created', 'modified', 'created_by')
+    exclude = ('results', 'total', 'processed', 'failed', 'modified_by')
+    actions = ['retry_jobs']
+
+    def has_add_permission(self, request):
+        return False
+
+    def progress(self, obj):
+        if not obj.total:
+            return '-'
+        return f"{obj.processed}/{obj.total} ({obj.failed} failed)"
+    progress.short_description = 'Progress'
+
+    def failures(self, obj):
+        errors = [(key, result['error']) for key, result in obj.results.items() if result.get('error')]
+        if not errors:
+            return '-'
+        return format_html('<ul>{}</ul>', format_html_join('', '<li>{}: {}</li>', errors))
+    failures.short_description = 'Failures'
+
+    def retry_jobs(self, request, queryset):
+        count = queryset.filter(status=JobStatus.FAILURE).update(status=JobStatus.PENDING, attempts=0,
+                                                                 run_after=timezone.now())
+        self.message_user(request, f'{count} failed jobs scheduled again.')
+    retry_jobs.short_description = 'Retry failed jobs'
+
+
 class ExperimentAdmin(BaseModelAdmin):
     list_display = ('name', 'start_time', 'end_time', 'note', 'status') + BaseModelAdmin.list_display
     search_fields = ('name', 'status', 'note')
@@ -267,6 +252,11 @@ class InstrumentAdmin(BaseModelAdmin):
 
         super().save_model(request, obj, form, change)
         
+class ReservationAdmin(BaseModelAdmin):
+    list_display = ('name', 'instrument', 'user', 'period') + BaseModelAdmin.list_display
+    search_fields = ('name', 'user', 'description')
+    list_filter = ('instrument',)
+
 class SchemaAdmin(BaseModelAdmin):
     list_display = ('name', 'description', 'version') + BaseModelAdmin.list_display
     search_fields = ('name', 'description')
@@ -353,8 +343,10 @@ Group.__str__ = _change_group_display_name
 admin.site.register(Project, ProjectAdmin)
 admin.site.register(Dataset, DatasetAdmin)
 admin.site.register(Experiment, ExperimentAdmin)
+admin.site.register(Job, JobAdmin)
 admin.site.register(Facility, FacilityAdmin)
 admin.site.register(Instrument, InstrumentAdmin)
+admin.site.register(Reservation, ReservationAdmin)
 admin.site.register(Schema, SchemaAdmin)
 
 admin.site.register(UserProfile, UserProfileAdmin)
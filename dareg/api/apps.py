@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        # connect signal handlers and register job handlers
+        from api import events, search  # noqa: F401
+        from onedata_api import provisioning  # noqa: F401
@@ -0,0 +1,202 @@
+"""
+Status changes of experiments and datasets pushed to clients as server-sent events.
+
+Saving an `Experiment` or `Dataset` with a new status sends a Postgres NOTIFY on
+STATUS_CHANNEL when the transaction commits; code changing statuses in bulk calls
+`publish()` itself. Every ASGI worker keeps one LISTEN connection (`Broadcaster`) and
+fans the notifications out to the open `GET /api/v1/events/` streams. A stream only
+passes events of objects the user can view, directly or through an ancestor, and can be
+narrowed to objects and their descendants with `?id=<uuid>` (repeatable).
+
+Streams end after EVENTS_MAX_DURATION seconds; EventSource clients reconnect on their own.
+Browsers cannot send headers with EventSource, so a knox token is also accepted as `?token=`.
+The endpoint needs the ASGI server (`dareg/asgi.py`), under WSGI it answers 501.
+"""
+import asyncio
+import json
+import time
+
+import psycopg
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection, transaction
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from api.models import Dataset, Experiment, Project
+from api.search import ancestor_ids, global_view_models, visible_among
+
+STATUS_CHANNEL = "dareg_status"
+
+
+def key_ancestor_ids(obj) -> list:
+    """Like `ancestor_ids`, from the foreign keys with one query at most when the parents are not loaded."""
+    if isinstance(obj, Experiment) and not (Experiment.dataset.is_cached(obj) and Dataset.project.is_cached(obj.dataset)):
+        facility_id, project_id = Dataset.objects.values_list("project__facility_id", "project_id").get(pk=obj.dataset_id)
+        return [facility_id, project_id, obj.dataset_id]
+    if isinstance(obj, Dataset) and not Dataset.project.is_cached(obj):
+        return [Project.objects.values_list("facility_id", flat=True).get(pk=obj.project_id), obj.project_id]
+    return ancestor_ids(obj)
+
+
+def status_event(obj, previous=None) -> dict:
+    return {
+        "model": obj.__class__.__name__,
+        "id": str(obj.pk),
+        "status": obj.status,
+        "previous": previous,
+        "ancestors": [str(pk) for pk in key_ancestor_ids(obj)],
+        "time": timezone.now().isoformat(),
+    }
+
+
+def publish(events):
+    """NOTIFY the events once the current transaction commits."""
+    payloads = [json.dumps(event) for event in events]
+    if not payloads:
+        return
+
+    def notify():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload",
+                           [STATUS_CHANNEL, payloads])
+
+    transaction.on_commit(notify)
+
+
+@receiver(post_init, sender=Experiment)
+@receiver(post_init, sender=Dataset)
+def remember_status(sender, instance, **kwargs):
+    # read from __dict__, `status` may be deferred
+    instance._saved_status = instance.__dict__.get("status")
+
+
+@receiver(post_save, sender=Experiment)
+@receiver(post_save, sender=Dataset)
+def status_changed(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_saved_status", None)
+    if created or instance.status != previous:
+        publish([status_event(instance, None if created else previous)])
+    instance._saved_status = instance.status
+
+
+def connection_info() -> str:
+    database = settings.DATABASES["default"]
+    return psycopg.conninfo.make_conninfo(dbname=database["NAME"], user=database["USER"],
+                                          password=database["PASSWORD"], host=database["HOST"],
+                                          port=database["PORT"])
+
+
+class Broadcaster:
+    """One LISTEN connection per event loop, feeding a queue per open stream."""
+
+    queue_size = 1000
+
+    def __init__(self):
+        self.queues = set()
+        self.task = None
+        self.loop = None
+
+    def subscribe(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.loop is not loop:
+            self.loop = loop
+            self.task = loop.create_task(self.listen())
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.queues.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.queues.discard(queue)
+
+    def dispatch(self, event):
+        for queue in list(self.queues):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass  # the client does not keep up, it misses events until it catches up
+
+    async def listen(self):
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(connection_info(), autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {STATUS_CHANNEL}")
+                    async for notify in conn.notifies():
+                        self.dispatch(json.loads(notify.payload))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Listening for status changes failed, reconnecting. {e}", flush=True)
+                await asyncio.sleep(settings.EVENTS_HEARTBEAT)
+
+
+broadcaster = Broadcaster()
+
+
+def authenticate(request):
+    """Run the DRF authentication classes, return the user or None."""
+    if "token" in request.GET and "HTTP_AUTHORIZATION" not in request.META:
+        request.META["HTTP_AUTHORIZATION"] = f"Token {request.GET['token']}"
+    try:
+        user = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]).user
+    except APIException:
+        return None
+    return user if user.is_authenticated else None
+
+
+def visible_ids(user, event):
+    """The ids of the event the user can view, None when the user can view the whole model."""
+    if user.is_superuser or event["model"] in global_view_models(user):
+        return None
+    return {str(pk) for pk in visible_among(user, [event["id"], *event["ancestors"]])}
+
+
+def event_visible(event, visible, selected) -> bool:
+    ids = {event["id"], *event["ancestors"]}
+    return (visible is None or not ids.isdisjoint(visible)) and (not selected or not ids.isdisjoint(selected))
+
+
+async def stream(user, selected):
+    queue = broadcaster.subscribe()
+    try:
+        # visibility is checked once per object and forgotten on every permission refresh
+        visible = {}
+        checked = time.monotonic()
+        ends = checked + settings.EVENTS_MAX_DURATION
+        yield f"retry: {settings.EVENTS_RETRY_MS}\n\n"
+        while time.monotonic() < ends:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=settings.EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if time.monotonic() - checked > settings.EVENTS_PERMISSION_REFRESH:
+                visible = {}
+                checked = time.monotonic()
+            if event["id"] not in visible:
+                visible[event["id"]] = await sync_to_async(visible_ids)(user, event)
+            if event_visible(event, visible[event["id"]], selected):
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+    finally:
+        broadcaster.unsubscribe(queue)
+
+
+async def status_events(request):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "The event stream is only served by the ASGI application."}, status=501)
+    user = await sync_to_async(authenticate)(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    response = StreamingHttpResponse(stream(user, set(request.GET.getlist("id"))), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
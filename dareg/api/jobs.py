@@ -0,0 +1,89 @@
+"""
+Minimal database backed job queue.
+
+Jobs are rows of `api.models.Job`. Handlers are registered with `@job_handler("kind")`
+and executed by `manage.py run_jobs`, which claims due jobs with `SELECT ... FOR UPDATE
+SKIP LOCKED`, so several workers can run side by side. Failed jobs are retried with
+exponential backoff until `max_attempts` is reached.
+"""
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Job, JobStatus
+
+HANDLERS = {}
+
+RETRY_BASE_DELAY = 5  # seconds, doubled with every attempt
+STALE_AFTER = timedelta(minutes=30)
+
+
+def job_handler(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, dataset=None, max_attempts=5, created_by=None, total=0) -> Job:
+    return Job.objects.create(kind=kind, payload=payload or {}, dataset=dataset, max_attempts=max_attempts,
+                              created_by=created_by, total=total)
+
+
+def save_job_progress(job: Job):
+    Job.objects.filter(pk=job.pk).update(processed=job.processed, failed=job.failed, results=job.results,
+                                         modified=timezone.now())
+
+
+def claim_jobs(limit=10):
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=JobStatus.PENDING, run_after__lte=timezone.now())
+            .order_by("run_after")[:limit]
+        )
+        now = timezone.now()
+        for job in jobs:
+            job.status = JobStatus.RUNNING
+            job.attempts += 1
+            # `modified` is what requeue_stale_jobs() measures, it must not be the enqueue time
+            job.modified = now
+        Job.objects.bulk_update(jobs, ["status", "attempts", "modified"])
+    return jobs
+
+
+def run_job(job: Job):
+    handler = HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind '{job.kind}'")
+        handler(job)
+    except Exception as e:
+        print(f"Job {job.id} ({job.kind}) failed: {e}", flush=True)
+        job.last_error = "".join(traceback.format_exception(e))[-4000:]
+        if handler is None or job.attempts >= job.max_attempts:
+            job.status = JobStatus.FAILURE
+        else:
+            job.status = JobStatus.PENDING
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+    else:
+        job.status = JobStatus.SUCCESS
+        job.last_error = ""
+    job.save(update_fields=["status", "last_error", "run_after", "payload", "modified"])
+    return job
+
+
+def run_pending_jobs(limit=10):
+    """Claim and run due jobs, return the number of executed jobs."""
+    jobs = claim_jobs(limit)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
+
+
+def requeue_stale_jobs():
+    """Return jobs left RUNNING by a crashed worker to the queue."""
+    return Job.objects.filter(status=JobStatus.RUNNING, modified__lt=timezone.now() - STALE_AFTER) \
+        .update(status=JobStatus.PENDING, run_after=timezone.now())
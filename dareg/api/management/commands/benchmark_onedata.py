@@ -0,0 +1,105 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from api import resilience
+from api.models import Facility, Project, Dataset, Job
+from onedata_api.cache import get_children_page
+from onedata_api.clients import get_client
+from onedata_api.fake_server import FakeOnedataServer
+from onedata_api.middleware import create_new_experiment, create_new_temp_token
+from onedata_api.provisioning import provision_dataset
+
+SCENARIOS = ["dataset", "experiment", "browse", "browse_cached", "temp_token"]
+
+# cleared before every scenario, so the benchmark must not touch the shared cache
+BENCHMARK_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "benchmark_onedata"},
+}
+
+
+class Command(BaseCommand):
+    help = ("Measure throughput of dataset provisioning, experiment creation, directory browsing and "
+            "temporary token issuance against an in-process fake Onedata provider. Nothing is stored in "
+            "the database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                            help="Scenario to run, can be repeated (default: all)")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--iterations", type=int, default=100, help="Operations per scenario")
+        parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to every provider call")
+        parser.add_argument("--jitter", type=float, default=0.01)
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of provider calls failing with 500")
+        parser.add_argument("--files", type=int, default=2000, help="Entries in the browsed directory")
+        parser.add_argument("--page-size", type=int, default=100)
+
+    @override_settings(CACHES=BENCHMARK_CACHES)
+    def handle(self, *args, **options):
+        with FakeOnedataServer(latency=options["latency"], jitter=options["jitter"],
+                               error_rate=options["error_rate"]) as server:
+            space_id, root_id = server.add_space("Benchmark")
+            facility = Facility(name="Benchmark", onedata_provider_url=server.provider_url,
+                                onedata_token=server.token)
+            project = Project(name="Benchmark", facility=facility, onedata_space_id=space_id)
+
+            browsed_id = server.add_entry("browse", "DIR", parent_id=root_id)
+            for i in range(options["files"]):
+                server.add_entry(f"file-{i:06}.tif", parent_id=browsed_id, size=1024)
+            dataset = Dataset(name="browse", project=project, onedata_file_id=browsed_id)
+            client = get_client(facility)
+
+            operations = {
+                "dataset": lambda i: self.provision(project, f"dataset-{uuid.uuid4().hex}"),
+                "experiment": lambda i: create_new_experiment(dataset, str(uuid.uuid4())),
+                "browse": lambda i: (get_children_page(client, browsed_id, options["page_size"],
+                                                       offset=(i * options["page_size"]) % options["files"],
+                                                       refresh=True), None),
+                "browse_cached": lambda i: (get_children_page(client, browsed_id, options["page_size"]), None),
+                "temp_token": lambda i: create_new_temp_token(facility, project, Dataset(name=f"dataset-{i}"),
+                                                              onezone_url=server.onezone_url),
+            }
+
+            self.stdout.write(f"{'scenario':<15}{'ops':>6}{'errors':>8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+                              f"{'max ms':>10}{'calls':>8}")
+            for scenario in options["scenario"] or SCENARIOS:
+                cache.clear()
+                resilience.reset()
+                server.requests.clear()
+                ops_per_second, errors, p50, p95, slowest = self.measure(operations[scenario], options["iterations"],
+                                                                         options["concurrency"])
+                self.stdout.write(f"{scenario:<15}{options['iterations']:>6}{errors:>8}{ops_per_second:>10.1f}"
+                                  f"{p50:>10.1f}{p95:>10.1f}{slowest:>10.1f}{len(server.requests):>8}")
+
+    @staticmethod
+    def provision(project, name):
+        """Run the `provision_dataset` job handler for an unsaved dataset, its progress updates match no rows."""
+        dataset = Dataset(name=name, project=project)
+        provision_dataset(Job(kind="provision_dataset", attempts=1, max_attempts=1), dataset)
+        return dataset, None
+
+    @staticmethod
+    def measure(operation, iterations, concurrency):
+        """Run `operation(i)` `iterations` times, return ops/s, errors and p50/p95/max latency in ms."""
+        def timed(i):
+            started = time.perf_counter()
+            try:
+                _, error = operation(i)
+            except Exception as e:
+                error = {"error": str(e)}
+            return (time.perf_counter() - started) * 1000, error is not None
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed, range(iterations)))
+        elapsed = time.perf_counter() - started
+
+        durations = sorted(duration for duration, _ in results)
+        errors = sum(1 for _, failed in results if failed)
+        p95 = durations[max(0, int(len(durations) * 0.95) - 1)]
+        return iterations / elapsed, errors, statistics.median(durations), p95, durations[-1]
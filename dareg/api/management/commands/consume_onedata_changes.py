@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from onedata_api.changes import ChangeConsumer, active_sources
+
+
+class Command(BaseCommand):
+    help = "Follow the Onedata change streams of spaces with active experiments and update the experiments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--flush-interval", type=float, default=None,
+                            help="Seconds to wait for a full batch before applying a partial one")
+        parser.add_argument("--refresh-interval", type=float, default=60,
+                            help="Seconds between checks for spaces of newly active experiments")
+
+    def handle(self, *args, **options):
+        consumer = ChangeConsumer(active_sources(), batch_size=options["batch_size"],
+                                  flush_interval=options["flush_interval"])
+        self.stdout.write(f"Consuming changes of {len(consumer.sources)} space(s).")
+        consumer.run(refresh=active_sources, refresh_interval=options["refresh_interval"])
@@ -0,0 +1,52 @@
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.models import Dataset
+
+PATH_SEGMENT = re.compile(r"^[A-Za-z0-9_\-]+$")
+
+
+def metadata_index_sql(path):
+    """
+    Build a trigram expression index for a dotted metadata path.
+
+    The expression matches what Django generates for `metadata__a__b__iregex`,
+    i.e. `metadata ->> 'a'` for a single key and `metadata #>> '{a,b}'` for nested keys.
+    """
+    parts = path.split(".")
+    if not all(PATH_SEGMENT.match(part) for part in parts):
+        raise CommandError(f"Invalid metadata path: {path}")
+
+    column = connection.ops.quote_name("metadata")
+    if len(parts) == 1:
+        expression = f"({column} ->> '{parts[0]}')"
+    else:
+        expression = f"({column} #>> '{{{','.join(parts)}}}'::text[])"
+
+    table = connection.ops.quote_name(Dataset._meta.db_table)
+    name = f"dataset_meta_{hashlib.sha1(path.encode()).hexdigest()[:10]}_trgm"
+    return name, f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING gin ({expression} gin_trgm_ops)"
+
+
+class Command(BaseCommand):
+    help = "Create trigram expression indexes on hot Dataset metadata paths used by $regex filters."
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*",
+                            help="Dotted metadata paths, defaults to SEARCH_METADATA_INDEX_PATHS setting")
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or settings.SEARCH_METADATA_INDEX_PATHS
+        if not paths:
+            self.stdout.write("No metadata paths configured.")
+            return
+
+        with connection.cursor() as cursor:
+            for path in paths:
+                name, sql = metadata_index_sql(path)
+                cursor.execute(sql)
+                self.stdout.write(self.style.SUCCESS(f"Index {name} on metadata.{path} is ready."))
@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api.telemetry import drop_expired_partitions, ensure_partitions
+
+
+class Command(BaseCommand):
+    help = "Create the upcoming monthly telemetry partitions and drop the expired raw samples."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months-ahead", type=int, default=settings.TELEMETRY_PARTITIONS_AHEAD,
+                            help="Number of months after the current one to create partitions for")
+        parser.add_argument("--retention-days", type=int, default=settings.TELEMETRY_RAW_RETENTION_DAYS,
+                            help="Days the raw samples are kept, the rollups are never dropped")
+        parser.add_argument("--interval", type=float, default=0,
+                            help="Keep running and maintain the partitions every INTERVAL seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            try:
+                created = ensure_partitions(options["months_ahead"])
+                dropped = drop_expired_partitions(options["retention_days"])
+            except Exception as e:
+                if not options["interval"]:
+                    raise CommandError(f"Telemetry maintenance failed. {e}")
+                self.stderr.write(f"Telemetry maintenance failed. {e}")
+            else:
+                self.stdout.write(f"Created partitions: {', '.join(created) or 'none'}")
+                self.stdout.write(f"Dropped partitions: {', '.join(dropped) or 'none'}")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
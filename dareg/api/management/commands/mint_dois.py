@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+
+from api.jobs import run_job
+from api.models import Dataset, Job, JobStatus
+from datacite_api.minting import enqueue_minting
+
+
+class Command(BaseCommand):
+    help = "Register DataCite DOIs for all datasets of a project, or for the given datasets, that have none."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--project", help="Project id")
+        parser.add_argument("--dataset", action="append", default=[], help="Dataset id, can be repeated")
+        parser.add_argument("--resume", help="Id of a previous mint_dois job, its failed datasets are tried again")
+        parser.add_argument("--enqueue", action="store_true", help="Leave the job to `run_jobs` instead of running it")
+
+    def handle(self, *args, **options):
+        if options["resume"]:
+            job = Job.objects.filter(pk=options["resume"], kind="mint_dois").first()
+            if job is None:
+                raise CommandError(f"No mint_dois job {options['resume']}.")
+        else:
+            if not options["project"] and not options["dataset"]:
+                raise CommandError("Give --project or --dataset.")
+            datasets = Dataset.objects.filter(Q(doi__isnull=True) | Q(doi=""))
+            if options["project"]:
+                datasets = datasets.filter(project_id=options["project"])
+            if options["dataset"]:
+                datasets = datasets.filter(pk__in=options["dataset"])
+            job = enqueue_minting(datasets)
+        self.stdout.write(f"Job {job.pk}: {job.total} dataset(s).")
+        if options["enqueue"]:
+            return
+
+        # claim the job so that a `run_jobs` worker does not run it as well
+        if not Job.objects.filter(pk=job.pk).exclude(status=JobStatus.RUNNING) \
+                .update(status=JobStatus.RUNNING, attempts=F("attempts") + 1):
+            raise CommandError(f"Job {job.pk} is already running.")
+        job.refresh_from_db()
+        run_job(job)
+        for dataset_id, result in job.results.items():
+            if result["status"] == "failure":
+                self.stderr.write(f"{dataset_id}: {result['error']}")
+            else:
+                self.stdout.write(f"{dataset_id}: {result['doi']} ({result['status']})")
+        self.stdout.write(f"{job.processed - job.failed} registered or skipped, {job.failed} failed.")
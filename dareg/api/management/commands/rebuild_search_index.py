@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.models import SearchDocument
+from api.search import SEARCHABLE_MODELS, index_objects, indexable_queryset
+
+
+def index_batch(model_class, pks):
+    try:
+        return index_objects(indexable_queryset(model_class).filter(pk__in=pks))
+    finally:
+        # every worker thread opens its own connection
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Rebuild the SearchDocument table in parallel batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--model", action="append", help="Reindex only given model(s), e.g. Dataset")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        models = [m for m in SEARCHABLE_MODELS if not options["model"] or m.__name__ in options["model"]]
+
+        for model_class in models:
+            pks = list(model_class.objects.values_list("pk", flat=True))
+            batches = [pks[i:i + batch_size] for i in range(0, len(pks), batch_size)]
+
+            with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+                indexed = sum(executor.map(lambda batch: index_batch(model_class, batch), batches))
+
+            stale, _ = SearchDocument.objects.filter(model=model_class.__name__).exclude(object_id__in=pks).delete()
+            self.stdout.write(self.style.SUCCESS(
+                f"{model_class.__name__}: indexed {indexed} documents, removed {stale} stale documents."
+            ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.jobs import run_pending_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Run background jobs (Onedata provisioning, renames, ...) from the Job table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run due jobs once and exit")
+        parser.add_argument("--batch", type=int, default=10)
+        parser.add_argument("--interval", type=float, default=2, help="Seconds to sleep when the queue is empty")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            requeue_stale_jobs()
+            executed = run_pending_jobs(options["batch"])
+            if executed:
+                self.stdout.write(f"Executed {executed} job(s).")
+            if options["once"]:
+                break
+            if not executed:
+                time.sleep(options["interval"])
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from api.models import Dataset
+from onedata_api.mirror import sync_dataset
+
+
+class Command(BaseCommand):
+    help = "Mirror the Onedata trees of datasets and store size, file count and last modification time."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=100,
+                            help="Number of datasets to synchronize, the least recently synchronized first")
+        parser.add_argument("--dataset", action="append", default=[], help="Dataset id, can be repeated")
+        parser.add_argument("--full", action="store_true", help="List every directory, even unchanged ones")
+
+    def handle(self, *args, **options):
+        datasets = Dataset.objects.select_related("project__facility") \
+            .exclude(onedata_file_id__isnull=True).exclude(onedata_file_id="")
+        if options["dataset"]:
+            datasets = datasets.filter(pk__in=options["dataset"])
+        else:
+            datasets = datasets.order_by(F("stats_synced").asc(nulls_first=True))[:options["limit"]]
+
+        failed = 0
+        for dataset in datasets:
+            try:
+                totals = sync_dataset(dataset, full=options["full"])
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Failed to synchronize {dataset} ({dataset.pk}): {e}")
+                continue
+            size, file_count, _ = totals[dataset.onedata_file_id]
+            self.stdout.write(f"{dataset} ({dataset.pk}): {file_count} files, {size} bytes")
+
+        if failed:
+            self.stderr.write(f"{failed} dataset(s) failed.")
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api.reservation_sync import get_source, sync_reservations
+
+
+class Command(BaseCommand):
+    help = "Import reservations changed in the facility booking system since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Import all reservations, not only the changed ones")
+        parser.add_argument("--interval", type=float, default=0,
+                            help="Keep running and import changes every INTERVAL seconds")
+
+    def handle(self, *args, **options):
+        try:
+            source = get_source()
+        except Exception as e:
+            raise CommandError(f"Cannot set up the reservation source. {e}")
+
+        full = options["full"]
+        while True:
+            close_old_connections()
+            try:
+                result = sync_reservations(source, full=full)
+            except Exception as e:
+                if not options["interval"]:
+                    raise CommandError(f"Reservation sync failed. {e}")
+                self.stderr.write(f"Reservation sync failed. {e}")
+            else:
+                full = False
+                self.stdout.write(f"{result['upserted']} upserted, {result['deleted']} deleted, "
+                                  f"{result['skipped']} skipped (invalid), {result['unresolved']} waiting for an unknown "
+                                  f"instrument, watermark {result['watermark']}")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
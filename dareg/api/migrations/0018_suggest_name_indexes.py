@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:53
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_enable_pg_trm'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dataset',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='text_pattern_ops'), name='dataset_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dataset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='dataset_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='facility',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='text_pattern_ops'), name='facility_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facility',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='facility_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='text_pattern_ops'), name='project_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='project_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='schema',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='text_pattern_ops'), name='schema_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='schema',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='schema_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:54
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_suggest_name_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dataset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='dataset_description_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='experiment',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='experiment_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='experiment',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['note'], name='experiment_note_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='project_description_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='schema',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['description'], name='schema_description_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
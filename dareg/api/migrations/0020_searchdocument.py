@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:56
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_regex_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50, verbose_name='Model')),
+                ('object_id', models.UUIDField(verbose_name='Object id')),
+                ('ancestor_ids', django.contrib.postgres.fields.ArrayField(base_field=models.UUIDField(), blank=True, default=list, size=None)),
+                ('title', models.CharField(blank=True, max_length=200, verbose_name='Title')),
+                ('text', models.TextField(blank=True, verbose_name='Text')),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('scope', models.CharField(choices=[('object', 'Object permissions of the object or its ancestors'), ('model', 'Model-level view permission')], default='object', max_length=10)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['object_id'], name='searchdoc_object_idx'), django.contrib.postgres.indexes.GinIndex(fields=['ancestor_ids'], name='searchdoc_ancestors_idx'), django.contrib.postgres.indexes.GinIndex(fields=['title'], name='searchdoc_title_trgm_idx', opclasses=['gin_trgm_ops']), django.contrib.postgres.indexes.GinIndex(fields=['text'], name='searchdoc_text_trgm_idx', opclasses=['gin_trgm_ops'])],
+                'unique_together': {('model', 'object_id')},
+            },
+        ),
+    ]
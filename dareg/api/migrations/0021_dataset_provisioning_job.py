@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:59
+
+import api.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import django_extensions.db.fields
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0020_searchdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='provisioning_status',
+            field=models.CharField(choices=[('none', 'NONE'), ('pending', 'PENDING'), ('running', 'RUNNING'), ('success', 'SUCCESS'), ('failure', 'FAILURE')], default=api.models.ProvisioningStatus['NONE'], max_length=20, verbose_name='Onedata provisioning status'),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='provisioning_steps',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=50, verbose_name='Kind')),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pending', 'PENDING'), ('running', 'RUNNING'), ('success', 'SUCCESS'), ('failure', 'FAILURE')], default=api.models.JobStatus['PENDING'], max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=5)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Run after')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last error')),
+                ('created_by', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('dataset', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.dataset')),
+                ('modified_by', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='%(class)s_modified_by', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx')],
+            },
+        ),
+    ]
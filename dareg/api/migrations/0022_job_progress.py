@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_dataset_provisioning_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='failed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='processed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='results',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_job_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='file_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Number of files'),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='last_modified',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Last modified in Onedata'),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='size',
+            field=models.BigIntegerField(default=0, verbose_name='Size (bytes)'),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='stats_synced',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Statistics synchronized'),
+        ),
+        migrations.AddField(
+            model_name='experiment',
+            name='file_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Number of files'),
+        ),
+        migrations.AddField(
+            model_name='experiment',
+            name='last_modified',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Last modified in Onedata'),
+        ),
+        migrations.AddField(
+            model_name='experiment',
+            name='size',
+            field=models.BigIntegerField(default=0, verbose_name='Size (bytes)'),
+        ),
+        migrations.AddField(
+            model_name='experiment',
+            name='stats_synced',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Statistics synchronized'),
+        ),
+        migrations.CreateModel(
+            name='OnedataDirectory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_id', models.CharField(max_length=512, unique=True, verbose_name='Onedata File ID')),
+                ('parent_id', models.CharField(blank=True, db_index=True, max_length=512, verbose_name='Parent Onedata File ID')),
+                ('name', models.CharField(blank=True, max_length=512, verbose_name='Name')),
+                ('mtime', models.BigIntegerField(default=0)),
+                ('size', models.BigIntegerField(default=0)),
+                ('file_count', models.PositiveIntegerField(default=0)),
+                ('last_modified', models.DateTimeField(blank=True, null=True)),
+                ('synced', models.DateTimeField(auto_now=True)),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='onedata_directories', to='api.dataset')),
+            ],
+        ),
+    ]
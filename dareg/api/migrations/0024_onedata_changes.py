@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_onedata_tree_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Key')),
+                ('value', models.JSONField(blank=True, default=dict)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='experiment',
+            name='last_activity',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Last activity'),
+        ),
+    ]
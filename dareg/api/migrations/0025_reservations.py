@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:18
+
+from django.conf import settings
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0024_onedata_changes'),
+    ]
+
+    operations = [
+        # GiST index on the instrument's uuid next to the range
+        BtreeGistExtension(),
+        migrations.AlterField(
+            model_name='dataset',
+            name='reservationId',
+            field=models.CharField(blank=True, db_index=True, max_length=50, null=True, verbose_name='Reservation ID'),
+        ),
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200, verbose_name='Name')),
+                ('description', models.CharField(blank=True, max_length=500, verbose_name='Description')),
+                ('user', models.CharField(blank=True, max_length=200, verbose_name='Reserved by')),
+                ('period', django.contrib.postgres.fields.ranges.DateTimeRangeField(verbose_name='Period')),
+                ('created_by', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('instrument', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='api.instrument')),
+                ('modified_by', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='%(class)s_modified_by', to=settings.AUTH_USER_MODEL)),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.project')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GistIndex(fields=['instrument', 'period'], name='reservation_period_idx')],
+            },
+        ),
+    ]
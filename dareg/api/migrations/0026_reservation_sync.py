@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_reservations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True, verbose_name='Booking system ID'),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='source_modified',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Modified in the booking system'),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:26
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_reservation_sync'),
+    ]
+
+    operations = [
+        # Django cannot create partitioned tables, so this one is created by hand. The primary
+        # key has to include the partition key. `manage.py maintain_telemetry` creates the next
+        # monthly partitions and drops expired ones, samples outside of them go to the default.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='TelemetryBatch',
+                    fields=[
+                        ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                        ('metric', models.CharField(max_length=50, verbose_name='Metric')),
+                        ('start', models.DateTimeField(verbose_name='First sample')),
+                        ('end', models.DateTimeField(verbose_name='Last sample')),
+                        ('times', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), size=None)),
+                        ('values', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), size=None)),
+                        ('received', models.DateTimeField(auto_now_add=True)),
+                        ('experiment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.experiment')),
+                        ('instrument', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.instrument')),
+                    ],
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql="""
+CREATE TABLE api_telemetrybatch (
+    id bigserial,
+    experiment_id uuid NOT NULL REFERENCES api_experiment (id) DEFERRABLE INITIALLY DEFERRED,
+    instrument_id uuid NULL REFERENCES api_instrument (id) DEFERRABLE INITIALLY DEFERRED,
+    metric varchar(50) NOT NULL,
+    start timestamp with time zone NOT NULL,
+    "end" timestamp with time zone NOT NULL,
+    times double precision[] NOT NULL,
+    "values" double precision[] NOT NULL,
+    received timestamp with time zone NOT NULL,
+    PRIMARY KEY (id, start)
+) PARTITION BY RANGE (start);
+CREATE INDEX telemetry_batch_experiment_idx ON api_telemetrybatch (experiment_id, metric, start);
+CREATE INDEX telemetry_batch_instrument_idx ON api_telemetrybatch (instrument_id, metric, start);
+CREATE TABLE api_telemetrybatch_default PARTITION OF api_telemetrybatch DEFAULT;
+DO $$
+DECLARE
+    month timestamptz;
+BEGIN
+    FOR month IN SELECT generate_series(date_trunc('month', now()), date_trunc('month', now()) + interval '2 months', interval '1 month') LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF api_telemetrybatch FOR VALUES FROM (%L) TO (%L)',
+                       'api_telemetrybatch_' || to_char(month, '"y"YYYY"m"MM'), month, month + interval '1 month');
+    END LOOP;
+END $$;
+""",
+                    reverse_sql="DROP TABLE api_telemetrybatch;",
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TelemetryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=50, verbose_name='Metric')),
+                ('resolution', models.PositiveIntegerField(verbose_name='Resolution (seconds)')),
+                ('bucket', models.DateTimeField(verbose_name='Bucket start')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.FloatField(default=0)),
+                ('minimum', models.FloatField()),
+                ('maximum', models.FloatField()),
+                ('last', models.FloatField()),
+                ('last_time', models.DateTimeField()),
+                ('experiment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.experiment')),
+                ('instrument', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.instrument')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['instrument', 'metric', 'resolution', 'bucket'], name='telemetry_rollup_instr_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='telemetryrollup',
+            constraint=models.UniqueConstraint(fields=('experiment', 'metric', 'resolution', 'bucket'), name='telemetry_rollup_unique'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('api', '0027_telemetry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PermsGroupRow',
+            fields=[
+                ('group', models.OneToOneField(db_column='group_ptr_id', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='auth.group')),
+                ('object_id', models.UUIDField(null=True)),
+                ('role', models.CharField(choices=[('Owner', 'Owner'), ('Editor', 'Editor'), ('Viewer', 'Viewer')], max_length=6, null=True)),
+            ],
+            options={
+                'db_table': 'api_permsgroup',
+                'managed': False,
+            },
+        ),
+    ]
@@ -11,9 +11,13 @@ from django.contrib.auth.models import User, Group, Permission
 from django.dispatch import receiver
 from django.db.models.signals import post_save, post_delete
 from django.conf import settings
+from django.utils import timezone
 from guardian.shortcuts import assign_perm
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.fields import ArrayField, DateTimeRangeField
+from django.contrib.postgres.indexes import GinIndex, GistIndex, OpClass
+from django.db.models.functions import Upper
 
 ##
 # Steps to generate UML class diagram
@@ -189,6 +193,71 @@ class PermsGroup(Group):
     def __str__(self):
         return f'{self.content_type.model_class()._meta.verbose_name.capitalize()} - {self.content_object} - {self.role}'
 
+class PermsGroupRow(models.Model):
+    """
+    The `PermsGroup` table alone. `bulk_create()` refuses multi-table inherited models, so
+    `create_perms_groups` creates the `Group` rows first and these rows pointing to them.
+    """
+    group = models.OneToOneField(Group, models.CASCADE, primary_key=True, db_column="group_ptr_id",
+                                 related_name="+")
+    object_id = models.UUIDField(null=True)
+    content_type = models.ForeignKey(ContentType, models.CASCADE, null=True, related_name="+")
+    role = models.CharField(max_length=6, choices=PermsGroup.ROLE_CHOICES, null=True)
+
+    class Meta:
+        managed = False
+        db_table = PermsGroup._meta.db_table
+
+
+def create_perms_groups(objs):
+    """
+    Bulk counterpart of the group setup in `PermsObject.save` for new objects of one model:
+    creates their owner, editor and viewer groups with the object permissions of
+    `PermsGroup.save` and adds each object's `created_by` to its owner group.
+    """
+    from guardian.models import GroupObjectPermission
+
+    if not objs:
+        return []
+    model = type(objs[0])
+    content_type = ContentType.objects.get_for_model(model)
+    class_name = model._meta.verbose_name.lower()
+    permissions = {perm.codename: perm for perm in Permission.objects.filter(content_type=content_type)}
+    role_perms = {
+        PermsGroup.OWNER: ["delete", "change", "view"],
+        PermsGroup.EDITOR: ["change", "view"],
+        PermsGroup.VIEWER: ["view"],
+    }
+
+    groups = [
+        PermsGroup(name=f"{obj.id}_{suffix}", object_id=obj.id, content_type=content_type, role=role)
+        for obj in objs
+        for suffix, role in [("owner", PermsGroup.OWNER), ("editor", PermsGroup.EDITOR), ("viewer", PermsGroup.VIEWER)]
+    ]
+    parents = Group.objects.bulk_create([Group(name=group.name) for group in groups])
+    for group, parent in zip(groups, parents):
+        group.id = group.group_ptr_id = parent.id
+        group._state.adding = False
+    PermsGroupRow.objects.bulk_create([
+        PermsGroupRow(group_id=group.id, object_id=group.object_id, content_type=content_type, role=group.role)
+        for group in groups
+    ])
+
+    GroupObjectPermission.objects.bulk_create([
+        GroupObjectPermission(group_id=group.id, permission=permissions[f"{perm}_{class_name}"],
+                              content_type=content_type, object_pk=str(group.object_id))
+        for group in groups
+        for perm in role_perms[group.role]
+    ])
+    creators = {obj.id: obj.created_by_id for obj in objs}
+    User.groups.through.objects.bulk_create([
+        User.groups.through(user_id=creators[group.object_id], group_id=group.id)
+        for group in groups
+        if group.role == PermsGroup.OWNER and creators[group.object_id] is not None
+    ])
+    return groups
+
+
 class Facility(PermsObject):
     name = models.CharField("Name", max_length=200, unique=True)
     abbreviation = models.CharField("Abbreviation", max_length=20, unique=True)
@@ -200,6 +269,10 @@ class Facility(PermsObject):
 
     class Meta:
         verbose_name_plural = "Facilities"
+        indexes = [
+            models.Index(OpClass(Upper("name"), name="text_pattern_ops"), name="facility_name_prefix_idx"),
+            GinIndex(fields=["name"], opclasses=["gin_trgm_ops"], name="facility_name_trgm_idx"),
+        ]
 
     def __str__(self):
         return f'{self.name}'
@@ -221,6 +294,30 @@ class Instrument(PermsObject):
     def __str__(self):
         return f'{self.name}'
 
+
+class Reservation(BaseModel):
+    """
+    Booking of an instrument. `period` is a `tstzrange`, overlap lookups
+    (`period__overlap`) use the GiST index on (instrument, period).
+    """
+    instrument = models.ForeignKey(Instrument, models.CASCADE, related_name="reservations")
+    project = models.ForeignKey("Project", models.SET_NULL, null=True, blank=True)
+    name = models.CharField("Name", max_length=200)
+    description = models.CharField("Description", max_length=500, blank=True)
+    user = models.CharField("Reserved by", max_length=200, blank=True)
+    period = DateTimeRangeField("Period")
+    # set for reservations imported from the booking system (`api.reservation_sync`)
+    external_id = models.CharField("Booking system ID", max_length=255, unique=True, null=True, blank=True)
+    source_modified = models.DateTimeField("Modified in the booking system", null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            GistIndex(fields=["instrument", "period"], name="reservation_period_idx"),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.period.lower} - {self.period.upper})'
+
 class Schema(BaseModel):
     version = models.PositiveIntegerField("Version", default=1)
     name = models.CharField("Name", max_length=200)
@@ -232,6 +329,11 @@ class Schema(BaseModel):
 
     class Meta:
         unique_together = ("name", "version")
+        indexes = [
+            models.Index(OpClass(Upper("name"), name="text_pattern_ops"), name="schema_name_prefix_idx"),
+            GinIndex(fields=["name"], opclasses=["gin_trgm_ops"], name="schema_name_trgm_idx"),
+            GinIndex(fields=["description"], opclasses=["gin_trgm_ops"], name="schema_description_trgm_idx"),
+        ]
 
     def __str__(self):
             return f'{self.name} (v.{self.version})'
@@ -254,6 +356,11 @@ class Project(PermsObject):
     
     class Meta:
         unique_together = ("facility", "name")
+        indexes = [
+            models.Index(OpClass(Upper("name"), name="text_pattern_ops"), name="project_name_prefix_idx"),
+            GinIndex(fields=["name"], opclasses=["gin_trgm_ops"], name="project_name_trgm_idx"),
+            GinIndex(fields=["description"], opclasses=["gin_trgm_ops"], name="project_description_trgm_idx"),
+        ]
 
     def __str__(self):
         return f'{self.name}'
@@ -275,6 +382,17 @@ class DatasetStatus(StrEnum):
     def choices(cls):
         return [(key.value, key.name) for key in cls]
 
+class ProvisioningStatus(StrEnum):
+    NONE = "none"
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCESS = "success"
+    FAILURE = "failure"
+
+    @classmethod
+    def choices(cls):
+        return [(key.value, key.name) for key in cls]
+
 class Dataset(PermsObject):
     project = models.ForeignKey(Project, models.PROTECT)
     name = models.CharField("Name", max_length=200)
@@ -287,8 +405,17 @@ class Dataset(PermsObject):
     onedata_dataset_id = models.CharField("Onedata Dataset ID", max_length=512, null=True, blank=True)
     onedata_space_id = models.CharField("Onedata Space ID", max_length=512, null=True, blank=True)
     doi = models.CharField("DOI", max_length=50, null=True, blank=True)
-    reservationId = models.CharField("Reservation ID", max_length=50, null=True, blank=True)
+    reservationId = models.CharField("Reservation ID", max_length=50, null=True, blank=True, db_index=True)
     status = models.CharField(choices=DatasetStatus.choices(), default=DatasetStatus.NEW, max_length=20)
+    provisioning_status = models.CharField("Onedata provisioning status", choices=ProvisioningStatus.choices(),
+                                           default=ProvisioningStatus.NONE, max_length=20)
+    # per-step state of the Onedata provisioning, e.g. {"folder": {"status": "success", "attempts": 1, ...}}
+    provisioning_steps = models.JSONField(default=dict, blank=True)
+    # aggregated over the Onedata directory tree by `manage.py sync_onedata_stats`
+    size = models.BigIntegerField("Size (bytes)", default=0)
+    file_count = models.PositiveIntegerField("Number of files", default=0)
+    last_modified = models.DateTimeField("Last modified in Onedata", null=True, blank=True)
+    stats_synced = models.DateTimeField("Statistics synchronized", null=True, blank=True)
 
     trigram_search_fields = ["name", "description"]
 
@@ -307,6 +434,11 @@ class Dataset(PermsObject):
 
     class Meta:
         unique_together = ("project", "name")
+        indexes = [
+            models.Index(OpClass(Upper("name"), name="text_pattern_ops"), name="dataset_name_prefix_idx"),
+            GinIndex(fields=["name"], opclasses=["gin_trgm_ops"], name="dataset_name_trgm_idx"),
+            GinIndex(fields=["description"], opclasses=["gin_trgm_ops"], name="dataset_description_trgm_idx"),
+        ]
 
 
 class ExperimentStatus(StrEnum):
@@ -330,9 +462,189 @@ class Experiment(PermsObject):
     note = models.CharField("Note", max_length=500, blank=True)
     status = models.CharField(choices=ExperimentStatus.choices(), default=ExperimentStatus.NEW, max_length=20)
     onedata_file_id = models.CharField("Onedata File ID", max_length=512, null=True, blank=True)
+    # aggregated over the Onedata directory tree by `manage.py sync_onedata_stats`
+    size = models.BigIntegerField("Size (bytes)", default=0)
+    file_count = models.PositiveIntegerField("Number of files", default=0)
+    last_modified = models.DateTimeField("Last modified in Onedata", null=True, blank=True)
+    stats_synced = models.DateTimeField("Statistics synchronized", null=True, blank=True)
+    # time of the last file change seen by `manage.py consume_onedata_changes`
+    last_activity = models.DateTimeField("Last activity", null=True, blank=True)
 
     trigram_search_fields = ["name", "note"]
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=["name"], opclasses=["gin_trgm_ops"], name="experiment_name_trgm_idx"),
+            GinIndex(fields=["note"], opclasses=["gin_trgm_ops"], name="experiment_note_trgm_idx"),
+        ]
+
+class JobStatus(StrEnum):
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCESS = "success"
+    FAILURE = "failure"
+
+    @classmethod
+    def choices(cls):
+        return [(key.value, key.name) for key in cls]
+
+class Job(BaseModel):
+    """
+    Database backed background job, executed by `manage.py run_jobs`. See `api.jobs`.
+    """
+    kind = models.CharField("Kind", max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(choices=JobStatus.choices(), default=JobStatus.PENDING, max_length=20)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField("Run after", default=timezone.now)
+    last_error = models.TextField("Last error", blank=True)
+    dataset = models.ForeignKey(Dataset, models.CASCADE, null=True, blank=True)
+    # progress of jobs processing several items, results are keyed by item id
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    results = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="job_status_run_after_idx"),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} ({self.status})'
+
+
+class OnedataDirectory(models.Model):
+    """
+    Mirror of one directory of a dataset's Onedata tree with the totals of the files directly in it.
+
+    `mtime` is the directory's Onedata modification time when it was last listed; it only changes
+    when entries are added, removed or renamed, so unchanged directories are not listed again.
+    """
+    dataset = models.ForeignKey(Dataset, models.CASCADE, related_name="onedata_directories")
+    file_id = models.CharField("Onedata File ID", max_length=512, unique=True)
+    parent_id = models.CharField("Parent Onedata File ID", max_length=512, blank=True, db_index=True)
+    name = models.CharField("Name", max_length=512, blank=True)
+    mtime = models.BigIntegerField(default=0)
+    size = models.BigIntegerField(default=0)
+    file_count = models.PositiveIntegerField(default=0)
+    last_modified = models.DateTimeField(null=True, blank=True)
+    synced = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.file_id})'
+
+
+class TelemetryBatch(models.Model):
+    """
+    Append-only raw instrument telemetry, one row per ingested batch and metric with the
+    sample times (epoch seconds) and values packed in arrays. The table is partitioned by
+    month of `start` (migration 0027, `manage.py maintain_telemetry`), its primary key is
+    (id, start). See `api.telemetry`.
+    """
+    id = models.BigAutoField(primary_key=True)
+    experiment = models.ForeignKey(Experiment, models.CASCADE)
+    instrument = models.ForeignKey(Instrument, models.SET_NULL, null=True, blank=True)
+    metric = models.CharField("Metric", max_length=50)
+    start = models.DateTimeField("First sample")
+    end = models.DateTimeField("Last sample")
+    times = ArrayField(models.FloatField())
+    values = ArrayField(models.FloatField())
+    received = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.metric} ({self.start} - {self.end})'
+
+
+class TelemetryRollup(models.Model):
+    """
+    Telemetry downsampled to buckets of `resolution` seconds, updated on ingestion.
+    """
+    experiment = models.ForeignKey(Experiment, models.CASCADE)
+    instrument = models.ForeignKey(Instrument, models.SET_NULL, null=True, blank=True)
+    metric = models.CharField("Metric", max_length=50)
+    resolution = models.PositiveIntegerField("Resolution (seconds)")
+    bucket = models.DateTimeField("Bucket start")
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0)
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+    # latest value in the bucket, e.g. of a counter such as bytes transferred
+    last = models.FloatField()
+    last_time = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["experiment", "metric", "resolution", "bucket"],
+                                    name="telemetry_rollup_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["instrument", "metric", "resolution", "bucket"], name="telemetry_rollup_instr_idx"),
+        ]
+
+    def __str__(self):
+        return f'{self.metric} {self.bucket} ({self.resolution}s)'
+
+
+class SyncState(models.Model):
+    """
+    Resume position of a long-running synchronization, e.g. the last consumed sequence
+    number of a space's Onedata change stream.
+    """
+    key = models.CharField("Key", max_length=255, unique=True)
+    value = models.JSONField(default=dict, blank=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.key
+
+    @classmethod
+    def get(cls, key, default=None):
+        state = cls.objects.filter(key=key).first()
+        return state.value if state is not None else default
+
+    @classmethod
+    def put(cls, key, value):
+        cls.objects.update_or_create(key=key, defaults={"value": value})
+
+
+class SearchDocument(models.Model):
+    """
+    Denormalized search row for one Facility, Project, Dataset, Experiment or Schema.
+
+    Kept in sync by the signal handlers in `api.search`, rebuilt by `manage.py rebuild_search_index`.
+    """
+
+    SCOPE_OBJECT = "object"
+    SCOPE_MODEL = "model"
+    SCOPE_CHOICES = [
+        (SCOPE_OBJECT, "Object permissions of the object or its ancestors"),
+        (SCOPE_MODEL, "Model-level view permission"),
+    ]
+
+    model = models.CharField("Model", max_length=50)
+    object_id = models.UUIDField("Object id")
+    ancestor_ids = ArrayField(models.UUIDField(), default=list, blank=True)
+    title = models.CharField("Title", max_length=200, blank=True)
+    text = models.TextField("Text", blank=True)
+    metadata = models.JSONField(default=dict, blank=True)
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES, default=SCOPE_OBJECT)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("model", "object_id")
+        indexes = [
+            models.Index(fields=["object_id"], name="searchdoc_object_idx"),
+            GinIndex(fields=["ancestor_ids"], name="searchdoc_ancestors_idx"),
+            GinIndex(fields=["title"], opclasses=["gin_trgm_ops"], name="searchdoc_title_trgm_idx"),
+            GinIndex(fields=["text"], opclasses=["gin_trgm_ops"], name="searchdoc_text_trgm_idx"),
+        ]
+
+    def __str__(self):
+        return f'{self.model} - {self.title}'
+
+
 class Language(models.Model):
     name = models.CharField("Name", max_length=200, unique=True)
     code = models.CharField(
@@ -0,0 +1,233 @@
+"""
+Incremental import of reservations from the facility booking system.
+
+A reservation source yields records changed since a watermark:
+
+    {"id": "<id in the booking system>", "facility": "<facility abbreviation>",
+     "instrument": "<instrument name>", "name": ..., "description": ..., "user": ...,
+     "from": "<ISO timestamp>", "to": "<ISO timestamp>", "modified": "<ISO timestamp>",
+     "deleted": false}
+
+`sync_reservations` upserts them into `Reservation` in bulk, keyed by `external_id`; a
+record older than the stored `source_modified` neither overwrites nor deletes it. It then
+stores the newest `modified` in `SyncState` once the run is complete, so the next run asks
+only for later changes whatever order the source yields them in. Invalid records are
+skipped. Records of instruments not registered yet are kept in the same `SyncState` and
+tried again in every run. The reservation endpoints read the local table only. The source
+is RESERVATION_SOURCE (a dotted path) instantiated with RESERVATION_SOURCE_OPTIONS.
+"""
+import json
+from datetime import timezone
+from itertools import chain
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+
+from api import resilience
+from api.models import Instrument, Reservation, SyncState
+
+WATERMARK_KEY = "reservations"
+
+# a reservation is only overwritten or deleted by a record at least as new as the stored version
+UPSERT_SQL = """
+INSERT INTO api_reservation AS r
+    (id, created, modified, external_id, instrument_id, name, description, "user", period, source_modified)
+SELECT s.id, now(), now(), s.external_id, s.instrument_id, s.name, s.description, s."user",
+       tstzrange(s.start, s."end"), s.source_modified
+FROM unnest(%(ids)s::uuid[], %(external_ids)s::text[], %(instruments)s::uuid[], %(names)s::text[],
+            %(descriptions)s::text[], %(users)s::text[], %(starts)s::timestamptz[], %(ends)s::timestamptz[],
+            %(source_modified)s::timestamptz[])
+    AS s(id, external_id, instrument_id, name, description, "user", start, "end", source_modified)
+ON CONFLICT (external_id) DO UPDATE SET
+    instrument_id = EXCLUDED.instrument_id,
+    name = EXCLUDED.name,
+    description = EXCLUDED.description,
+    "user" = EXCLUDED."user",
+    period = EXCLUDED.period,
+    source_modified = EXCLUDED.source_modified,
+    modified = EXCLUDED.modified
+WHERE r.source_modified IS NULL OR EXCLUDED.source_modified >= r.source_modified
+"""
+
+DELETE_SQL = """
+DELETE FROM api_reservation r
+USING unnest(%(external_ids)s::text[], %(source_modified)s::timestamptz[]) AS d(external_id, source_modified)
+WHERE r.external_id = d.external_id AND (r.source_modified IS NULL OR d.source_modified >= r.source_modified)
+"""
+
+
+class FileReservationSource:
+    """Records from a JSON file holding a list of them, for tests and local development."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def changes(self, since=None):
+        with open(self.path) as file:
+            records = json.load(file)
+        for record in records:
+            if since is None or parse_timestamp(record["modified"]) >= since:
+                yield record
+
+
+class HttpReservationSource:
+    """
+    Booking system answering `GET <url>?modified_since=<ISO timestamp>` with
+    `{"results": [<record>, ...], "next": <url of the next page or null>}`.
+    """
+
+    def __init__(self, url, token=None):
+        self.url = url
+        self.token = token
+
+    def changes(self, since=None):
+        url = self.url
+        params = {"modified_since": since.isoformat()} if since else {}
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        while url:
+            response = resilience.request("booking", "booking", "GET", url, params=params, headers=headers)
+            response.raise_for_status()
+            page = response.json()
+            yield from page["results"]
+            url, params = page.get("next"), {}
+
+
+def get_source():
+    return import_string(settings.RESERVATION_SOURCE)(**settings.RESERVATION_SOURCE_OPTIONS)
+
+
+def parse_timestamp(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid timestamp '{value}'")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class InstrumentIndex:
+    """Resolves the booking system's (facility abbreviation, instrument name) to instrument ids."""
+
+    def __init__(self):
+        self.by_facility = {}
+        by_name = {}
+        for instrument_id, abbreviation, name in Instrument.objects.values_list("id", "facility__abbreviation", "name"):
+            self.by_facility[(abbreviation, name)] = instrument_id
+            by_name.setdefault(name, []).append(instrument_id)
+        # without a facility only names used by a single instrument are resolved
+        self.by_name = {name: ids[0] for name, ids in by_name.items() if len(ids) == 1}
+
+    def resolve(self, record):
+        if record.get("facility"):
+            return self.by_facility.get((record["facility"], record["instrument"]))
+        return self.by_name.get(record["instrument"])
+
+
+def to_reservation(record, instrument_id) -> Reservation:
+    start, end = parse_timestamp(record["from"]), parse_timestamp(record["to"])
+    if start > end:
+        raise ValueError("Reservation ends before it starts")
+    return Reservation(
+        external_id=str(record["id"]), instrument_id=instrument_id, name=(record.get("name") or "")[:200],
+        description=(record.get("description") or "")[:500], user=(record.get("user") or "")[:200],
+        period=(start, end), source_modified=parse_timestamp(record["modified"]),
+    )
+
+
+def apply_batch(records, instruments: InstrumentIndex, unresolved: dict, deletions: dict = None) -> dict:
+    """
+    Apply the newest version (by `modified`) of every record. A reservation changed later in the
+    booking system than a record is kept by the database, a record older than a deletion seen
+    earlier in the run (`deletions`, id -> `modified`) is ignored. Records of unknown instruments
+    are put to `unresolved` (by id) instead, those applied or deleted are removed from it.
+    """
+    deletions = {} if deletions is None else deletions
+    newest = {}
+    skipped = 0
+    for record in records:
+        try:
+            external_id = str(record["id"])
+            modified = parse_timestamp(record["modified"])
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            print(f"Skipping invalid reservation record {record!r:.200}. {e!r}", flush=True)
+            skipped += 1
+            continue
+        if external_id not in newest or newest[external_id][0] <= modified:
+            newest[external_id] = (modified, record)
+
+    upserts = []
+    deleted = {}
+    for external_id, (modified, record) in newest.items():
+        if deletions.get(external_id, modified) > modified:
+            continue
+        if record.get("deleted"):
+            deleted[external_id] = deletions[external_id] = modified
+            unresolved.pop(external_id, None)
+            continue
+        try:
+            instrument_id = instruments.resolve(record)
+            reservation = to_reservation(record, instrument_id)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            print(f"Skipping invalid reservation record {record!r:.200}. {e!r}", flush=True)
+            skipped += 1
+            continue
+        if instrument_id is None:
+            unresolved[external_id] = record
+            continue
+        unresolved.pop(external_id, None)
+        upserts.append(reservation)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(UPSERT_SQL, {
+            "ids": [reservation.id for reservation in upserts],
+            "external_ids": [reservation.external_id for reservation in upserts],
+            "instruments": [reservation.instrument_id for reservation in upserts],
+            "names": [reservation.name for reservation in upserts],
+            "descriptions": [reservation.description for reservation in upserts],
+            "users": [reservation.user for reservation in upserts],
+            "starts": [reservation.period[0] for reservation in upserts],
+            "ends": [reservation.period[1] for reservation in upserts],
+            "source_modified": [reservation.source_modified for reservation in upserts],
+        })
+        upserted = cursor.rowcount
+        cursor.execute(DELETE_SQL, {"external_ids": list(deleted.keys()), "source_modified": list(deleted.values())})
+        removed = cursor.rowcount
+    return {"upserted": upserted, "deleted": removed, "skipped": skipped}
+
+
+def sync_reservations(source=None, full=False) -> dict:
+    """Import the changes since the last run, or all records with `full=True`."""
+    source = source or get_source()
+    state = SyncState.get(WATERMARK_KEY) or {}
+    since = parse_timestamp(state["modified"]) if state.get("modified") and not full else None
+
+    instruments = InstrumentIndex()
+    totals = {"upserted": 0, "deleted": 0, "skipped": 0}
+    unresolved = {}
+    deletions = {}
+    watermark = since
+    batch = []
+
+    def flush():
+        for key, count in apply_batch(batch, instruments, unresolved, deletions).items():
+            totals[key] += count
+        batch.clear()
+
+    # earlier unresolved records first, newer versions from the source replace them
+    for record in chain(state.get("unresolved", []), source.changes(since)):
+        batch.append(record)
+        try:
+            modified = parse_timestamp(record["modified"])
+        except (KeyError, TypeError, ValueError):
+            pass  # skipped by apply_batch
+        else:
+            watermark = modified if watermark is None else max(watermark, modified)
+        if len(batch) >= settings.RESERVATION_SYNC_BATCH_SIZE:
+            flush()
+    flush()
+
+    # the source does not have to yield records ordered by `modified`, so the newest one is
+    # only safe to resume from once all of them are applied
+    SyncState.put(WATERMARK_KEY, {"modified": watermark.isoformat() if watermark else None,
+                                  "unresolved": list(unresolved.values())})
+    return {**totals, "unresolved": len(unresolved), "watermark": watermark.isoformat() if watermark else None}
@@ -0,0 +1,243 @@
+"""
+Circuit breakers, bulkheads and timeouts shared by all outbound calls to external services.
+
+Every call is made under a `(service, key)` pair, e.g. `("onedata", <provider host>)`,
+`("onezone", <Onezone host>)` or `("datacite", "datacite")`:
+
+- a bulkhead limits the number of concurrent calls per pair, so a slow provider can only
+  occupy a bounded number of workers;
+- a circuit breaker opens after RESILIENCE_FAILURE_THRESHOLD consecutive failures and makes
+  further calls fail fast with `CircuitOpenError` for RESILIENCE_RESET_TIMEOUT seconds, after
+  which a single probe call decides whether it closes again;
+- raw HTTP calls get the per-service timeout from RESILIENCE_TIMEOUTS unless one is given;
+- bulk operations can pace their calls with a `RateLimiter`.
+
+Only connection errors, timeouts and 5xx responses count as failures.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+class CircuitOpenError(ServiceUnavailable):
+    pass
+
+
+class BulkheadFullError(ServiceUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # let exactly one probe call through
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def release_probe(self):
+        """Give up the probe of a half-open breaker that was not made, the next call probes instead."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "last_error": self.last_error,
+                "retry_in": max(0.0, round(self.reset_timeout - (time.monotonic() - self.opened_at), 3))
+                if self.state == self.OPEN else None,
+            }
+
+
+class Bulkhead:
+
+    def __init__(self, name: str, limit: int, wait: float):
+        self.name = name
+        self.limit = limit
+        self.wait = wait
+        self.active = 0
+        self.rejected = 0
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self._semaphore.acquire(timeout=self.wait):
+            with self._lock:
+                self.rejected += 1
+            raise BulkheadFullError(f"Too many concurrent calls to {self.name}")
+        with self._lock:
+            self.active += 1
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._semaphore.release()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"active": self.active, "limit": self.limit, "rejected": self.rejected}
+
+
+class RateLimiter:
+    """Token bucket letting through at most `rate` calls per second, `burst` of them at once."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call may be made."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+_breakers: dict = {}
+_bulkheads: dict = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(service: str, key: str) -> CircuitBreaker:
+    name = f"{service}:{key}"
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, settings.RESILIENCE_FAILURE_THRESHOLD,
+                                             settings.RESILIENCE_RESET_TIMEOUT)
+        return _breakers[name]
+
+
+def get_bulkhead(service: str, key: str) -> Bulkhead:
+    name = f"{service}:{key}"
+    with _registry_lock:
+        if name not in _bulkheads:
+            _bulkheads[name] = Bulkhead(name, settings.RESILIENCE_BULKHEAD_LIMIT, settings.RESILIENCE_BULKHEAD_WAIT)
+        return _bulkheads[name]
+
+
+def reset():
+    """Forget all breakers and bulkheads, e.g. after changing the settings."""
+    with _registry_lock:
+        _breakers.clear()
+        _bulkheads.clear()
+
+
+def is_failure(error: Exception) -> bool:
+    # client errors (e.g. ApiException with a 4xx status) say nothing about the service health
+    status = getattr(error, "status", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status is None or status >= 500
+
+
+@contextmanager
+def guard(service: str, key: str):
+    """Run the enclosed call under the breaker and bulkhead of `(service, key)`."""
+    breaker = get_breaker(service, key)
+    bulkhead = get_bulkhead(service, key)
+    if not breaker.allow():
+        raise CircuitOpenError(f"{breaker.name} is unavailable, failing fast")
+    try:
+        bulkhead.acquire()
+    except BulkheadFullError:
+        # the call never reached the service, a half-open breaker must not wait for its result
+        breaker.release_probe()
+        raise
+    try:
+        yield breaker
+    except Exception as e:
+        if is_failure(e):
+            breaker.record_failure(e)
+        else:
+            breaker.record_success()
+        raise
+    except BaseException:
+        breaker.release_probe()
+        raise
+    finally:
+        bulkhead.release()
+
+
+def request(service: str, key: str, method: str, url: str, session=None, **kwargs) -> requests.Response:
+    """`requests` call guarded by `guard()` with the service's default timeout."""
+    kwargs.setdefault("timeout", settings.RESILIENCE_TIMEOUTS.get(service))
+    with guard(service, key) as breaker:
+        response = (session or requests).request(method, url, **kwargs)
+    if response.status_code >= 500:
+        breaker.record_failure(f"HTTP {response.status_code}")
+    else:
+        breaker.record_success()
+    return response
+
+
+def call(service: str, key: str, func, *args, **kwargs):
+    """Guarded call of a generated API client method, which does its own HTTP."""
+    with guard(service, key) as breaker:
+        result = func(*args, **kwargs)
+    breaker.record_success()
+    return result
+
+
+def resilience_state() -> dict:
+    with _registry_lock:
+        breakers, bulkheads = dict(_breakers), dict(_bulkheads)
+    return {
+        "breakers": {name: breaker.snapshot() for name, breaker in breakers.items()},
+        "bulkheads": {name: bulkhead.snapshot() for name, bulkhead in bulkheads.items()},
+    }
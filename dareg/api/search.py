@@ -0,0 +1,199 @@
+"""
+Maintenance and querying of the denormalized `SearchDocument` table.
+"""
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.contrib.postgres.expressions import ArraySubquery
+from django.contrib.postgres.search import TrigramSimilarity, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import Q, Value, FloatField, UUIDField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Greatest
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from guardian.models import GroupObjectPermission, UserObjectPermission
+
+from api.models import Facility, Project, Dataset, Experiment, Schema, SearchDocument
+
+SEARCHABLE_MODELS = [Facility, Project, Dataset, Experiment, Schema]
+
+DOCUMENT_FIELDS = ["ancestor_ids", "title", "text", "metadata", "scope"]
+
+
+def flatten_metadata(metadata, path=""):
+    flat = {}
+    if not isinstance(metadata, dict):
+        return flat
+    for key, value in metadata.items():
+        full_key = f"{path}.{key}" if path else str(key)
+        if isinstance(value, dict):
+            flat.update(flatten_metadata(value, full_key))
+        else:
+            flat[full_key] = value
+    return flat
+
+
+def ancestor_ids(obj):
+    if isinstance(obj, Experiment):
+        return [obj.dataset.project.facility_id, obj.dataset.project_id, obj.dataset_id]
+    if isinstance(obj, Dataset):
+        return [obj.project.facility_id, obj.project_id]
+    if isinstance(obj, Project):
+        return [obj.facility_id]
+    return []
+
+
+def build_document(obj):
+    """Return an unsaved `SearchDocument` for a searchable model instance."""
+    fields = getattr(obj, "trigram_search_fields", [])
+    metadata = flatten_metadata(getattr(obj, "metadata", None))
+    parts = [str(getattr(obj, field) or "") for field in fields if field != "name"]
+    parts += [str(value) for value in metadata.values() if value not in (None, "")]
+
+    return SearchDocument(
+        model=obj.__class__.__name__,
+        object_id=obj.pk,
+        ancestor_ids=ancestor_ids(obj),
+        title=(getattr(obj, "name", None) or str(obj))[:200],
+        text=" ".join(part for part in parts if part),
+        metadata=metadata,
+        scope=SearchDocument.SCOPE_MODEL if isinstance(obj, Schema) else SearchDocument.SCOPE_OBJECT,
+    )
+
+
+def index_objects(objs):
+    documents = [build_document(obj) for obj in objs]
+    SearchDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=["model", "object_id"],
+        update_fields=DOCUMENT_FIELDS + ["modified"],
+    )
+    return len(documents)
+
+
+def indexable_queryset(model_class):
+    if model_class is Experiment:
+        return Experiment.objects.select_related("dataset__project")
+    if model_class is Dataset:
+        return Dataset.objects.select_related("project")
+    return model_class.objects.all()
+
+
+PARENT_FIELDS = {Project: "facility_id", Dataset: "project_id"}
+
+
+@receiver(post_init, sender=Project)
+@receiver(post_init, sender=Dataset)
+def remember_parent(sender, instance, **kwargs):
+    # read from __dict__, the parent may be deferred
+    instance._indexed_parent = instance.__dict__.get(PARENT_FIELDS[sender])
+
+
+@receiver(post_save)
+def update_search_document(sender, instance, created, raw=False, **kwargs):
+    if raw or sender not in SEARCHABLE_MODELS:
+        return
+    index_objects([instance])
+
+    # ancestors of descendants change when an object is moved to another parent
+    if sender in PARENT_FIELDS:
+        parent = getattr(instance, PARENT_FIELDS[sender])
+        if not created and parent != getattr(instance, "_indexed_parent", parent):
+            move_descendants(instance)
+        instance._indexed_parent = parent
+
+
+def move_descendants(instance):
+    """Rewrite the ancestors of the documents below a moved project or dataset, set-based."""
+    if isinstance(instance, Project):
+        # documents of datasets and experiments both continue with the project at index 2
+        SearchDocument.objects.filter(model__in=["Dataset", "Experiment"], ancestor_ids__contains=[instance.pk]) \
+            .update(ancestor_ids=RawSQL("ARRAY[%s]::uuid[] || ancestor_ids[2:]", [instance.facility_id],
+                                        output_field=SearchDocument._meta.get_field("ancestor_ids")))
+    else:
+        SearchDocument.objects.filter(model="Experiment", ancestor_ids__contains=[instance.pk]) \
+            .update(ancestor_ids=[instance.project.facility_id, instance.project_id, instance.pk])
+
+
+@receiver(post_delete)
+def delete_search_document(sender, instance, **kwargs):
+    if sender not in SEARCHABLE_MODELS:
+        return
+    SearchDocument.objects.filter(model=sender.__name__, object_id=instance.pk).delete()
+
+
+def global_view_models(user):
+    """Names of the searchable models the user can view as a whole through a model-level `view_*` permission."""
+    codenames = {f"view_{model._meta.model_name}": model.__name__ for model in SEARCHABLE_MODELS}
+    granted = Permission.objects.filter(
+        Q(user=user) | Q(group__user=user), content_type__app_label="api", codename__in=codenames,
+    ).values_list("codename", flat=True)
+    return {codenames[codename] for codename in granted}
+
+
+def object_view_permissions(user, object_ids=None):
+    """
+    Subqueries of the ids of the objects the user can view, directly and through one of their groups.
+    They are evaluated by the database as part of the outer query.
+    """
+    filters = {
+        "permission__codename__startswith": "view_",
+        "content_type__app_label": "api",
+        "content_type__model__in": [model._meta.model_name for model in SEARCHABLE_MODELS],
+    }
+    if object_ids is not None:
+        filters["object_pk__in"] = [str(pk) for pk in object_ids]
+    return [
+        perms.filter(**filters).annotate(object_uuid=Cast("object_pk", UUIDField())).values("object_uuid")
+        for perms in (UserObjectPermission.objects.filter(user=user),
+                      GroupObjectPermission.objects.filter(group__user=user))
+    ]
+
+
+def visible_documents(user):
+    """Filter of the documents the user can view: objects or ancestors with a view permission, or a whole model."""
+    scope = Q(model__in=global_view_models(user))
+    for perms in object_view_permissions(user):
+        scope |= Q(scope=SearchDocument.SCOPE_OBJECT) & (
+            Q(object_id__in=perms) | Q(ancestor_ids__overlap=ArraySubquery(perms))
+        )
+    return scope
+
+
+def visible_among(user, object_ids):
+    """The given object ids the user can view through an object permission."""
+    return {row["object_uuid"] for perms in object_view_permissions(user, object_ids) for row in perms}
+
+
+def search_documents(user, query, model=None):
+    """
+    Single indexed trigram query over all search documents the user can see, ranked globally.
+    """
+    qs = SearchDocument.objects.all()
+    if model:
+        qs = qs.filter(model=model)
+
+    if not user.is_superuser:
+        qs = qs.filter(visible_documents(user))
+
+    return (
+        qs.filter(Q(title__trigram_similar=query) | Q(text__trigram_word_similar=query))
+        .annotate(similarity=Greatest(
+            TrigramSimilarity("title", Value(query)),
+            TrigramWordSimilarity(Value(query), "text"),
+            output_field=FloatField(),
+        ))
+        .order_by("-similarity", "title")
+    )
+
+
+def set_similarity_thresholds():
+    """
+    Align the index-backed `%` and `%>` operators with the threshold of the per-model search.
+    Must be called inside a transaction.
+    """
+    threshold = settings.SEARCH_SIMILARITY_THRESHOLD
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)", [str(threshold)])
+        cursor.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)", [str(threshold)])
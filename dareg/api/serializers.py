@@ -4,7 +4,7 @@ from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 
 from .models import Facility, Project, Dataset, Schema, BaseModel, PermsGroup, UserProfile, Instrument, Experiment, \
-    ExperimentStatus
+    ExperimentStatus, Reservation
 
 
 class UserSerializerMinimal(serializers.ModelSerializer):
@@ -162,7 +162,8 @@ class ExperimentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Experiment
         fields = "__all__"
-        read_only_fields = ["id", "created_by", "modified_by"]
+        read_only_fields = ["id", "created_by", "modified_by", "size", "file_count", "last_modified", "stats_synced",
+                            "last_activity"]
 
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
@@ -170,6 +171,17 @@ class ExperimentSerializer(serializers.ModelSerializer):
         return Experiment.objects.create(**validated_data)
 
 
+class ExperimentBatchItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Experiment
+        fields = ["name", "start_time", "end_time", "note", "status"]
+
+
+class ExperimentBatchSerializer(serializers.Serializer):
+    dataset = serializers.PrimaryKeyRelatedField(queryset=Dataset.objects.select_related("project__facility"))
+    experiments = ExperimentBatchItemSerializer(many=True, allow_empty=False, max_length=100)
+
+
 class DatasetResponseSerializer(BaseModelSerializer, serializers.ModelSerializer, PermsModelSerializer):
     project = BaseModelSerializer(read_only=True)
     experiments = SerializerMethodField()
@@ -195,7 +207,8 @@ class DatasetSerializer(serializers.ModelSerializer):
     class Meta:
         model = Dataset
         fields = "__all__"
-        read_only_fields = ["id", "created_by", "modified_by"]
+        read_only_fields = ["id", "created_by", "modified_by", "provisioning_status", "provisioning_steps", "size",
+                            "file_count", "last_modified", "stats_synced"]
 
     def to_representation(self, data):
         return DatasetResponseSerializer(context=self.context).to_representation(data)
@@ -206,20 +219,21 @@ class DatasetSerializer(serializers.ModelSerializer):
         return Dataset.objects.create(**validated_data)
 
 
-class ReservationSerializer(serializers.Serializer):
-    id = serializers.CharField()
-    name = serializers.CharField()
-    from_date = serializers.DateTimeField()
-    to_date = serializers.DateTimeField()
-    user = serializers.CharField()
-    description = serializers.CharField()
-    project_id = serializers.CharField()
-    dataset_status = SerializerMethodField()
+class ReservationSerializer(serializers.ModelSerializer):
+    from_date = serializers.DateTimeField(source="period.lower")
+    to_date = serializers.DateTimeField(source="period.upper")
+    project_id = SerializerMethodField()
+    # annotated by the views from the dataset with a matching `reservationId`
+    dataset_status = serializers.CharField(allow_null=True, read_only=True)
+
+    class Meta:
+        model = Reservation
+        fields = ["id", "name", "from_date", "to_date", "user", "description", "project_id", "dataset_status"]
 
     @extend_schema_field(serializers.CharField(allow_null=True))
-    def get_dataset_status(self, obj):
-        dataset = Dataset.objects.filter(reservationId=obj["id"]).first()
-        return dataset.status if dataset else None
+    def get_project_id(self, obj):
+        project_id = obj.project_id or self.context.get("default_project_id")
+        return str(project_id) if project_id else None
 
 class InstrumentSerializer(serializers.ModelSerializer):
     facility = FacilitySerializerMinimal(read_only=True)
@@ -0,0 +1,264 @@
+"""
+Instrument telemetry: batched samples (bytes transferred, file count, temperature, ...)
+of an experiment, stored append-only and downsampled on ingestion.
+
+A batch is columnar, the sample times in epoch seconds and one array of values per metric,
+`null` where a metric has no sample:
+
+    {"experiment": "<uuid>", "time": [1700000000.0, 1700000001.0],
+     "metrics": {"bytes_transferred": [1024, 4096], "temperature": [21.5, null]}}
+
+Each metric of a batch is one `TelemetryBatch` row with the times and values packed in
+arrays, in a table partitioned by month, so a batch costs a few rows whatever its size and
+expired raw samples are dropped with their partition (`manage.py maintain_telemetry`).
+The same transaction folds the samples into `TelemetryRollup` buckets of each of
+RESOLUTIONS with a single upsert. Timelines are served from the raw samples for short
+spans and otherwise from the finest rollup giving at most TELEMETRY_MAX_POINTS buckets.
+"""
+import math
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Max, Min, Sum
+
+from api.models import TelemetryBatch, TelemetryRollup
+
+# rollup bucket sizes in seconds
+RESOLUTIONS = (60, 3600, 86400)
+RAW = 0
+
+METRIC_NAME = re.compile(r"^[a-z][a-z0-9_]{0,49}$")
+# earliest accepted sample time, 2000-01-01
+MIN_TIME = 946684800
+
+ROLLUP_COLUMNS = ["time", "count", "mean", "min", "max", "last"]
+RAW_COLUMNS = ["time", "value"]
+
+ROLLUP_SQL = """
+INSERT INTO api_telemetryrollup AS r
+    (experiment_id, instrument_id, metric, resolution, bucket, count, total, minimum, maximum, last, last_time)
+SELECT %(experiment)s::uuid, %(instrument)s::uuid, s.metric, res.resolution,
+       to_timestamp(floor(s.t / res.resolution) * res.resolution) AS bucket,
+       count(*), sum(s.v), min(s.v), max(s.v), (array_agg(s.v ORDER BY s.t DESC))[1], to_timestamp(max(s.t))
+FROM unnest(%(metrics)s::text[], %(times)s::float8[], %(values)s::float8[]) AS s(metric, t, v)
+CROSS JOIN unnest(%(resolutions)s::int[]) AS res(resolution)
+GROUP BY s.metric, res.resolution, bucket
+ON CONFLICT (experiment_id, metric, resolution, bucket) DO UPDATE SET
+    instrument_id = COALESCE(EXCLUDED.instrument_id, r.instrument_id),
+    count = r.count + EXCLUDED.count,
+    total = r.total + EXCLUDED.total,
+    minimum = LEAST(r.minimum, EXCLUDED.minimum),
+    maximum = GREATEST(r.maximum, EXCLUDED.maximum),
+    last = CASE WHEN EXCLUDED.last_time >= r.last_time THEN EXCLUDED.last ELSE r.last END,
+    last_time = GREATEST(r.last_time, EXCLUDED.last_time)
+"""
+
+RAW_SQL = """
+SELECT b.metric, s.t, s.v
+FROM api_telemetrybatch b, unnest(b.times, b."values") AS s(t, v)
+WHERE b.experiment_id = %(experiment)s AND b.metric = ANY(%(metrics)s)
+    AND b.start >= %(earliest)s AND b.start <= %(end)s AND b."end" >= %(start)s
+    AND s.t >= %(from)s AND s.t <= %(to)s
+ORDER BY s.t
+LIMIT %(limit)s
+"""
+
+
+def from_epoch(value: float) -> datetime:
+    return datetime.fromtimestamp(value, tz=timezone.utc)
+
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def parse_samples(data) -> tuple[list, dict]:
+    """Validate a batch, return its times and metrics or raise ValueError."""
+    times = data.get("time")
+    metrics = data.get("metrics")
+    if not isinstance(times, list) or not times:
+        raise ValueError("'time' must be a non-empty list of epoch seconds")
+    if len(times) > settings.TELEMETRY_MAX_SAMPLES:
+        raise ValueError(f"At most {settings.TELEMETRY_MAX_SAMPLES} samples are accepted per batch")
+    if not all(is_number(value) for value in times):
+        raise ValueError("'time' must only contain numbers")
+    # also rejects epoch milliseconds, which would overflow datetime
+    if min(times) < MIN_TIME or max(times) > time.time() + settings.TELEMETRY_MAX_CLOCK_SKEW:
+        raise ValueError(f"'time' must be epoch seconds from {from_epoch(MIN_TIME).isoformat()} to "
+                         f"{settings.TELEMETRY_MAX_CLOCK_SKEW} seconds from now")
+    if max(times) - min(times) > settings.TELEMETRY_MAX_BATCH_SPAN:
+        raise ValueError(f"A batch may span at most {settings.TELEMETRY_MAX_BATCH_SPAN} seconds")
+    if not isinstance(metrics, dict) or not metrics:
+        raise ValueError("'metrics' must map metric names to lists of values")
+    for name, values in metrics.items():
+        if not METRIC_NAME.match(name):
+            raise ValueError(f"Invalid metric name '{name}'")
+        if not isinstance(values, list) or len(values) != len(times):
+            raise ValueError(f"'{name}' must have one value per sample time")
+        if not all(value is None or is_number(value) for value in values):
+            raise ValueError(f"'{name}' must only contain numbers or null")
+    return times, metrics
+
+
+def ingest(experiment, times, metrics, instrument=None) -> int:
+    """Store a validated batch and update the rollups, return the number of samples stored."""
+    order = sorted(range(len(times)), key=times.__getitem__)
+    batches = []
+    for name, values in metrics.items():
+        samples = [(times[i], values[i]) for i in order if values[i] is not None]
+        if not samples:
+            continue
+        sample_times, sample_values = (list(column) for column in zip(*samples))
+        batches.append(TelemetryBatch(experiment=experiment, instrument=instrument, metric=name,
+                                      start=from_epoch(sample_times[0]), end=from_epoch(sample_times[-1]),
+                                      times=sample_times, values=sample_values))
+    if not batches:
+        return 0
+
+    with transaction.atomic():
+        TelemetryBatch.objects.bulk_create(batches)
+        with connection.cursor() as cursor:
+            cursor.execute(ROLLUP_SQL, {
+                "experiment": experiment.pk,
+                "instrument": instrument.pk if instrument else None,
+                "metrics": [batch.metric for batch in batches for _ in batch.times],
+                "times": [t for batch in batches for t in batch.times],
+                "values": [v for batch in batches for v in batch.values],
+                "resolutions": list(RESOLUTIONS),
+            })
+    return sum(len(batch.times) for batch in batches)
+
+
+def pick_resolution(start: datetime, end: datetime, raw: bool = True) -> int:
+    """Raw samples for short spans, otherwise the finest rollup within TELEMETRY_MAX_POINTS buckets."""
+    span = (end - start).total_seconds()
+    if raw and span <= settings.TELEMETRY_RAW_SPAN:
+        return RAW
+    for resolution in RESOLUTIONS:
+        if span / resolution <= settings.TELEMETRY_MAX_POINTS:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def raw_series(experiment, metrics, start: datetime, end: datetime) -> dict:
+    # batches span at most TELEMETRY_MAX_BATCH_SPAN, which bounds `start` for partition pruning
+    with connection.cursor() as cursor:
+        cursor.execute(RAW_SQL, {
+            "experiment": experiment.pk, "metrics": metrics,
+            "earliest": start - timedelta(seconds=settings.TELEMETRY_MAX_BATCH_SPAN),
+            "start": start, "end": end, "from": start.timestamp(), "to": end.timestamp(),
+            "limit": settings.TELEMETRY_MAX_SAMPLES * len(metrics),
+        })
+        rows = cursor.fetchall()
+    series = {metric: [] for metric in metrics}
+    for metric, t, v in rows:
+        series[metric].append([t, v])
+    return series
+
+
+def rollup_series(rollups, metrics, resolution: int, start: datetime, end: datetime, combine=False) -> dict:
+    """Buckets of `rollups`, summed over experiments with `combine=True` (their `last` is then None)."""
+    first_bucket = from_epoch(math.floor(start.timestamp() / resolution) * resolution)
+    rollups = rollups.filter(metric__in=metrics, resolution=resolution, bucket__gte=first_bucket, bucket__lte=end)
+    if combine:
+        rows = rollups.values("metric", "bucket") \
+            .annotate(n=Sum("count"), summed=Sum("total"), lowest=Min("minimum"), highest=Max("maximum")) \
+            .order_by("bucket") \
+            .values_list("metric", "bucket", "n", "summed", "lowest", "highest")
+        rows = [(*row, None) for row in rows]
+    else:
+        rows = rollups.order_by("bucket") \
+            .values_list("metric", "bucket", "count", "total", "minimum", "maximum", "last")
+    series = {metric: [] for metric in metrics}
+    for metric, bucket, count, total, minimum, maximum, last in rows:
+        series[metric].append([bucket.timestamp(), count, total / count, minimum, maximum, last])
+    return series
+
+
+def metric_names(rollups) -> list:
+    return sorted(rollups.filter(resolution=RESOLUTIONS[-1]).values_list("metric", flat=True).distinct())
+
+
+def timeline(metrics, start: datetime, end: datetime, experiment=None, instrument=None, resolution=None) -> dict:
+    """
+    Series of `metrics` (all of the experiment or instrument if empty) between `start` and
+    `end`. Instrument timelines combine all its experiments and are served from rollups only.
+    """
+    if start > end:
+        raise ValueError("date_from must not be after date_to")
+    if resolution is None:
+        resolution = pick_resolution(start, end, raw=experiment is not None)
+    elif resolution not in (RAW, *RESOLUTIONS) or (resolution == RAW and experiment is None):
+        raise ValueError(f"Resolution must be one of {', '.join(map(str, RESOLUTIONS))}"
+                         f"{'' if experiment is None else ' or 0 for raw samples'}")
+    elif resolution != RAW and resolution < pick_resolution(start, end, raw=False):
+        # raw samples are limited by TELEMETRY_MAX_SAMPLES instead
+        raise ValueError(f"Resolution {resolution} gives more than {settings.TELEMETRY_MAX_POINTS} points for this "
+                         f"time span, use at least {pick_resolution(start, end, raw=False)}")
+    rollups = TelemetryRollup.objects.filter(experiment=experiment) if experiment \
+        else TelemetryRollup.objects.filter(instrument=instrument)
+    metrics = metrics or metric_names(rollups)
+    if resolution == RAW:
+        return {"resolution": RAW, "columns": RAW_COLUMNS, "series": raw_series(experiment, metrics, start, end)}
+    return {"resolution": resolution, "columns": ROLLUP_COLUMNS,
+            "series": rollup_series(rollups, metrics, resolution, start, end, combine=experiment is None)}
+
+
+def month_start(value: datetime, months: int = 0) -> datetime:
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"api_telemetrybatch_y{month.year:04d}m{month.month:02d}"
+
+
+def ensure_partitions(months_ahead: int) -> list:
+    """Create the monthly partitions of this and the next `months_ahead` months, return the new ones."""
+    now = datetime.now(timezone.utc)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                       "WHERE i.inhparent = 'api_telemetrybatch'::regclass")
+        existing = {name for name, in cursor.fetchall()}
+        created = []
+        for offset in range(months_ahead + 1):
+            month = month_start(now, offset)
+            name = partition_name(month)
+            if name in existing:
+                continue
+            try:
+                cursor.execute(f"CREATE TABLE {connection.ops.quote_name(name)} PARTITION OF api_telemetrybatch "
+                               f"FOR VALUES FROM ('{month.isoformat()}') TO ('{month_start(month, 1).isoformat()}')")
+            except DatabaseError as e:
+                # the default partition already holds samples of the month
+                print(f"Cannot create telemetry partition {name}. {e}", flush=True)
+                continue
+            created.append(name)
+    return created
+
+
+def drop_expired_partitions(retention_days: int) -> list:
+    """
+    Drop the monthly partitions whose samples are all older than `retention_days` and
+    delete such samples from the default partition, return the dropped partitions.
+    The rollups are kept.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    dropped = []
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                       "WHERE i.inhparent = 'api_telemetrybatch'::regclass")
+        for name, in cursor.fetchall():
+            match = re.fullmatch(r"api_telemetrybatch_y(\d{4})m(\d{2})", name)
+            if match is None:
+                continue
+            month = datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)
+            # a batch starting in the month may end up to TELEMETRY_MAX_BATCH_SPAN later
+            if month_start(month, 1) + timedelta(seconds=settings.TELEMETRY_MAX_BATCH_SPAN) <= cutoff:
+                cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
+                dropped.append(name)
+        cursor.execute('DELETE FROM api_telemetrybatch_default WHERE "end" < %s', [cutoff])
+    return dropped
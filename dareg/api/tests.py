@@ -1,9 +1,26 @@
+import asyncio
+import csv
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth.models import User
 from knox.models import AuthToken
 from django.utils.timezone import now, timedelta
-from api.models import Facility, Project, Dataset, Experiment, Instrument
+from api import events, resilience, telemetry
+from api.jobs import claim_jobs, enqueue, requeue_stale_jobs, run_pending_jobs
+from api.reservation_sync import FileReservationSource, sync_reservations, WATERMARK_KEY
+from api.models import Facility, Project, Dataset, Experiment, Instrument, SearchDocument, Job, JobStatus, \
+    ProvisioningStatus, Reservation, SyncState, PermsGroup, TelemetryBatch, TelemetryRollup
+from api.views.query import GeneralSearchViewSet, parse_query_block, regex_patterns
+from onedata_api.provisioning import enqueue_batch
 from unittest.mock import patch, MagicMock
 from uuid import uuid4
 
@@ -14,18 +31,19 @@ class ReservationListViewTest(APITestCase):
         self.token = AuthToken.objects.create(self.user)[1]
         self.auth_header = f"Token {self.token}"
 
-        self.instrument_mock = MagicMock()
-        self.facility_mock = MagicMock()
-        self.project_mock = MagicMock()
-        self.project_mock.id = "11111111-1111-1111-1111-111111111111"
-
-        self.facility_mock.project_set.first.return_value = self.project_mock
-        self.instrument_mock.facility = self.facility_mock
-
-        patcher = patch("django.contrib.auth.models.User.instrument", new_callable=MagicMock)
-        self.addCleanup(patcher.stop)
-        self.instrument_attr = patcher.start()
-        self.instrument_attr.__get__ = lambda *args, **kwargs: self.instrument_mock
+        self.facility = Facility.objects.create(name="Test Facility", created_by=self.user)
+        self.project = Project.objects.create(name="Test Project", facility=self.facility, description="desc",
+                                              created_by=self.user)
+        self.instrument = Instrument.objects.create(name="Test Instrument", facility=self.facility, user=self.user,
+                                                    created_by=self.user)
+        self.past, self.current, self.future = [
+            Reservation.objects.create(instrument=self.instrument, name=name, user="Test User",
+                                       description="This is a test reservation",
+                                       period=(now() + timedelta(hours=start), now() + timedelta(hours=end)))
+            for name, start, end in [("Reservation 1", -5, -3), ("Reservation 2", -1, 1), ("Reservation 3", 3, 5)]
+        ]
+        self.dataset = Dataset.objects.create(name="Test Dataset", project=self.project, description="desc",
+                                              created_by=self.user, reservationId=str(self.current.id))
 
     def test_get_reservations_in_range(self):
         date_from = (now() - timedelta(hours=4)).isoformat()
@@ -42,12 +60,27 @@ class ReservationListViewTest(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIsInstance(response.data, list)
+        self.assertEqual([reservation["id"] for reservation in response.data],
+                         [str(self.past.id), str(self.current.id)])
 
         for reservation in response.data:
             from_date = reservation["from_date"]
             to_date = reservation["to_date"]
             self.assertLessEqual(from_date, date_to)
             self.assertGreaterEqual(to_date, date_from)
+            self.assertEqual(reservation["project_id"], str(self.project.id))
+
+        self.assertIsNone(response.data[0]["dataset_status"])
+        self.assertEqual(response.data[1]["dataset_status"], self.dataset.status)
+
+    def test_get_reservation_detail(self):
+        response = self.client.get(f"/api/v1/reservation/{self.current.id}/", HTTP_AUTHORIZATION=self.auth_header)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["name"], "Reservation 2")
+        self.assertEqual(response.data["dataset_status"], self.dataset.status)
+
+        response = self.client.get(f"/api/v1/reservation/{uuid4()}/", HTTP_AUTHORIZATION=self.auth_header)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_get_with_invalid_dates(self):
         response = self.client.get(
@@ -66,6 +99,114 @@ class ReservationListViewTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+class ReservationSyncTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.facility = Facility.objects.create(name="Test Facility", abbreviation="TF", created_by=self.user)
+        self.instrument = Instrument.objects.create(name="Krios", facility=self.facility, user=self.user,
+                                                    created_by=self.user)
+        self.file = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+        self.addCleanup(self.file.close)
+        self.source = FileReservationSource(self.file.name)
+
+    def write(self, records):
+        self.file.seek(0)
+        self.file.truncate()
+        json.dump(records, self.file)
+        self.file.flush()
+
+    @staticmethod
+    def record(id, modified, **fields):
+        return {"id": id, "facility": "TF", "instrument": "Krios", "name": f"Reservation {id}", "user": "Test User",
+                "from": "2025-01-01T08:00:00+00:00", "to": "2025-01-01T12:00:00+00:00", "modified": modified,
+                **fields}
+
+    def test_incremental_sync(self):
+        self.write([
+            self.record(1, "2025-01-01T00:00:00+00:00"),
+            self.record(2, "2025-01-02T00:00:00+00:00"),
+            self.record(3, "2025-01-02T00:00:00+00:00", instrument="Unknown"),
+        ])
+        result = sync_reservations(self.source)
+        self.assertEqual((result["upserted"], result["unresolved"]), (2, 1))
+        self.assertEqual(SyncState.get(WATERMARK_KEY)["modified"], "2025-01-02T00:00:00+00:00")
+
+        # only records modified since the watermark are applied
+        self.write([
+            self.record(1, "2025-01-01T00:00:00+00:00", name="Stale"),
+            self.record(2, "2025-01-03T00:00:00+00:00", to="2025-01-01T14:00:00+00:00"),
+            self.record(4, "2025-01-03T00:00:00+00:00", deleted=True),
+            {"id": 1, "modified": "2025-01-04T00:00:00+00:00", "deleted": True},
+        ])
+        result = sync_reservations(self.source)
+        self.assertEqual((result["upserted"], result["deleted"]), (1, 1))
+
+        reservations = list(Reservation.objects.filter(instrument=self.instrument))
+        self.assertEqual([reservation.external_id for reservation in reservations], ["2"])
+        self.assertEqual(reservations[0].period.upper.hour, 14)
+        self.assertEqual(SyncState.get(WATERMARK_KEY)["modified"], "2025-01-04T00:00:00+00:00")
+
+    def test_invalid_records_are_skipped(self):
+        self.write([
+            self.record(1, "2025-01-01T00:00:00+00:00", **{"from": "2025-01-01T13:00:00+00:00"}),
+            self.record(2, "not a timestamp"),
+            self.record(3, "2025-01-01T00:00:00+00:00", to="2025-02-30T00:00:00+00:00"),
+            {"id": 4, "modified": "2025-01-01T00:00:00+00:00"},
+            self.record(5, "2025-01-02T00:00:00+00:00"),
+        ])
+        result = sync_reservations(self.source)
+        self.assertEqual((result["upserted"], result["skipped"]), (1, 4))
+        self.assertEqual(list(Reservation.objects.values_list("external_id", flat=True)), ["5"])
+        self.assertEqual(result["watermark"], "2025-01-02T00:00:00+00:00")
+
+    def test_unknown_instrument_is_applied_later(self):
+        self.write([self.record(1, "2025-01-01T00:00:00+00:00", instrument="Glacios"),
+                    self.record(2, "2025-01-02T00:00:00+00:00")])
+        sync_reservations(self.source)
+        self.assertFalse(Reservation.objects.filter(external_id="1").exists())
+
+        # the watermark moved past the record, it is applied from the stored unresolved records
+        self.write([])
+        Instrument.objects.create(name="Glacios", facility=self.facility, user=self.user, created_by=self.user)
+        result = sync_reservations(self.source)
+        self.assertEqual((result["upserted"], result["unresolved"]), (1, 0))
+        self.assertEqual(Reservation.objects.get(external_id="1").instrument.name, "Glacios")
+        self.assertEqual(SyncState.get(WATERMARK_KEY)["unresolved"], [])
+
+    def test_newest_version_wins(self):
+        self.write([
+            self.record(1, "2025-01-03T00:00:00+00:00", name="New"),
+            self.record(1, "2025-01-02T00:00:00+00:00", name="Old"),
+            self.record(2, "2025-01-03T00:00:00+00:00"),
+            {"id": 2, "modified": "2025-01-02T00:00:00+00:00", "deleted": True},
+        ])
+        sync_reservations(self.source)
+        self.assertEqual(Reservation.objects.get(external_id="1").name, "New")
+        self.assertTrue(Reservation.objects.filter(external_id="2").exists())
+
+        # a full import yielding older versions changes nothing
+        self.write([self.record(1, "2025-01-01T00:00:00+00:00", name="Older"),
+                    {"id": 2, "modified": "2025-01-01T00:00:00+00:00", "deleted": True}])
+        result = sync_reservations(self.source, full=True)
+        self.assertEqual((result["upserted"], result["deleted"]), (0, 0))
+        self.assertEqual(Reservation.objects.get(external_id="1").name, "New")
+        self.assertTrue(Reservation.objects.filter(external_id="2").exists())
+
+    @override_settings(RESERVATION_SYNC_BATCH_SIZE=1)
+    def test_deletion_wins_over_older_records_of_later_batches(self):
+        self.write([{"id": 1, "modified": "2025-01-02T00:00:00+00:00", "deleted": True},
+                    self.record(1, "2025-01-01T00:00:00+00:00")])
+        sync_reservations(self.source)
+        self.assertFalse(Reservation.objects.filter(external_id="1").exists())
+
+    @override_settings(RESERVATION_SYNC_BATCH_SIZE=1)
+    def test_unordered_source(self):
+        self.write([self.record(2, "2025-01-03T00:00:00+00:00"), self.record(1, "2025-01-01T00:00:00+00:00")])
+        sync_reservations(self.source)
+        self.assertEqual(SyncState.get(WATERMARK_KEY)["modified"], "2025-01-03T00:00:00+00:00")
+        self.assertEqual(Reservation.objects.count(), 2)
+
+
 class TempTokenAPIViewTest(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="testuser", password="testpass")
@@ -202,7 +343,7 @@ class ExperimentViewSetTests(APITestCase):
         self.project = Project.objects.create(name="Test Project", facility=self.facility, description="desc",
                                               created_by=self.user)
         self.dataset = Dataset.objects.create(name="Test Dataset", project=self.project, description="desc",
-                                              created_by=self.user)
+                                              created_by=self.user, onedata_file_id="dataset-dir")
 
         self.url = f"/api/v1/experiments/"
 
@@ -249,14 +390,86 @@ class ExperimentViewSetTests(APITestCase):
         # Expecting a bad request response due to error during folder creation
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-    @patch('api.views.rename_entry')  # Mocking the folder renaming
-    def test_update_experiment(self, mock_rename_entry):
+    @patch('api.views.views.create_new_experiment')
+    def test_create_experiment_in_provisioned_dataset_only(self, mock_create_new_experiment):
+        Dataset.objects.filter(id=self.dataset.id).update(onedata_file_id=None)
+
+        response = self.client.post(self.url, {'dataset': self.dataset.id, 'name': 'Experiment', 'status': 'new'},
+                                    format='json', HTTP_AUTHORIZATION=self.auth_header)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        data = {'dataset': self.dataset.id, 'experiments': [{'name': 'Acquisition 0'}]}
+        response = self.client.post(f"{self.url}batch/", data, format='json', HTTP_AUTHORIZATION=self.auth_header)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        mock_create_new_experiment.assert_not_called()
+        self.assertFalse(Experiment.objects.exists())
+
+    @patch('api.views.views.publish')
+    @patch('api.views.views.create_new_experiment')
+    def test_create_experiment_batch(self, mock_create_new_experiment, mock_publish):
+        mock_create_new_experiment.side_effect = lambda dataset, name: (MagicMock(file_id=f"file-{name}"), None)
+        data = {
+            'dataset': self.dataset.id,
+            'experiments': [{'name': f'Acquisition {i}'} for i in range(3)],
+        }
+
+        response = self.client.post(f"{self.url}batch/", data, format='json', HTTP_AUTHORIZATION=self.auth_header)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([experiment['name'] for experiment in response.data], ['Acquisition 0', 'Acquisition 1',
+                                                                              'Acquisition 2'])
+        self.assertEqual(len({experiment['onedata_file_id'] for experiment in response.data}), 3)
+        experiment = Experiment.objects.get(id=response.data[0]['id'])
+        self.assertTrue(experiment.perm_atleast(MagicMock(user=self.user), PermsGroup.OWNER))
+        self.assertTrue(SearchDocument.objects.filter(model="Experiment", object_id=experiment.id).exists())
+        # bulk_create() sends no post_save, the status events are published by the view
+        (events,), = mock_publish.call_args.args
+        self.assertEqual([event["id"] for event in events], [experiment['id'] for experiment in response.data])
+        self.assertEqual(events[0]["ancestors"], [str(self.facility.id), str(self.project.id), str(self.dataset.id)])
+
+    @patch('api.views.views.remove_entries', return_value={})
+    @patch('api.views.views.create_new_experiment')
+    def test_create_experiment_batch_directory_error(self, mock_create_new_experiment, mock_remove_entries):
+        mock_create_new_experiment.side_effect = [(MagicMock(file_id="file"), None), (None, {"error": "failed"})]
+        data = {
+            'dataset': self.dataset.id,
+            'experiments': [{'name': 'Acquisition 0'}, {'name': 'Acquisition 1'}],
+        }
+
+        response = self.client.post(f"{self.url}batch/", data, format='json', HTTP_AUTHORIZATION=self.auth_header)
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertEqual(list(response.data['errors'].values()), ['failed'])
+        self.assertFalse(Experiment.objects.exists())
+        # the directory created for the other experiment is removed
+        self.assertEqual(mock_remove_entries.call_args.args[1], ["file"])
+
+    @patch('api.events.publish')
+    def test_experiment_status_change_published(self, mock_publish):
+        experiment = Experiment.objects.create(dataset=self.dataset, name="Experiment", status="new",
+                                               created_by=self.user)
+        mock_publish.reset_mock()
+
+        experiment.note = "note"
+        experiment.save()
+        mock_publish.assert_not_called()
+
+        experiment = Experiment.objects.get(id=experiment.id)
+        experiment.status = "running"
+        experiment.save()
+        (event,), = mock_publish.call_args.args
+        self.assertEqual((event["id"], event["status"], event["previous"]), (str(experiment.id), "running", "new"))
+        self.assertEqual(event["ancestors"], [str(self.facility.id), str(self.project.id), str(self.dataset.id)])
+
+    def test_update_experiment(self):
         # Prepare initial data
         experiment = Experiment.objects.create(
             dataset=self.dataset,
             name="Old Experiment",
             status="new",
             created_by=self.user,
+            onedata_file_id="experiment-file-id",
         )
 
         # Prepare updated data
@@ -273,9 +486,9 @@ class ExperimentViewSetTests(APITestCase):
         # Ensure the request was successful
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-        # Ensure that rename_entry was called due to name change
-        mock_rename_entry.assert_called_once_with(experiment.dataset.project, experiment.onedata_file_id,
-                                                  'Updated Experiment')
+        # Ensure that the folder renaming was scheduled due to name change
+        job = Job.objects.get(kind="rename_entry")
+        self.assertEqual(job.payload, {"model": "experiment", "object_id": str(experiment.id)})
 
         # Verify the experiment data has been updated
         experiment.refresh_from_db()
@@ -341,3 +554,521 @@ class ExperimentViewSetTests(APITestCase):
         response = self.client.patch(f'{self.url}{experiment.id}/', data, format='json',
                                      HTTP_AUTHORIZATION=self.auth_header)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SuggestViewTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.token = AuthToken.objects.create(self.user)[1]
+        self.auth_header = f"Token {self.token}"
+
+        self.facility = Facility.objects.create(name="Cryo Facility", abbreviation="CF", created_by=self.user)
+        self.project = Project.objects.create(name="Cryo Project", facility=self.facility, description="desc",
+                                              created_by=self.user)
+
+        other_user = User.objects.create_user(username="otheruser", password="otherpass")
+        Facility.objects.create(name="Cryo Hidden", abbreviation="CH", created_by=other_user)
+
+    def test_suggest_by_prefix(self):
+        response = self.client.get("/api/v1/suggest/", {"q": "cryo"}, HTTP_AUTHORIZATION=self.auth_header)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = {(row["model"], row["name"]) for row in response.data["results"]}
+        self.assertIn(("Facility", "Cryo Facility"), names)
+        self.assertIn(("Project", "Cryo Project"), names)
+        self.assertNotIn(("Facility", "Cryo Hidden"), names)
+
+    def test_suggest_short_query(self):
+        response = self.client.get("/api/v1/suggest/", {"q": "c"}, HTTP_AUTHORIZATION=self.auth_header)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"], [])
+
+    def test_suggest_invalid_limit(self):
+        for limit in ["-1", "0", "x"]:
+            with self.subTest(limit=limit):
+                response = self.client.get("/api/v1/suggest/", {"q": "cryo", "limit": limit},
+                                           HTTP_AUTHORIZATION=self.auth_header)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_requires_authentication(self):
+        response = self.client.get("/api/v1/suggest/", {"q": "cryo"})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ParseQueryBlockTest(SimpleTestCase):
+    allowed_fields = ["name", "metadata__sample__name"]
+
+    def test_regex_uses_iregex(self):
+        q = parse_query_block("sample.name", {"$regex": "^cryo"}, self.allowed_fields)
+        self.assertEqual(q.children, [("metadata__sample__name__iregex", "^cryo")])
+
+    def test_regex_patterns_collected_from_tree(self):
+        filters = {"name": {"$regex": "^a"}, "$or": [{"note": {"$regex": "b$"}}, {"$not": {"name": {"$regex": "c"}}}]}
+        self.assertEqual(sorted(regex_patterns(filters)), ["^a", "b$", "c"])
+
+    def test_regex_rejects_expensive_patterns(self):
+        for pattern in ["(a+)+$", r"(a)\1", "x" * 300, "a*" * 20, "(unclosed"]:
+            with self.subTest(pattern=pattern):
+                with self.assertRaises(ValueError):
+                    parse_query_block("name", {"$regex": pattern}, self.allowed_fields)
+
+
+class SearchDocumentTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.token = AuthToken.objects.create(self.user)[1]
+        self.auth_header = f"Token {self.token}"
+
+        self.facility = Facility.objects.create(name="Cryo Facility", abbreviation="CF", created_by=self.user)
+        self.project = Project.objects.create(name="Membrane Project", facility=self.facility, description="desc",
+                                              created_by=self.user)
+        self.dataset = Dataset.objects.create(name="Lipid Dataset", project=self.project, description="desc",
+                                              metadata={"sample": {"name": "bilayer"}}, created_by=self.user)
+
+    def test_documents_follow_saves_and_deletes(self):
+        document = SearchDocument.objects.get(model="Dataset", object_id=self.dataset.id)
+        self.assertEqual(document.title, "Lipid Dataset")
+        self.assertEqual(document.ancestor_ids, [self.facility.id, self.project.id])
+        self.assertEqual(document.metadata, {"sample.name": "bilayer"})
+        self.assertIn("bilayer", document.text)
+
+        self.dataset.delete()
+        self.assertFalse(SearchDocument.objects.filter(model="Dataset", object_id=self.dataset.id).exists())
+
+    def test_moving_project_updates_descendants(self):
+        experiment = Experiment.objects.create(dataset=self.dataset, name="Run", created_by=self.user)
+        other_facility = Facility.objects.create(name="Other Facility", abbreviation="OF", created_by=self.user)
+
+        self.project.facility = other_facility
+        self.project.save()
+
+        ancestors = dict(SearchDocument.objects.filter(model__in=["Dataset", "Experiment"])
+                         .values_list("object_id", "ancestor_ids"))
+        self.assertEqual(ancestors[self.dataset.id], [other_facility.id, self.project.id])
+        self.assertEqual(ancestors[experiment.id], [other_facility.id, self.project.id, self.dataset.id])
+
+    def test_query_uses_documents(self):
+        other_user = User.objects.create_user(username="otheruser", password="otherpass")
+        Facility.objects.create(name="Cryo Hidden", abbreviation="CH", created_by=other_user)
+
+        response = self.client.post("/api/v1/query/", {"q": "Cryo"}, format="json",
+                                    HTTP_AUTHORIZATION=self.auth_header)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        texts = [row["text"] for row in response.data["results"]]
+        self.assertIn("Cryo Facility", texts)
+        self.assertNotIn("Cryo Hidden", texts)
+
+
+class GeneralSearchViewTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.token = AuthToken.objects.create(self.user)[1]
+        self.auth_header = f"Token {self.token}"
+
+        self.facility = Facility.objects.create(name="Cryo Facility", abbreviation="CF", created_by=self.user)
+        self.project = Project.objects.create(name="Membrane Project", facility=self.facility, description="desc",
+                                              created_by=self.user)
+
+    def search(self, data):
+        return self.client.post("/api/v1/query/", data, format="json", HTTP_AUTHORIZATION=self.auth_header)
+
+    def test_explain_restricted_to_staff(self):
+        response = self.search({"model": "Facility", "filters": {"name": "Cryo Facility"}, "explain": True})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_explain_profile_for_staff(self):
+        self.user.is_staff = True
+        self.user.save()
+
+        response = self.search({"model": "Facility", "filters": {"name": "Cryo Facility"}, "explain": True})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        [profile] = response.data["explain"]
+        self.assertEqual(set(profile), {"model", "wall_time_ms", "highlight_time_ms", "rows_before_permissions",
+                                        "rows_after_permissions", "sql", "params", "plan"})
+        self.assertEqual(profile["model"], "Facility")
+        self.assertEqual(profile["rows_after_permissions"], 1)
+        self.assertGreaterEqual(profile["wall_time_ms"], profile["highlight_time_ms"])
+
+    def test_regex_rejected_by_postgres(self):
+        for pattern in ["(?P<n>a)", "[[:word_char:]]"]:
+            with self.subTest(pattern=pattern):
+                response = self.search({"model": "Facility", "filters": {"$or": [{"name": {"$regex": pattern}}]}})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn("Invalid $regex pattern", response.data["error"])
+
+    def export(self, export_format):
+        Facility.objects.create(name="Cryo Annex", abbreviation="CA", created_by=self.user)
+        Facility.objects.create(name="Light Facility", abbreviation="LF", created_by=self.user)
+        return self.search({"model": "Facility", "filters": {"name": {"$regex": "^cryo"}}, "format": export_format})
+
+    def test_export_ndjson(self):
+        response = self.export("ndjson")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="search.ndjson"')
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(sorted(row["text"] for row in rows), ["Cryo Annex", "Cryo Facility"])
+        row = next(row for row in rows if row["text"] == "Cryo Facility")
+        self.assertEqual(row, {"id": str(self.facility.id), "model": "Facility", "text": "Cryo Facility",
+                               "highlights": ["name: Cryo Facility"]})
+
+    def test_export_csv(self):
+        response = self.export("csv")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="search.csv"')
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ["id", "model", "text", "highlights"])
+        self.assertEqual(sorted(row[2] for row in rows[1:]), ["Cryo Annex", "Cryo Facility"])
+        self.assertIn([str(self.facility.id), "Facility", "Cryo Facility", "name: Cryo Facility"], rows)
+
+    @patch.object(GeneralSearchViewSet, "export_chunk_size", 1)
+    def test_export_under_asgi(self):
+        Facility.objects.create(name="Cryo Annex", abbreviation="CA", created_by=self.user)
+
+        async def export():
+            response = await self.async_client.post(
+                "/api/v1/query/", {"model": "Facility", "filters": {"name": {"$regex": "^cryo"}}, "format": "ndjson"},
+                content_type="application/json", headers={"Authorization": self.auth_header})
+            return response, b"".join([chunk async for chunk in response.streaming_content])
+
+        response, content = async_to_sync(export)()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_async)
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual(sorted(row["text"] for row in rows), ["Cryo Annex", "Cryo Facility"])
+
+    def test_export_invalid_format(self):
+        response = self.search({"q": "Cryo", "format": "xml"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DatasetProvisioningTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.token = AuthToken.objects.create(self.user)[1]
+        self.auth_header = f"Token {self.token}"
+
+        self.facility = Facility.objects.create(name="Test Facility", onedata_provider_url="https://provider.url",
+                                                created_by=self.user)
+        self.project = Project.objects.create(name="Test Project", facility=self.facility, description="desc",
+                                              created_by=self.user)
+
+    def create_dataset(self):
+        data = {"name": "New Dataset", "description": "desc", "project": self.project.id}
+        response = self.client.post("/api/v1/datasets/", data, format="json", HTTP_AUTHORIZATION=self.auth_header)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["provisioning_status"], ProvisioningStatus.PENDING)
+        return Dataset.objects.get(id=response.data["id"])
+
+    @patch("onedata_api.provisioning.establish_dataset", return_value=("onedata-dataset-id", None))
+    @patch("onedata_api.provisioning.create_public_share", return_value=(MagicMock(share_id="share-id"), None))
+    @patch("onedata_api.provisioning.create_new_dataset", return_value=(MagicMock(file_id="file-id"), None))
+    def test_provisioning_job(self, mock_folder, mock_share, mock_dataset):
+        dataset = self.create_dataset()
+        mock_folder.assert_not_called()
+
+        self.assertEqual(run_pending_jobs(), 1)
+
+        dataset.refresh_from_db()
+        self.assertEqual(dataset.provisioning_status, ProvisioningStatus.SUCCESS)
+        self.assertEqual(dataset.onedata_file_id, "file-id")
+        self.assertEqual(dataset.onedata_share_id, "share-id")
+        self.assertEqual(dataset.onedata_dataset_id, "onedata-dataset-id")
+        self.assertEqual(Job.objects.get(dataset=dataset).status, JobStatus.SUCCESS)
+
+    @patch("onedata_api.provisioning.establish_dataset", return_value=(None, {"error": "provider down"}))
+    @patch("onedata_api.provisioning.create_public_share", return_value=(MagicMock(share_id="share-id"), None))
+    @patch("onedata_api.provisioning.create_new_dataset", return_value=(MagicMock(file_id="file-id"), None))
+    def test_failed_step_is_retried(self, mock_folder, mock_share, mock_dataset):
+        dataset = self.create_dataset()
+
+        run_pending_jobs()
+
+        dataset.refresh_from_db()
+        job = Job.objects.get(dataset=dataset)
+        self.assertEqual(job.status, JobStatus.PENDING)
+        self.assertEqual(dataset.provisioning_status, ProvisioningStatus.PENDING)
+        self.assertEqual(dataset.provisioning_steps["share"]["status"], ProvisioningStatus.SUCCESS)
+        self.assertEqual(dataset.provisioning_steps["dataset"]["status"], ProvisioningStatus.FAILURE)
+
+        # the next attempt only repeats the failed step
+        mock_dataset.return_value = ("onedata-dataset-id", None)
+        Job.objects.filter(pk=job.pk).update(run_after=now())
+        run_pending_jobs()
+
+        dataset.refresh_from_db()
+        self.assertEqual(dataset.provisioning_status, ProvisioningStatus.SUCCESS)
+        self.assertEqual(mock_folder.call_count, 1)
+        self.assertEqual(mock_share.call_count, 1)
+        self.assertEqual(mock_dataset.call_count, 2)
+
+
+class JobQueueTest(APITestCase):
+    def test_claimed_job_is_not_stale(self):
+        job = enqueue("provision_dataset")
+        Job.objects.filter(pk=job.pk).update(modified=now() - timedelta(hours=1))
+
+        self.assertEqual([claimed.pk for claimed in claim_jobs()], [job.pk])
+
+        self.assertEqual(requeue_stale_jobs(), 0)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, JobStatus.RUNNING)
+
+
+class DatasetBatchJobTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.facility = Facility.objects.create(name="Test Facility", onedata_provider_url="https://provider.url",
+                                                created_by=self.user)
+        self.project = Project.objects.create(name="Test Project", facility=self.facility, description="desc",
+                                              created_by=self.user)
+        self.ok, self.broken, self.shared = [
+            Dataset.objects.create(name=name, project=self.project, description="desc", created_by=self.user,
+                                   onedata_file_id=f"{name}-file", onedata_share_id=share_id)
+            for name, share_id in [("ok", ""), ("broken", ""), ("shared", "existing-share")]
+        ]
+
+    @staticmethod
+    def fake_share(project, name, description, entry):
+        if name == "broken":
+            return None, {"error": "provider error"}
+        return MagicMock(share_id=f"{name}-share"), None
+
+    @patch("onedata_api.provisioning.create_public_share")
+    def test_errors_do_not_stop_the_batch(self, mock_share):
+        mock_share.side_effect = self.fake_share
+        job = enqueue_batch("share", Dataset.objects.all(), self.user)
+        self.assertEqual(job.total, 3)
+
+        run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.SUCCESS)
+        self.assertEqual((job.processed, job.failed), (3, 1))
+        self.assertEqual(job.results[str(self.ok.pk)]["status"], "success")
+        self.assertEqual(job.results[str(self.shared.pk)]["status"], "skipped")
+        self.assertIn("provider error", job.results[str(self.broken.pk)]["error"])
+
+        self.ok.refresh_from_db()
+        self.assertEqual(self.ok.onedata_share_id, "ok-share")
+        self.assertEqual(mock_share.call_count, 2)
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    hits = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        if self.path == "/slow":
+            time.sleep(0.5)
+        self.send_response(500 if self.path == "/fail" else 200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(RESILIENCE_FAILURE_THRESHOLD=2, RESILIENCE_RESET_TIMEOUT=0.2, RESILIENCE_BULKHEAD_LIMIT=1,
+                   RESILIENCE_BULKHEAD_WAIT=0.05, RESILIENCE_TIMEOUTS={"fake": (1, 0.1)})
+class ResilienceTest(SimpleTestCase):
+    def setUp(self):
+        resilience.reset()
+        FakeServiceHandler.hits = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeServiceHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def get(self, path):
+        return resilience.request("fake", "local", "GET", f"{self.url}{path}")
+
+    @staticmethod
+    def breaker_state():
+        return resilience.resilience_state()["breakers"]["fake:local"]
+
+    def test_circuit_opens_and_recovers(self):
+        self.get("/fail")
+        self.get("/fail")
+        self.assertEqual(resilience.get_breaker("fake", "local").state, "open")
+
+        with self.assertRaises(resilience.CircuitOpenError):
+            self.get("/ok")
+        self.assertEqual(FakeServiceHandler.hits, 2)
+
+        time.sleep(0.25)
+        self.assertEqual(self.get("/ok").status_code, 200)
+        self.assertEqual(self.breaker_state()["state"], "closed")
+
+    def test_timeout_counts_as_failure(self):
+        with self.assertRaises(requests.Timeout):
+            self.get("/slow")
+        self.assertEqual(self.breaker_state()["failures"], 1)
+
+    def test_bulkhead(self):
+        with resilience.get_bulkhead("fake", "local").slot():
+            with self.assertRaises(resilience.BulkheadFullError):
+                self.get("/ok")
+        self.assertEqual(self.get("/ok").status_code, 200)
+        self.assertEqual(resilience.resilience_state()["bulkheads"]["fake:local"]["rejected"], 1)
+
+    def test_rejected_probe_does_not_block_the_breaker(self):
+        self.get("/fail")
+        self.get("/fail")
+        time.sleep(0.25)
+
+        # the probe call finds the bulkhead full and never reaches the service
+        with resilience.get_bulkhead("fake", "local").slot():
+            with self.assertRaises(resilience.BulkheadFullError):
+                self.get("/ok")
+        self.assertEqual(self.breaker_state()["state"], "open")
+
+        self.assertEqual(self.get("/ok").status_code, 200)
+        self.assertEqual(self.breaker_state()["state"], "closed")
+
+    def test_rate_limiter(self):
+        limiter = resilience.RateLimiter(rate=20)
+        started = time.monotonic()
+        for _ in range(5):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.18)
+
+
+class StatusEventsTest(SimpleTestCase):
+    @patch("api.events.visible_ids", return_value={"dataset-a"})
+    @patch("api.events.Broadcaster.listen", new=lambda self: asyncio.sleep(0))
+    def test_stream_passes_visible_events(self, mock_visible):
+        async def read():
+            stream = events.stream(MagicMock(), set())
+            self.assertTrue((await anext(stream)).startswith("retry:"))
+            events.broadcaster.dispatch({"model": "Experiment", "id": "hidden", "ancestors": ["dataset-b"]})
+            events.broadcaster.dispatch({"model": "Experiment", "id": "shown", "ancestors": ["dataset-a"]})
+            message = await anext(stream)
+            await stream.aclose()
+            return message
+
+        message = asyncio.run(read())
+        self.assertEqual(json.loads(message.split("data: ", 1)[1])["id"], "shown")
+        self.assertEqual(events.broadcaster.queues, set())
+
+    def test_event_narrowed_to_selected_objects(self):
+        event = {"id": "experiment", "ancestors": ["facility", "project", "dataset"]}
+        self.assertTrue(events.event_visible(event, None, {"project"}))
+        self.assertFalse(events.event_visible(event, None, {"other-dataset"}))
+        self.assertFalse(events.event_visible(event, {"other-project"}, set()))
+
+
+class TelemetryParsingTest(SimpleTestCase):
+    def test_invalid_batches_rejected(self):
+        for data in [
+            {"time": [], "metrics": {"temperature": []}},
+            {"time": [1, 2], "metrics": {"temperature": [20.5]}},
+            {"time": [1, 2], "metrics": {"Temperature!": [20.5, 21]}},
+            {"time": [1, "2"], "metrics": {"temperature": [20.5, 21]}},
+            {"time": [1, 2], "metrics": {"temperature": [20.5, True]}},
+            {"time": [0, 2 * 86400], "metrics": {"temperature": [20.5, 21]}},
+        ]:
+            with self.assertRaises(ValueError, msg=data):
+                telemetry.parse_samples(data)
+
+    def test_sample_times_bounded(self):
+        current = time.time()
+        for times in [[current * 1000], [1e20], [-1e20], [100.0], [current + 2 * 86400]]:
+            with self.subTest(times=times), self.assertRaises(ValueError):
+                telemetry.parse_samples({"time": times, "metrics": {"temperature": [21.0]}})
+        self.assertEqual(telemetry.parse_samples({"time": [current], "metrics": {"temperature": [21.0]}})[0],
+                         [current])
+
+    def test_resolution_follows_span(self):
+        start = now()
+        self.assertEqual(telemetry.pick_resolution(start, start + timedelta(minutes=30)), telemetry.RAW)
+        self.assertEqual(telemetry.pick_resolution(start, start + timedelta(minutes=30), raw=False), 60)
+        self.assertEqual(telemetry.pick_resolution(start, start + timedelta(days=7)), 3600)
+        self.assertEqual(telemetry.pick_resolution(start, start + timedelta(days=365)), 86400)
+
+    def test_timeline_bounds(self):
+        start = now()
+        with self.assertRaises(ValueError):
+            telemetry.timeline(["temperature"], start, start - timedelta(hours=1), experiment=MagicMock())
+        # minute buckets of a week exceed TELEMETRY_MAX_POINTS
+        with self.assertRaisesRegex(ValueError, "at least 3600"):
+            telemetry.timeline(["temperature"], start, start + timedelta(days=7), experiment=MagicMock(), resolution=60)
+
+
+class TelemetryViewTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.token = AuthToken.objects.create(self.user)[1]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token}")
+        self.facility = Facility.objects.create(name="Test Facility", created_by=self.user)
+        self.instrument = Instrument.objects.create(name="Krios", facility=self.facility, user=self.user,
+                                                    created_by=self.user)
+        self.project = Project.objects.create(name="Test Project", facility=self.facility, description="desc",
+                                              created_by=self.user)
+        self.dataset = Dataset.objects.create(name="Test Dataset", project=self.project, description="desc",
+                                              created_by=self.user)
+        self.experiment = Experiment.objects.create(dataset=self.dataset, name="Experiment", created_by=self.user)
+        self.start = 1_700_000_040.0  # a minute boundary
+
+    def post_batch(self, times, metrics):
+        return self.client.post("/api/v1/telemetry/", {"experiment": str(self.experiment.id), "time": times,
+                                                      "metrics": metrics}, format="json")
+
+    def test_batch_packed_and_rolled_up(self):
+        times = [self.start + offset for offset in (90, 0, 30, 60)]
+        response = self.post_batch(times, {"temperature": [24.0, 21.0, 22.0, 23.0],
+                                           "file_count": [None, 1, None, 3]})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {"stored": 6})
+        self.post_batch([self.start + 120], {"temperature": [30.0]})
+
+        self.assertEqual(TelemetryBatch.objects.count(), 3)
+        temperature = TelemetryBatch.objects.filter(metric="temperature").order_by("start").first()
+        self.assertEqual(temperature.times, [self.start + offset for offset in (0, 30, 60, 90)])
+        self.assertEqual(temperature.values, [21.0, 22.0, 23.0, 24.0])
+        self.assertEqual(temperature.instrument, self.instrument)
+
+        minutes = TelemetryRollup.objects.filter(metric="temperature", resolution=60).order_by("bucket")
+        self.assertEqual([(rollup.count, rollup.total, rollup.minimum, rollup.maximum, rollup.last)
+                          for rollup in minutes],
+                         [(2, 43.0, 21.0, 22.0, 22.0), (2, 47.0, 23.0, 24.0, 24.0), (1, 30.0, 30.0, 30.0, 30.0)])
+        hour = TelemetryRollup.objects.get(metric="temperature", resolution=3600)
+        self.assertEqual((hour.count, hour.maximum, hour.last), (5, 30.0, 30.0))
+
+    def test_experiment_and_instrument_timelines(self):
+        self.post_batch([self.start, self.start + 30], {"bytes_transferred": [100, 300]})
+        params = {"date_from": "2023-11-14T22:00:00+00:00", "date_to": "2023-11-14T23:00:00+00:00"}
+
+        response = self.client.get(f"/api/v1/telemetry/experiments/{self.experiment.id}/", params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["resolution"], telemetry.RAW)
+        self.assertEqual(response.data["series"], {"bytes_transferred": [[self.start, 100.0], [self.start + 30, 300.0]]})
+
+        response = self.client.get(f"/api/v1/telemetry/instruments/{self.instrument.id}/", params)
+        self.assertEqual(response.data["resolution"], 60)
+        self.assertEqual(response.data["series"]["bytes_transferred"], [[self.start, 2, 200.0, 100.0, 300.0, None]])
+
+        response = self.client.get(f"/api/v1/telemetry/instruments/{self.instrument.id}/", {**params, "resolution": 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_out_of_range_times_rejected(self):
+        for times in [[1.7e12], [1e20]]:
+            with self.subTest(times=times):
+                response = self.post_batch(times, {"temperature": [21.0]})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn("epoch seconds", response.data["error"])
+        self.assertFalse(TelemetryBatch.objects.exists())
+
+    def test_ingestion_requires_editor(self):
+        other = User.objects.create_user(username="other", password="testpass")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {AuthToken.objects.create(other)[1]}")
+        response = self.post_batch([self.start], {"temperature": [21.0]})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(TelemetryBatch.objects.exists())
@@ -1,8 +1,19 @@
+import csv
+import json
+import re
+import time
+
 from rest_framework.viewsets import ViewSet
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.pagination import LimitOffsetPagination
+from asgiref.sync import sync_to_async
 from django.apps import apps
+from django.conf import settings
+from django.db import DataError, connection, transaction
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.db.models import Q, CharField, TextField, Value, FloatField, F
 from django.contrib.postgres.search import TrigramSimilarity
 from guardian.shortcuts import get_objects_for_user
@@ -34,6 +45,66 @@ class GenericSearchResultSerializer(serializers.ModelSerializer):
     def get_model(self, obj):
         return obj.__class__.__name__
 
+REGEX_MAX_LENGTH = 256
+REGEX_MAX_QUANTIFIERS = 16
+BACKREFERENCE = re.compile(r"\\[1-9]")
+NESTED_QUANTIFIER = re.compile(r"\([^()]*[*+}][^()]*\)[*+{]")
+QUANTIFIER = re.compile(r"(?<!\\)[*+?{]")
+
+def validate_regex(pattern):
+    """Reject patterns that are too long or too expensive to run as POSIX regex in the database."""
+    if not isinstance(pattern, str):
+        raise ValueError("$regex operator requires a string")
+    if len(pattern) > REGEX_MAX_LENGTH:
+        raise ValueError(f"$regex pattern is longer than {REGEX_MAX_LENGTH} characters")
+    if BACKREFERENCE.search(pattern):
+        raise ValueError("$regex pattern must not contain backreferences")
+    if NESTED_QUANTIFIER.search(pattern):
+        raise ValueError("$regex pattern must not contain nested quantifiers")
+    if len(QUANTIFIER.findall(pattern)) > REGEX_MAX_QUANTIFIERS:
+        raise ValueError(f"$regex pattern has more than {REGEX_MAX_QUANTIFIERS} quantifiers")
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        raise ValueError(f"Invalid $regex pattern: {e}")
+
+def regex_patterns(filters):
+    """Yield the `$regex` patterns of a filter tree that `parse_filter_tree` accepted."""
+    if not isinstance(filters, dict):
+        return
+    for field, expr in filters.items():
+        if field in ("$and", "$or"):
+            for item in expr:
+                yield from regex_patterns(item)
+        elif field == "$not":
+            yield from regex_patterns(expr)
+        elif isinstance(expr, dict) and "$regex" in expr:
+            yield expr["$regex"]
+
+def check_regex_in_database(patterns):
+    """
+    Compile the patterns as PostgreSQL AREs, which differ from Python's `re` syntax,
+    e.g. `(?P<n>a)` or `[[:word_char:]]` are valid Python only.
+    """
+    for pattern in patterns:
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("SELECT '' ~* %s", [pattern])
+        except DataError as e:
+            raise ValueError(f"Invalid $regex pattern: {str(e).splitlines()[0]}")
+
+class SearchDocumentResultSerializer(serializers.Serializer):
+    id = serializers.UUIDField(source="object_id")
+    text = serializers.CharField(source="title")
+    highlights = serializers.SerializerMethodField()
+    model = serializers.CharField()
+
+    def get_highlights(self, obj):
+        query = self.context.get("query", "").lower()
+        if query and query in obj.title.lower():
+            return [f"name: {obj.title}"]
+        return []
+
 def parse_query_block(field, expr, allowed_fields, field_types=None):
     # Normalize for metadata JSONField access
     if "." in field:
@@ -68,7 +139,8 @@ def parse_query_block(field, expr, allowed_fields, field_types=None):
         elif op in ["$gt", "$gte", "$lt", "$lte", "$contains"]:
             q &= Q(**{f"{lookup_field}__{op[1:]}": val})
         elif op == "$regex":
-            q &= Q(**{f"{lookup_field}__icontains": val})
+            validate_regex(val)
+            q &= Q(**{f"{lookup_field}__iregex": val})
         elif op == "$in":
             if not isinstance(val, list):
                 raise ValueError(f"$in operator requires a list")
@@ -152,11 +224,61 @@ def collect_highlights(obj, filters, query, trigram_fields):
 
     return highlights
 
+def annotate_similarity(qs, query, trigram_fields):
+    annotations = {
+        f"sim_{field}": TrigramSimilarity(
+            Cast(Coalesce(F(field), Value("")), output_field=TextField()),
+            Cast(Value(query), output_field=TextField())
+        )
+        for field in trigram_fields
+    }
+    if not annotations:
+        return qs
+    qs = qs.annotate(**annotations)
+    if len(annotations) >= 2:
+        qs = qs.annotate(similarity=Greatest(*annotations.values(), output_field=FloatField()))
+    else:
+        field_expr = next(iter(annotations.values()))
+        qs = qs.annotate(similarity=Coalesce(field_expr, Value(0.0), output_field=FloatField()))
+    return qs.filter(similarity__gt=0.1).order_by("-similarity")
+
+def explain_queryset(qs):
+    """Return generated SQL and `EXPLAIN (ANALYZE, BUFFERS)` output for the queryset."""
+    sql, params = qs.query.sql_with_params()
+    return {
+        "sql": sql,
+        "params": [str(p) for p in params],
+        "plan": qs.explain(analyze=True, buffers=True),
+    }
+
+class Echo:
+    """Pseudo-buffer for `csv.writer`, returns the written row instead of storing it."""
+
+    def write(self, value):
+        return value
+
+def export_row(obj, model_name, filters, query, trigram_fields):
+    highlights = collect_highlights(obj, filters, query, trigram_fields)
+    return {
+        "id": str(obj.pk),
+        "model": model_name,
+        "text": str(obj),
+        "highlights": [f"{key}: {value}" for key, value in highlights.items()],
+    }
+
 class GeneralSearchViewSet(ViewSet):
     permission_classes = [IsAuthenticated]
     pagination_class = GenericSearchPagination
+    export_formats = ["ndjson", "csv"]
+    export_chunk_size = 2000
 
-    def create(self, request):
+    def get_search_querysets(self, request):
+        """
+        Build permission scoped querysets for every model matching the request.
+
+        Returns a list of `(name, model_class, queryset, q, trigram_fields, build_time)`, the
+        build time in seconds. Querysets are not evaluated. Raises `ValueError` for invalid filters.
+        """
         from api.models import Schema
 
         query = request.data.get("q")
@@ -168,8 +290,9 @@ class GeneralSearchViewSet(ViewSet):
             m.__name__ for m in apps.get_models() if m._meta.app_label == "api"
         ]
 
-        results = []
+        searches = []
         for name in models_to_search:
+            started = time.perf_counter()
             try:
                 model_class = apps.get_model("api", name)
                 trigram_fields = get_trigram_fields(model_class)
@@ -207,35 +330,70 @@ class GeneralSearchViewSet(ViewSet):
             q = Q()
             if filters:
                 print(f"Applying filters: {filters}", flush=True)
-                try:
-                    q = parse_filter_tree(filters, allowed_fields, field_types if schema_id else None)
-                except ValueError as e:
-                    return Response({"error": str(e)}, status=400)
-                
+                q = parse_filter_tree(filters, allowed_fields, field_types if schema_id else None)
+
             print(f"Parsed query: {q}", flush=True)
 
             if query and trigram_fields:
-                annotations = {
-                    f"sim_{field}": TrigramSimilarity(
-                        Cast(Coalesce(F(field), Value("")), output_field=TextField()),
-                        Cast(Value(query), output_field=TextField())
-                    )
-                    for field in trigram_fields
-                }
-                if annotations:
-                    base_qs = base_qs.annotate(**annotations)
-                    if len(annotations) >= 2:
-                        base_qs = base_qs.annotate(similarity=Greatest(*annotations.values(), output_field=FloatField()))
-                    else:
-                        field_expr = next(iter(annotations.values()))
-                        base_qs = base_qs.annotate(similarity=Coalesce(field_expr, Value(0.0), output_field=FloatField()))
-                    base_qs = base_qs.filter(similarity__gt=0.1).order_by("-similarity")
-
-            qs = base_qs.filter(q).distinct()
+                base_qs = annotate_similarity(base_qs, query, trigram_fields)
+
+            searches.append((name, model_class, base_qs.filter(q).distinct(), q, trigram_fields,
+                             time.perf_counter() - started))
 
+        return searches
+
+    def create(self, request):
+        query = request.data.get("q")
+        filters = request.data.get("filters", {})
+        explain = request.data.get("explain") is True
+        # `format` in the query string is reserved for DRF content negotiation
+        export_format = request.data.get("format")
+
+        if explain and not request.user.is_staff:
+            return Response({"error": "Explain mode is restricted to staff users"}, status=403)
+
+        if export_format and export_format not in self.export_formats:
+            return Response({"error": f"Unsupported format: {export_format}"}, status=400)
+
+        if (settings.SEARCH_USE_DOCUMENTS and query and not filters and not request.data.get("schema")
+                and not explain and not export_format):
+            return self.search_documents(request, query)
+
+        try:
+            searches = self.get_search_querysets(request)
+            check_regex_in_database(regex_patterns(filters))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        if export_format:
+            return self.export(request, searches, export_format, filters, query)
+
+        results = []
+        profile = []
+        for name, model_class, qs, q, trigram_fields, build_time in searches:
+            started = time.perf_counter() - build_time
+
+            highlight_time = 0.0
+            rows = 0
             for obj in qs:
+                highlight_started = time.perf_counter()
                 obj._matched_fields = collect_highlights(obj, filters, query, trigram_fields)
+                highlight_time += time.perf_counter() - highlight_started
                 results.append(obj)
+                rows += 1
+
+            if explain:
+                unscoped_qs = model_class.objects.all()
+                if query and trigram_fields:
+                    unscoped_qs = annotate_similarity(unscoped_qs, query, trigram_fields)
+                profile.append({
+                    "model": name,
+                    "wall_time_ms": round((time.perf_counter() - started) * 1000, 3),
+                    "highlight_time_ms": round(highlight_time * 1000, 3),
+                    "rows_before_permissions": unscoped_qs.filter(q).distinct().count(),
+                    "rows_after_permissions": rows,
+                    **explain_queryset(qs),
+                })
 
         paginator = self.pagination_class()
         paginated = paginator.paginate_queryset(results, request)
@@ -243,4 +401,73 @@ class GeneralSearchViewSet(ViewSet):
         if results:
             GenericSearchResultSerializer.Meta.model = results[0].__class__
         serializer = GenericSearchResultSerializer(paginated, many=True)
+        response = paginator.get_paginated_response(serializer.data)
+        if explain:
+            response.data["explain"] = profile
+        return response
+
+    def search_documents(self, request, query):
+        """Answer a plain text query with one ranked query over the `SearchDocument` table."""
+        from api.search import search_documents, set_similarity_thresholds
+
+        paginator = self.pagination_class()
+        with transaction.atomic():
+            set_similarity_thresholds()
+            qs = search_documents(request.user, query, request.data.get("model"))
+            paginated = paginator.paginate_queryset(qs, request)
+        serializer = SearchDocumentResultSerializer(paginated, many=True, context={"query": query})
         return paginator.get_paginated_response(serializer.data)
+
+    def export(self, request, searches, export_format, filters, query):
+        """
+        Stream all matching rows, so memory does not grow with the result size.
+
+        Under WSGI the rows are read with server-side cursors. Under ASGI a synchronous iterator
+        would be collected in memory before sending, so the content is an async iterator reading
+        chunks ordered by primary key in the sync thread.
+        """
+        if export_format == "csv":
+            writer = csv.writer(Echo())
+            header = [writer.writerow(["id", "model", "text", "highlights"])]
+            content_type, filename = "text/csv", "search.csv"
+
+            def line(row):
+                return writer.writerow([row["id"], row["model"], row["text"], "; ".join(row["highlights"])])
+        else:
+            header = []
+            content_type, filename = "application/x-ndjson", "search.ndjson"
+
+            def line(row):
+                return json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+        if isinstance(request._request, ASGIRequest):
+            async def content():
+                for value in header:
+                    yield value
+                for name, _, qs, _, trigram_fields, _ in searches:
+                    after = None
+                    while True:
+                        rows, after = await sync_to_async(self.export_chunk)(qs, after, name, filters, query,
+                                                                            trigram_fields)
+                        for row in rows:
+                            yield line(row)
+                        if len(rows) < self.export_chunk_size:
+                            break
+        else:
+            def content():
+                yield from header
+                for name, _, qs, _, trigram_fields, _ in searches:
+                    for obj in qs.iterator(chunk_size=self.export_chunk_size):
+                        yield line(export_row(obj, name, filters, query, trigram_fields))
+
+        response = StreamingHttpResponse(content(), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    def export_chunk(self, qs, after, name, filters, query, trigram_fields):
+        """Export rows of the next `export_chunk_size` objects with a primary key above `after`, and the last key."""
+        if after is not None:
+            qs = qs.filter(pk__gt=after)
+        objs = list(qs.order_by("pk")[:self.export_chunk_size])
+        rows = [export_row(obj, name, filters, query, trigram_fields) for obj in objs]
+        return rows, objs[-1].pk if objs else after
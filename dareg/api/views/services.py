@@ -0,0 +1,17 @@
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from api.resilience import resilience_state
+
+
+class ServiceStateView(APIView):
+    """
+    Circuit breaker and bulkhead state of the external services (Onedata providers, DataCite)
+    as seen by this worker process.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(resilience_state())
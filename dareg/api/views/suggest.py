@@ -0,0 +1,71 @@
+import hashlib
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.cache import cache
+from django.db.models import Case, When, Value, IntegerField, Q
+from guardian.shortcuts import get_objects_for_user
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from api.models import Facility, Project, Dataset, Schema
+
+
+class SuggestView(APIView):
+    """
+    Lightweight typeahead over names of facilities, projects, datasets and schemas.
+
+    Prefix matches are served by the `UPPER(name) text_pattern_ops` indexes and fuzzy
+    matches by the `gin_trgm_ops` indexes declared on the models.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    models = [Facility, Project, Dataset, Schema]
+    default_limit = 5
+    max_limit = 20
+    min_query_length = 2
+    cache_timeout = 30
+
+    def get(self, request):
+        query = (request.query_params.get("q") or "").strip()
+        if len(query) < self.min_query_length:
+            return Response({"results": []})
+
+        try:
+            limit = min(int(request.query_params.get("limit", self.default_limit)), self.max_limit)
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=400)
+        if limit < 1:
+            return Response({"error": "limit must be positive"}, status=400)
+
+        digest = hashlib.sha1(query.lower().encode()).hexdigest()
+        cache_key = f"suggest:{request.user.pk}:{limit}:{digest}"
+        results = cache.get(cache_key)
+        if results is None:
+            results = []
+            for model_class in self.models:
+                results.extend(self.suggest(request.user, model_class, query, limit))
+            cache.set(cache_key, results, self.cache_timeout)
+
+        return Response({"results": results})
+
+    def get_queryset(self, user, model_class):
+        # schemas are public, see SchemaViewSet
+        if model_class is Schema:
+            return Schema.objects.all()
+        return get_objects_for_user(user, f"api.view_{model_class._meta.model_name}", klass=model_class)
+
+    def suggest(self, user, model_class, query, limit):
+        qs = (
+            self.get_queryset(user, model_class)
+            .filter(Q(name__istartswith=query) | Q(name__trigram_word_similar=query))
+            .annotate(
+                is_prefix=Case(When(name__istartswith=query, then=Value(1)), default=Value(0),
+                               output_field=IntegerField()),
+                similarity=TrigramWordSimilarity(query, "name"),
+            )
+            .order_by("-is_prefix", "-similarity", "name")
+            .values("id", "name")[:limit]
+        )
+        return [{"id": str(row["id"]), "name": row["name"], "model": model_class.__name__} for row in qs]
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+
+from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiResponse
+from rest_framework import status
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from api import telemetry
+from api.models import Experiment, Instrument, PermsGroup
+
+TIMELINE_PARAMETERS = [
+    OpenApiParameter(name='metric', description='Metric to return, repeatable, all by default', type=str, many=True),
+    OpenApiParameter(name='date_from', description='ISO formated FROM timestamp, a day ago by default', type=str),
+    OpenApiParameter(name='date_to', description='ISO formated TO timestamp, now by default', type=str),
+    OpenApiParameter(name='resolution', description='Bucket size in seconds, picked from the time span by default',
+                     type=int),
+]
+
+
+class TelemetryView(APIView):
+    """
+    Ingests a batch of telemetry samples of an experiment, see `api.telemetry` for the format.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        responses={
+            201: OpenApiResponse(description='Number of stored samples'),
+            400: OpenApiResponse(description='Invalid batch'),
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        experiment = get_object_or_404(Experiment.objects.select_related("dataset__project__facility"),
+                                       id=request.data.get("experiment"))
+        if not experiment.perm_atleast(request, PermsGroup.EDITOR):
+            return Response({"error": "You do not have permissions to add telemetry to this experiment."},
+                            status=status.HTTP_403_FORBIDDEN)
+        try:
+            times, metrics = telemetry.parse_samples(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        stored = telemetry.ingest(experiment, times, metrics, instrument=getattr(request.user, "instrument", None))
+        return Response({"stored": stored}, status=status.HTTP_201_CREATED)
+
+
+class TimelineView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def timeline(self, request, **target):
+        params = request.query_params
+        try:
+            date_to = datetime.fromisoformat(params["date_to"]) if params.get("date_to") \
+                else datetime.now(timezone.utc)
+            date_from = datetime.fromisoformat(params["date_from"]) if params.get("date_from") \
+                else date_to - timedelta(days=1)
+            date_from, date_to = [value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+                                  for value in (date_from, date_to)]
+            resolution = int(params["resolution"]) if params.get("resolution") else None
+            data = telemetry.timeline(params.getlist("metric"), date_from, date_to, resolution=resolution, **target)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
+
+
+class ExperimentTimelineView(TimelineView):
+    """
+    Telemetry of an experiment as `{"resolution", "columns", "series": {metric: [[...], ...]}}`,
+    raw samples (resolution 0) or rollup buckets.
+    """
+
+    @extend_schema(parameters=TIMELINE_PARAMETERS)
+    def get(self, request, id, *args, **kwargs):
+        experiment = get_object_or_404(Experiment.objects.select_related("dataset__project__facility"), id=id)
+        if not experiment.perm_atleast(request, PermsGroup.VIEWER):
+            return Response({"error": "Experiment not found"}, status=status.HTTP_404_NOT_FOUND)
+        return self.timeline(request, experiment=experiment)
+
+
+class InstrumentTimelineView(TimelineView):
+    """
+    Telemetry of all experiments recorded by an instrument, combined into rollup buckets.
+    """
+
+    @extend_schema(parameters=TIMELINE_PARAMETERS)
+    def get(self, request, id, *args, **kwargs):
+        instrument = get_object_or_404(Instrument.objects.select_related("facility"), id=id)
+        if instrument.user_id != request.user.id and not instrument.facility.perm_atleast(request, PermsGroup.VIEWER):
+            return Response({"error": "Instrument not found"}, status=status.HTTP_404_NOT_FOUND)
+        return self.timeline(request, instrument=instrument)
@@ -1,10 +1,16 @@
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from importlib.metadata import metadata
 
 import oneprovider_client
 import requests
+from django.conf import settings
 from django.contrib.auth.models import User, Group
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from django.db import transaction
+from django.db.models import CharField, OuterRef, Subquery
+from django.db.models.functions import Cast
 from django.http import HttpResponse
 from onedata_wrapper.api.file_operations_api import FileOperationsApi
 from onedata_wrapper.models.filesystem.entry_request import EntryRequest
@@ -15,7 +21,10 @@ from rest_framework.generics import get_object_or_404
 from rest_framework.parsers import JSONParser, FormParser, MultiPartParser, FileUploadParser
 from rest_framework.views import APIView
 
-from ..models import Facility, Project, Dataset, Schema, UserProfile, PermsGroup, Instrument, Experiment
+from ..models import Facility, Project, Dataset, Schema, UserProfile, PermsGroup, Instrument, Experiment, Reservation, \
+    create_perms_groups
+from ..events import publish, status_event
+from ..search import index_objects
 from ..serializers import (
     UserSerializer,
     GroupSerializer,
@@ -26,7 +35,7 @@ from ..serializers import (
     ProfileSerializer,
     ReservationSerializer,
     InstrumentSerializer, ExperimentSerializer, DatasetResponseSerializer, TempTokenSerializer,
-    ProjectResponseSerializer
+    ProjectResponseSerializer, ExperimentBatchSerializer
 )
 from ..permissions import NestedPerms, update_perms, SameUser
 from rest_framework.exceptions import PermissionDenied
@@ -37,8 +46,9 @@ from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
 
-from onedata_api.middleware import create_new_dataset, create_public_share, establish_dataset, rename_entry, \
-    create_new_experiment, create_new_temp_token, get_file_metadata
+from onedata_api.middleware import create_new_dataset, create_public_share, establish_dataset, \
+    create_new_experiment, create_new_temp_token, get_file_metadata, remove_entries
+from onedata_api.provisioning import enqueue_provisioning, enqueue_rename
 
 
 class ProfileViewSet(viewsets.ModelViewSet):
@@ -190,35 +200,32 @@ class DatasetViewSet(viewsets.ModelViewSet):
         if not serializer.is_valid(raise_exception=True):
             return Response(serializer.errors, status=400)
 
-        if old_dataset.name != request.data.get('name'):
-            rename_entry(old_dataset.project, old_dataset.onedata_file_id, request.data.get('name'))
+        response = super().update(request, *args, **kwargs)
 
-        return super().update(request, *args, **kwargs)
+        # the Onedata folder is renamed in the background, see `onedata_api.provisioning`
+        if old_dataset.name != request.data.get('name') and old_dataset.onedata_file_id:
+            enqueue_rename(old_dataset, user=request.user)
+
+        return response
 
     def partial_update(self, request, *args, **kwargs):
         kwargs['partial'] = True
         return super().update(request, *args, **kwargs)
 
     def create(self, request, *args, **kwargs):
-        serializer = DatasetSerializer(data=request.data)
-        if not serializer.is_valid(raise_exception=True):
-            return Response(serializer.errors, status=400)
-        
-        project = Project.objects.get(id=request.data.get('project'))
-        folder, err_folder = create_new_dataset(project, request.data.get('name'))
-        if err_folder:
-            raise ValueError(err_folder)
-        
-        request.data["onedata_file_id"] = folder.file_id
+        """
+        Store the dataset and return 202. The Onedata folder, public share and Onedata
+        dataset are provisioned by a background job, see `onedata_api.provisioning`.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-        share, err_share = create_public_share(project, request.data.get('name'), request.data.get('description'), folder)
-        request.data["onedata_share_id"] = share.share_id
+        with transaction.atomic():
+            self.perform_create(serializer)
+            enqueue_provisioning(serializer.instance, request.user)
 
-        # Returns dataset id
-        datasetId, err_dataset = establish_dataset(project, folder)
-        request.data["onedata_dataset_id"] = datasetId
-        
-        return super().create(request, *args, **kwargs)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED, headers=headers)
     
     @action(detail=False, methods=['post'])
     def create_public_share(self, request, *args, **kwargs):
@@ -292,6 +299,8 @@ class ExperimentViewSet(viewsets.ModelViewSet):
             return Response(serializer.errors, status=400)
 
         dataset = Dataset.objects.get(id=request.data.get('dataset'))
+        if not dataset.onedata_file_id:
+            return Response({"error": "The dataset is still being provisioned."}, status=status.HTTP_409_CONFLICT)
         folder, err_folder = create_new_experiment(dataset, str(uuid.uuid4()))
         if err_folder:
             raise ValueError(err_folder)
@@ -300,6 +309,57 @@ class ExperimentViewSet(viewsets.ModelViewSet):
 
         return super().create(request, *args, **kwargs)
 
+    @extend_schema(
+        request=ExperimentBatchSerializer,
+        responses={
+            201: OpenApiResponse(response=ExperimentSerializer(many=True), description='Created experiments'),
+            409: OpenApiResponse(description='The dataset is still being provisioned'),
+            502: OpenApiResponse(description='Some Onedata directories could not be created, nothing was stored '
+                                             'and the created ones were removed'),
+        }
+    )
+    @action(detail=False, methods=['post'])
+    def batch(self, request, *args, **kwargs):
+        """
+        Create several experiments of one dataset. The Onedata directories are created
+        concurrently, the experiments and their permission groups in one transaction.
+        """
+        serializer = ExperimentBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dataset = serializer.validated_data["dataset"]
+        items = serializer.validated_data["experiments"]
+
+        if not dataset.perm_atleast(request, PermsGroup.EDITOR):
+            raise PermissionDenied()
+        if not dataset.onedata_file_id:
+            return Response({"error": "The dataset is still being provisioned."}, status=status.HTTP_409_CONFLICT)
+
+        # worker threads only talk to Onedata
+        names = [str(uuid.uuid4()) for _ in items]
+        with ThreadPoolExecutor(max_workers=settings.ONEDATA_BATCH_CONCURRENCY) as executor:
+            folders = list(executor.map(lambda name: create_new_experiment(dataset, name), names))
+
+        errors = {str(index): error["error"] for index, (_, error) in enumerate(folders) if error}
+        if errors:
+            # failed directories are removed by create_new_experiment, the others would be orphans
+            cleanup_errors = remove_entries(dataset.project, [folder.file_id for folder, error in folders if not error],
+                                            parent_id=dataset.onedata_file_id)
+            if cleanup_errors:
+                print(f"Failed to remove experiment directories of a failed batch. {cleanup_errors}", flush=True)
+            return Response({"errors": errors}, status=status.HTTP_502_BAD_GATEWAY)
+
+        with transaction.atomic():
+            experiments = Experiment.objects.bulk_create([
+                Experiment(**item, dataset=dataset, onedata_file_id=folder.file_id, created_by=request.user)
+                for item, (folder, _) in zip(items, folders)
+            ])
+            create_perms_groups(experiments)
+            # bulk_create() sends no post_save, so index the search documents and publish the status events here
+            index_objects(experiments)
+            publish([status_event(experiment) for experiment in experiments])
+
+        return Response(ExperimentSerializer(experiments, many=True).data, status=status.HTTP_201_CREATED)
+
     def update(self, request, *args, **kwargs):
         serializer = ExperimentSerializer(data=request.data)
 
@@ -308,10 +368,13 @@ class ExperimentViewSet(viewsets.ModelViewSet):
         if not serializer.is_valid(raise_exception=True):
             return Response(serializer.errors, status=400)
 
-        if old_experiment.name != request.data.get('name'):
-            rename_entry(old_experiment.dataset.project, old_experiment.onedata_file_id, request.data.get('name'))
+        response = super().update(request, *args, **kwargs)
 
-        return super().update(request, *args, **kwargs)
+        # the Onedata folder is renamed in the background, see `onedata_api.provisioning`
+        if old_experiment.name != request.data.get('name') and old_experiment.onedata_file_id:
+            enqueue_rename(old_experiment, user=request.user)
+
+        return response
 
     def partial_update(self, request, *args, **kwargs):
         kwargs['partial'] = True
@@ -334,6 +397,17 @@ class InstrumentViewSet(viewsets.ModelViewSet):
             return Response("Instrument not found", status=status.HTTP_404_NOT_FOUND)
 
 
+def instrument_reservations(instrument):
+    """Reservations of the instrument with the status of the dataset created for each of them."""
+    dataset_status = Dataset.objects.filter(reservationId=Cast(OuterRef("pk"), CharField())).values("status")[:1]
+    return Reservation.objects.filter(instrument=instrument).annotate(dataset_status=Subquery(dataset_status))
+
+
+def default_project_id(instrument):
+    project = instrument.facility.project_set.first()
+    return project.id if project else None
+
+
 class ReservationListView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -347,58 +421,26 @@ class ReservationListView(APIView):
         }
     )
     def get(self, request, *args, **kwargs):
-        date_from = request.query_params.get("date_from") or datetime.now(timezone.utc).isoformat()
-        date_to = request.query_params.get("date_to") or (datetime.now(timezone.utc) + timedelta(days=1)).isoforxmat()
-        project = request.user.instrument.facility.project_set.first()
-
-        reservations = [
-            {
-                "id": "b171517a-a79a-4170-bef5-ffe93519ba92",
-                "name": "Reservation 1",
-                "from_date": (datetime.now(timezone.utc) + timedelta(hours=-5)).isoformat(),
-                "to_date": (datetime.now(timezone.utc) + timedelta(hours=-3)).isoformat(),
-                "user": "David Konečný",
-                "description": "This is a test reservation",
-            },
-            {
-                "id": "cee6d34b-991d-4691-b7da-c65f1fa17492",
-                "name": "Reservation 2",
-                "from_date": (datetime.now(timezone.utc) + timedelta(hours=-1)).isoformat(),
-                "to_date": (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat(),
-                "user": "David Konečný",
-                "description": "This is a test reservation",
-            },
-            {
-                "id": "1cb2a4dd-702c-4d92-a360-d649a230dc37",
-                "name": "Reservation 3",
-                "from_date": (datetime.now(timezone.utc) + timedelta(hours=2)).isoformat(),
-                "to_date": (datetime.now(timezone.utc) + timedelta(hours=5)).isoformat(),
-                "user": "David Konečný",
-                "description": "This is a test reservation",
-            }
-        ]
-
-        for reservation in reservations:
-            reservation["project_id"] = str(project.id)
+        instrument = getattr(request.user, "instrument", None)
+        if instrument is None:
+            return Response({"error": "Instrument not found"}, status=status.HTTP_404_NOT_FOUND)
 
         try:
-            date_from_parsed = datetime.fromisoformat(date_from)
-            date_to_parsed = datetime.fromisoformat(date_to)
-
-            reservations = [
-                event for event in reservations
-                if datetime.fromisoformat(event["from_date"]) <= date_to_parsed and date_from_parsed <= datetime.fromisoformat(event["to_date"])
-            ]
-
-            # Serialize the filtered data
-            serializer = ReservationSerializer(data=reservations, many=True)
-            if serializer.is_valid():
-                return Response(serializer.data, status=status.HTTP_200_OK)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
+            date_from = datetime.fromisoformat(request.query_params.get("date_from")) \
+                if request.query_params.get("date_from") else datetime.now(timezone.utc)
+            date_to = datetime.fromisoformat(request.query_params.get("date_to")) \
+                if request.query_params.get("date_to") else datetime.now(timezone.utc) + timedelta(days=1)
         except ValueError as e:
             return Response({"error": "Invalid date format", "details": str(e)},
                             status=status.HTTP_400_BAD_REQUEST)
+        date_from, date_to = [value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+                              for value in (date_from, date_to)]
+
+        reservations = instrument_reservations(instrument) \
+            .filter(period__overlap=DateTimeTZRange(date_from, date_to, "[]")).order_by("period")
+        serializer = ReservationSerializer(reservations, many=True,
+                                           context={"default_project_id": default_project_id(instrument)})
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 class ReservationDetailView(APIView):
@@ -411,42 +453,15 @@ class ReservationDetailView(APIView):
         }
     )
     def get(self, request, id, *args, **kwargs):
-        reservations = [
-            {
-                "id": "b171517a-a79a-4170-bef5-ffe93519ba92",
-                "name": "Reservation 1",
-                "from_date": (datetime.now(timezone.utc) + timedelta(hours=-5)).isoformat(),
-                "to_date": (datetime.now(timezone.utc) + timedelta(hours=-3)).isoformat(),
-                "user": "David Konečný",
-                "description": "This is a test reservation",
-            },
-            {
-                "id": "cee6d34b-991d-4691-b7da-c65f1fa17492",
-                "name": "Reservation 2",
-                "from_date": (datetime.now(timezone.utc) + timedelta(hours=-1)).isoformat(),
-                "to_date": (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat(),
-                "user": "David Konečný",
-                "description": "This is a test reservation",
-            },
-            {
-                "id": "1cb2a4dd-702c-4d92-a360-d649a230dc37",
-                "name": "Reservation 3",
-                "from_date": (datetime.now(timezone.utc) + timedelta(hours=2)).isoformat(),
-                "to_date": (datetime.now(timezone.utc) + timedelta(hours=5)).isoformat(),
-                "user": "David Konečný",
-                "description": "This is a test reservation",
-            }
-        ]
+        instrument = getattr(request.user, "instrument", None)
+        if instrument is None:
+            return Response({"error": "Instrument not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        try:
-            reservation = next((reservation for reservation in reservations if reservation.get("id") == str(id)), None)
-            project = request.user.instrument.facility.project_set.first()
-            reservation["project_id"] = str(project.id)
-            if reservation:
-                return Response(reservation, status=status.HTTP_200_OK)
+        reservation = instrument_reservations(instrument).filter(pk=id).first()
+        if reservation is None:
             return Response({"error": "Reservation not found"}, status=status.HTTP_404_NOT_FOUND)
-        except ValueError:
-            return Response({"error": "Invalid reservation ID format"}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ReservationSerializer(reservation, context={"default_project_id": default_project_id(instrument)})
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 class TempTokenAPIView(APIView):
     permission_classes = [IsAuthenticated]
@@ -2,6 +2,8 @@
 ASGI config for dareg project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Production runs it in gunicorn with uvicorn workers (see init.sh); long-lived
+responses such as the status event stream (``api.events``) need it.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
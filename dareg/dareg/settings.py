@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "django_extensions",
     "rest_framework",
     "debug_toolbar",
@@ -101,6 +102,19 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Shared by all processes (temporary token locks, Onedata listing and path caches),
+# the database table is created by `manage.py createcachetable`
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.db.DatabaseCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "dareg_cache"),
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -185,6 +199,102 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
+# Metadata search
+# Plain text queries (`q` without filters) are answered from the SearchDocument table,
+# enable only after `rebuild_search_index` has filled it
+SEARCH_USE_DOCUMENTS = os.getenv("SEARCH_USE_DOCUMENTS", "false").lower() == "true"
+SEARCH_SIMILARITY_THRESHOLD = float(os.getenv("SEARCH_SIMILARITY_THRESHOLD", "0.1"))
+# Dotted metadata paths (separated by spaces) that get trigram expression indexes
+# via `manage.py create_metadata_indexes`, so `$regex` filters on them are index-backed.
+SEARCH_METADATA_INDEX_PATHS = os.getenv("SEARCH_METADATA_INDEX_PATHS", "").split()
+
+# Onedata
+# Pool size, timeouts (seconds) and retries shared by all outbound Onedata calls
+ONEDATA_POOL_SIZE = int(os.getenv("ONEDATA_POOL_SIZE", "10"))
+ONEDATA_CONNECT_TIMEOUT = float(os.getenv("ONEDATA_CONNECT_TIMEOUT", "5"))
+ONEDATA_READ_TIMEOUT = float(os.getenv("ONEDATA_READ_TIMEOUT", "30"))
+ONEDATA_RETRIES = int(os.getenv("ONEDATA_RETRIES", "3"))
+ONEDATA_BACKOFF = float(os.getenv("ONEDATA_BACKOFF", "0.5"))
+# Space metadata and root directory ids never change for a space
+ONEDATA_SPACE_CACHE_TTL = int(os.getenv("ONEDATA_SPACE_CACHE_TTL", str(7 * 24 * 3600)))
+# Datasets processed in parallel by the DatasetAdmin bulk actions
+ONEDATA_BATCH_CONCURRENCY = int(os.getenv("ONEDATA_BATCH_CONCURRENCY", "4"))
+# Paths of Onedata entries, updated whenever DAREG creates or renames them
+ONEDATA_PATH_CACHE_TTL = int(os.getenv("ONEDATA_PATH_CACHE_TTL", str(24 * 3600)))
+# Directory listings are cached briefly; requests with `limit`, `token` or `offset` are served in pages
+# of at most ONEDATA_LISTING_MAX_PAGE_SIZE, the others get the whole listing
+ONEDATA_LISTING_CACHE_TTL = int(os.getenv("ONEDATA_LISTING_CACHE_TTL", "30"))
+ONEDATA_LISTING_PAGE_SIZE = int(os.getenv("ONEDATA_LISTING_PAGE_SIZE", "100"))
+ONEDATA_LISTING_MAX_PAGE_SIZE = int(os.getenv("ONEDATA_LISTING_MAX_PAGE_SIZE", "1000"))
+# Onezone issuing temporary tokens; tokens are valid for ONEDATA_TEMP_TOKEN_TTL seconds and
+# reused until ONEDATA_TEMP_TOKEN_MARGIN seconds before they expire
+ONEZONE_URL = os.getenv("ONEZONE_URL", "https://onezone.devel.onedata.e-infra.cz")
+ONEDATA_TEMP_TOKEN_TTL = int(os.getenv("ONEDATA_TEMP_TOKEN_TTL", str(5 * 3600)))
+ONEDATA_TEMP_TOKEN_MARGIN = int(os.getenv("ONEDATA_TEMP_TOKEN_MARGIN", str(30 * 60)))
+# Change stream consumer: events per batch, seconds to wait for a full batch, and seconds
+# without changes after which a finished experiment (end_time set) is SUCCESS (0 disables)
+ONEDATA_CHANGES_BATCH_SIZE = int(os.getenv("ONEDATA_CHANGES_BATCH_SIZE", "500"))
+ONEDATA_CHANGES_FLUSH_INTERVAL = float(os.getenv("ONEDATA_CHANGES_FLUSH_INTERVAL", "5"))
+ONEDATA_CHANGES_IDLE_TIMEOUT = int(os.getenv("ONEDATA_CHANGES_IDLE_TIMEOUT", "600"))
+# Worker threads and overall deadline (seconds) for independent calls run in parallel
+ONEDATA_PARALLEL_CALLS = int(os.getenv("ONEDATA_PARALLEL_CALLS", "8"))
+ONEDATA_CALL_DEADLINE = float(os.getenv("ONEDATA_CALL_DEADLINE", "60"))
+
+# Outbound calls to external services (api.resilience)
+# Consecutive failures opening a circuit and seconds until a probe call is let through
+RESILIENCE_FAILURE_THRESHOLD = int(os.getenv("RESILIENCE_FAILURE_THRESHOLD", "5"))
+RESILIENCE_RESET_TIMEOUT = float(os.getenv("RESILIENCE_RESET_TIMEOUT", "30"))
+# Concurrent calls per service and facility, and seconds to wait for a free slot
+RESILIENCE_BULKHEAD_LIMIT = int(os.getenv("RESILIENCE_BULKHEAD_LIMIT", "10"))
+RESILIENCE_BULKHEAD_WAIT = float(os.getenv("RESILIENCE_BULKHEAD_WAIT", "1"))
+# (connect, read) timeouts in seconds per service
+RESILIENCE_TIMEOUTS = {
+    "onedata": (ONEDATA_CONNECT_TIMEOUT, ONEDATA_READ_TIMEOUT),
+    "onezone": (ONEDATA_CONNECT_TIMEOUT, ONEDATA_READ_TIMEOUT),
+    "datacite": (float(os.getenv("DATACITE_CONNECT_TIMEOUT", "5")), float(os.getenv("DATACITE_READ_TIMEOUT", "30"))),
+    "booking": (float(os.getenv("BOOKING_CONNECT_TIMEOUT", "5")), float(os.getenv("BOOKING_READ_TIMEOUT", "30"))),
+}
+
+# DataCite client (datacite_api.client): pooled connections, seconds a cached DOI record is
+# served without revalidation, and seconds it is kept at all
+DATACITE_POOL_SIZE = int(os.getenv("DATACITE_POOL_SIZE", "10"))
+DATACITE_CACHE_FRESH = int(os.getenv("DATACITE_CACHE_FRESH", "300"))
+DATACITE_CACHE_TTL = int(os.getenv("DATACITE_CACHE_TTL", str(7 * 24 * 3600)))
+# Bulk DOI registration: concurrent requests and requests per second
+DATACITE_MINT_CONCURRENCY = int(os.getenv("DATACITE_MINT_CONCURRENCY", "4"))
+DATACITE_MINT_RATE = float(os.getenv("DATACITE_MINT_RATE", "5"))
+
+# Facility booking system the reservations are imported from by `manage.py sync_reservations`
+# (api.reservation_sync), and the number of records upserted at once
+RESERVATION_SOURCE = os.getenv("RESERVATION_SOURCE", "api.reservation_sync.HttpReservationSource")
+RESERVATION_SOURCE_OPTIONS = {
+    key: value for key, value in {
+        "url": os.getenv("BOOKING_API_URL"),
+        "token": os.getenv("BOOKING_API_TOKEN"),
+        "path": os.getenv("BOOKING_FILE"),
+    }.items() if value
+}
+RESERVATION_SYNC_BATCH_SIZE = int(os.getenv("RESERVATION_SYNC_BATCH_SIZE", "500"))
+
+# Status event streams (api.events): seconds between keep-alive comments, seconds a stream
+# stays open, client reconnection delay in ms, and seconds between permission reloads
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+EVENTS_MAX_DURATION = float(os.getenv("EVENTS_MAX_DURATION", "300"))
+EVENTS_RETRY_MS = int(os.getenv("EVENTS_RETRY_MS", "3000"))
+EVENTS_PERMISSION_REFRESH = float(os.getenv("EVENTS_PERMISSION_REFRESH", "60"))
+
+# Instrument telemetry (api.telemetry): samples and seconds a batch may hold, seconds sample
+# times may be ahead of the server clock, timeline points returned, longest span served from
+# raw samples in seconds, days the raw samples are kept (the rollups are kept), and monthly
+# partitions created ahead by `manage.py maintain_telemetry`
+TELEMETRY_MAX_SAMPLES = int(os.getenv("TELEMETRY_MAX_SAMPLES", "10000"))
+TELEMETRY_MAX_BATCH_SPAN = int(os.getenv("TELEMETRY_MAX_BATCH_SPAN", "86400"))
+TELEMETRY_MAX_CLOCK_SKEW = int(os.getenv("TELEMETRY_MAX_CLOCK_SKEW", "3600"))
+TELEMETRY_MAX_POINTS = int(os.getenv("TELEMETRY_MAX_POINTS", "1000"))
+TELEMETRY_RAW_SPAN = int(os.getenv("TELEMETRY_RAW_SPAN", "3600"))
+TELEMETRY_RAW_RETENTION_DAYS = int(os.getenv("TELEMETRY_RAW_RETENTION_DAYS", "90"))
+TELEMETRY_PARTITIONS_AHEAD = int(os.getenv("TELEMETRY_PARTITIONS_AHEAD", "2"))
+
 # Django Debug Toolbar
 INTERNAL_IPS = [
     "127.0.0.1",
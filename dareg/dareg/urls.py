@@ -2,9 +2,13 @@ from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import RedirectView
 from rest_framework import routers
+from api.events import status_events
 from api.views import views
 from api.views.query import GeneralSearchViewSet
 from api.views.schemas import SchemaMetadataFieldsView
+from api.views.services import ServiceStateView
+from api.views.suggest import SuggestView
+from api.views.telemetry import TelemetryView, ExperimentTimelineView, InstrumentTimelineView
 from onedata_api.urls import urlpatterns as onedata_router
 from datacite_api.urls import urlpatterns as datacite_router
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
@@ -25,6 +29,12 @@ router.register(r'query', GeneralSearchViewSet, basename='query')
 urlpatterns = [
     path("api/v1/", include(router.urls)),
     path("api/v1/schemas/<uuid:schema_id>/fields/", SchemaMetadataFieldsView.as_view(), name="schema-fields"),
+    path("api/v1/suggest/", SuggestView.as_view(), name="suggest"),
+    path("api/v1/services/", ServiceStateView.as_view(), name="services"),
+    path("api/v1/events/", status_events, name="events"),
+    path("api/v1/telemetry/", TelemetryView.as_view(), name="telemetry"),
+    path("api/v1/telemetry/experiments/<uuid:id>/", ExperimentTimelineView.as_view(), name="telemetry-experiment"),
+    path("api/v1/telemetry/instruments/<uuid:id>/", InstrumentTimelineView.as_view(), name="telemetry-instrument"),
     path("onedata-api/v1/", include(onedata_router)),
     path("datacite-api/v1/", include(datacite_router)),
     path("", RedirectView.as_view(url="api/v1", permanent=True)),
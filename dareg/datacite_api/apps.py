@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DataciteApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'datacite_api'
+
+    def ready(self):
+        # register job handlers
+        from datacite_api import minting  # noqa: F401
@@ -0,0 +1,113 @@
+"""
+Pooled DataCite REST client with a per-DOI record cache.
+
+Records are served from the cache for DATACITE_CACHE_FRESH seconds. Older records are
+still returned immediately while a background request revalidates them with
+`If-None-Match`; records older than DATACITE_CACHE_TTL seconds are dropped. Our own
+writes (create, update, delete) invalidate the record.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+from api import resilience
+
+DATACITE_API_URL = os.getenv("DATACITE_API_URL", "https://api.test.datacite.org/dois")
+DATACITE_API_USERNAME = os.getenv("DATACITE_API_USERNAME", "")
+DATACITE_API_PASSWORD = os.getenv("DATACITE_API_PASSWORD", "")
+
+session = requests.Session()
+session.auth = (DATACITE_API_USERNAME, DATACITE_API_PASSWORD)
+session.headers.update({"Content-Type": "application/vnd.api+json"})
+session.mount("https://", HTTPAdapter(pool_maxsize=settings.DATACITE_POOL_SIZE))
+session.mount("http://", HTTPAdapter(pool_maxsize=settings.DATACITE_POOL_SIZE))
+
+_revalidation = ThreadPoolExecutor(max_workers=2, thread_name_prefix="datacite")
+_revalidating = set()
+_revalidating_lock = threading.Lock()
+
+
+def datacite_request(method, url, **kwargs) -> requests.Response:
+    return resilience.request("datacite", "datacite", method, url, session=session, **kwargs)
+
+
+def doi_cache_key(doi: str) -> str:
+    return f"datacite:doi:{doi}"
+
+
+def invalidate_doi(doi: str):
+    if doi:
+        cache.delete(doi_cache_key(doi))
+
+
+def fetch_doi(doi: str, cached: dict = None) -> dict:
+    """Fetch the record, conditionally when a cached copy with an ETag exists, and cache it."""
+    headers = {"If-None-Match": cached["etag"]} if cached and cached.get("etag") else {}
+    response = datacite_request("GET", f"{DATACITE_API_URL}/{doi}", headers=headers)
+    if response.status_code == 304:
+        entry = {**cached, "fetched": time.time()}
+    else:
+        response.raise_for_status()
+        entry = {"data": response.json()["data"], "etag": response.headers.get("ETag"), "fetched": time.time()}
+    cache.set(doi_cache_key(doi), entry, settings.DATACITE_CACHE_TTL)
+    return entry
+
+
+def revalidate_in_background(doi: str, cached: dict):
+    with _revalidating_lock:
+        if doi in _revalidating:
+            return
+        _revalidating.add(doi)
+
+    def revalidate():
+        try:
+            fetch_doi(doi, cached)
+        except Exception as e:
+            print(f"Failed to revalidate DOI {doi}. {e}", flush=True)
+        finally:
+            with _revalidating_lock:
+                _revalidating.discard(doi)
+
+    _revalidation.submit(revalidate)
+
+
+def get_doi(doi: str, refresh: bool = False) -> dict:
+    """Return the `data` member of the DOI record."""
+    cached = cache.get(doi_cache_key(doi))
+    if cached is None or refresh:
+        return fetch_doi(doi, cached)["data"]
+    if time.time() - cached["fetched"] > settings.DATACITE_CACHE_FRESH:
+        revalidate_in_background(doi, cached)
+    return cached["data"]
+
+
+def find_doi(url: str):
+    """Return a DOI of our repository whose landing page is `url`, or None."""
+    response = datacite_request("GET", DATACITE_API_URL, params={"query": f'url:"{url}"', "page[size]": 1})
+    response.raise_for_status()
+    records = response.json().get("data") or []
+    return records[0]["id"] if records else None
+
+
+def create_doi(metadata: dict) -> requests.Response:
+    return datacite_request("POST", DATACITE_API_URL, json=metadata)
+
+
+def update_doi(doi: str, metadata: dict) -> requests.Response:
+    try:
+        return datacite_request("PUT", f"{DATACITE_API_URL}/{doi}/", json=metadata)
+    finally:
+        invalidate_doi(doi)
+
+
+def delete_doi(doi: str) -> requests.Response:
+    try:
+        return datacite_request("DELETE", f"{DATACITE_API_URL}/{doi}/")
+    finally:
+        invalidate_doi(doi)
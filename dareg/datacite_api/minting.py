@@ -0,0 +1,103 @@
+"""
+Bulk DOI registration as a background job (`api.jobs`).
+
+Payloads of all datasets are built up front from one query, then submitted to DataCite by
+DATACITE_MINT_CONCURRENCY threads paced to DATACITE_MINT_RATE requests per second. Results
+are stored per dataset in `Job.results`; a retried job skips registered datasets.
+
+A request failing without a response (e.g. a timeout) may still have registered the DOI, so
+DataCite is searched for a DOI with the dataset URL before registering it again.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from django.conf import settings
+
+from api.jobs import enqueue, job_handler, save_job_progress
+from api.models import Dataset
+from api.resilience import RateLimiter
+from datacite_api import client
+from datacite_api.backends import build_datacite_request
+
+
+class MintingError(Exception):
+    pass
+
+
+def registered_doi(metadata: dict, limiter: RateLimiter):
+    limiter.acquire()
+    return client.find_doi(metadata["data"]["attributes"]["url"])
+
+
+def mint(metadata: dict, limiter: RateLimiter, retry=False) -> str:
+    """Register one DOI, return it. A `retry` returns the DOI registered by a previous attempt."""
+    doi = registered_doi(metadata, limiter) if retry else None
+    if doi:
+        return doi
+    limiter.acquire()
+    try:
+        response = client.create_doi(metadata)
+    except requests.RequestException:
+        doi = registered_doi(metadata, limiter)
+        if doi:
+            return doi
+        raise
+    if response.status_code != 201:
+        try:
+            errors = "; ".join(error.get("title", "") for error in response.json().get("errors", []))
+        except ValueError:
+            errors = ""
+        raise MintingError(f"DataCite returned {response.status_code}. {errors}".strip())
+    return response.json()["data"]["id"]
+
+
+@job_handler("mint_dois")
+def mint_dois(job):
+    """
+    Register DOIs for the datasets of `payload["dataset_ids"]`. A failing dataset is recorded
+    in `job.results` and does not stop the batch.
+    """
+    done = {key for key, result in job.results.items() if result["status"] != "failure"}
+    datasets = Dataset.objects.select_related("created_by", "project__facility") \
+        .filter(pk__in=job.payload["dataset_ids"]).exclude(pk__in=done)
+
+    job.failed = 0
+    job.processed = len(done)
+    payloads = {}
+    for dataset in datasets:
+        if dataset.doi:
+            job.results[str(dataset.pk)] = {"status": "skipped", "doi": dataset.doi, "error": None}
+            job.processed += 1
+            continue
+        try:
+            payloads[dataset.pk] = build_datacite_request(dataset)
+        except Exception as e:
+            job.results[str(dataset.pk)] = {"status": "failure", "doi": None, "error": str(e)}
+            job.processed += 1
+            job.failed += 1
+    save_job_progress(job)
+
+    # worker threads only talk to DataCite, the results are saved here
+    limiter = RateLimiter(settings.DATACITE_MINT_RATE)
+    with ThreadPoolExecutor(max_workers=settings.DATACITE_MINT_CONCURRENCY) as executor:
+        # datasets with a result failed in a previous attempt
+        futures = {executor.submit(mint, payload, limiter, str(pk) in job.results): pk
+                   for pk, payload in payloads.items()}
+        for future in as_completed(futures):
+            pk = futures[future]
+            try:
+                doi = future.result()
+            except Exception as e:
+                job.results[str(pk)] = {"status": "failure", "doi": None, "error": str(e)}
+                job.failed += 1
+            else:
+                Dataset.objects.filter(pk=pk).update(doi=doi)
+                job.results[str(pk)] = {"status": "success", "doi": doi, "error": None}
+            job.processed += 1
+            save_job_progress(job)
+
+
+def enqueue_minting(datasets, user=None):
+    dataset_ids = [str(pk) for pk in datasets.values_list("pk", flat=True)]
+    return enqueue("mint_dois", {"dataset_ids": dataset_ids}, created_by=user, total=len(dataset_ids),
+                   max_attempts=3)
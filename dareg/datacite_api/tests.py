@@ -1,3 +1,198 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from api import resilience
+from api.jobs import run_pending_jobs
+from api.models import Dataset, Facility, JobStatus, Project
+from datacite_api import client
+from datacite_api.minting import enqueue_minting
+
+
+class FakeDataCiteHandler(BaseHTTPRequestHandler):
+    requests = []  # (method, path, If-None-Match)
+    etag = '"v1"'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append(("GET", self.path, self.headers.get("If-None-Match")))
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.send_header("ETag", self.etag)
+            self.end_headers()
+            return
+        doi = self.path[len("/dois/"):]
+        body = json.dumps({"data": {"id": doi, "attributes": {"state": "draft", "version": self.etag}}}).encode()
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.requests.append(("PUT", self.path, None))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+# the shared cache lives in the database, which a SimpleTestCase may not use
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class DoiCacheTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        resilience.reset()
+        FakeDataCiteHandler.requests = []
+        FakeDataCiteHandler.etag = '"v1"'
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeDataCiteHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        patcher = mock.patch.object(client, "DATACITE_API_URL", f"http://127.0.0.1:{self.server.server_port}/dois")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fresh_record_served_from_cache(self):
+        self.assertEqual(client.get_doi("10.1234/abc")["id"], "10.1234/abc")
+        self.assertEqual(client.get_doi("10.1234/abc")["id"], "10.1234/abc")
+        self.assertEqual(len(FakeDataCiteHandler.requests), 1)
+
+    def test_stale_record_revalidated_with_etag(self):
+        client.get_doi("10.1234/abc")
+        cached = cache.get(client.doi_cache_key("10.1234/abc"))
+
+        entry = client.fetch_doi("10.1234/abc", cached)
+        self.assertEqual(FakeDataCiteHandler.requests[-1], ("GET", "/dois/10.1234/abc", '"v1"'))
+        self.assertEqual(entry["data"], cached["data"])
+        self.assertGreaterEqual(entry["fetched"], cached["fetched"])
+
+        FakeDataCiteHandler.etag = '"v2"'
+        with override_settings(DATACITE_CACHE_FRESH=-1):
+            self.assertEqual(client.get_doi("10.1234/abc")["attributes"]["version"], '"v1"')
+        for _ in range(100):  # wait for the background revalidation
+            if not client._revalidating:
+                break
+            time.sleep(0.02)
+        self.assertEqual(client.get_doi("10.1234/abc")["attributes"]["version"], '"v2"')
+
+    def test_update_invalidates_record(self):
+        client.get_doi("10.1234/abc")
+        client.update_doi("10.1234/abc", {"data": {}})
+        self.assertIsNone(cache.get(client.doi_cache_key("10.1234/abc")))
+        client.get_doi("10.1234/abc")
+        self.assertEqual([method for method, _, _ in FakeDataCiteHandler.requests], ["GET", "PUT", "GET"])
+
+
+class MintDoisTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass", first_name="Test",
+                                             last_name="User")
+        self.facility = Facility.objects.create(name="Test Facility", created_by=self.user)
+        self.project = Project.objects.create(name="Test Project", facility=self.facility, description="desc",
+                                              created_by=self.user)
+        self.ok, self.rejected, self.registered = [
+            Dataset.objects.create(name=name, project=self.project, description="desc", created_by=self.user, doi=doi)
+            for name, doi in [("ok", None), ("rejected", None), ("registered", "10.1234/registered")]
+        ]
+        self.reject = {"rejected"}
+
+    def fake_create(self, metadata):
+        name = metadata["data"]["attributes"]["titles"][0]["title"]
+        if name in self.reject:
+            return mock.MagicMock(status_code=422, json=lambda: {"errors": [{"title": "invalid"}]})
+        return mock.MagicMock(status_code=201, json=lambda: {"data": {"id": f"10.1234/{name}"}})
+
+    @mock.patch("datacite_api.client.create_doi")
+    def test_failures_are_recorded_and_retried(self, mock_create):
+        mock_create.side_effect = self.fake_create
+        job = enqueue_minting(Dataset.objects.filter(project=self.project), self.user)
+        run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.SUCCESS)
+        self.assertEqual((job.processed, job.failed), (3, 1))
+        self.assertEqual(job.results[str(self.ok.pk)], {"status": "success", "doi": "10.1234/ok", "error": None})
+        self.assertEqual(job.results[str(self.registered.pk)]["status"], "skipped")
+        self.assertIn("invalid", job.results[str(self.rejected.pk)]["error"])
+        self.ok.refresh_from_db()
+        self.assertEqual(self.ok.doi, "10.1234/ok")
+        self.assertEqual(mock_create.call_count, 2)
+
+        # a rerun only submits the failed dataset
+        self.reject = set()
+        job.status = JobStatus.PENDING
+        job.save()
+        run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual((job.processed, job.failed), (3, 0))
+        self.assertEqual(job.results[str(self.rejected.pk)]["doi"], "10.1234/rejected")
+        self.assertEqual(mock_create.call_count, 3)
+
+    @mock.patch("datacite_api.client.find_doi")
+    @mock.patch("datacite_api.client.create_doi")
+    def test_timed_out_registration_is_found(self, mock_create, mock_find):
+        registered = {}
+
+        def create_and_time_out(metadata):
+            registered[metadata["data"]["attributes"]["url"]] = "10.1234/ok"
+            raise requests.Timeout("read timed out")
+
+        mock_create.side_effect = create_and_time_out
+        mock_find.side_effect = registered.get
+        enqueue_minting(Dataset.objects.filter(pk=self.ok.pk), self.user)
+        run_pending_jobs()
+
+        self.ok.refresh_from_db()
+        self.assertEqual(self.ok.doi, "10.1234/ok")
+        self.assertEqual(mock_create.call_count, 1)
+
+    @mock.patch("datacite_api.client.find_doi")
+    @mock.patch("datacite_api.client.create_doi")
+    def test_retry_looks_up_previous_registration(self, mock_create, mock_find):
+        mock_create.side_effect = requests.ConnectionError("connection reset")
+        mock_find.return_value = None
+        job = enqueue_minting(Dataset.objects.filter(pk=self.ok.pk), self.user)
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.failed, 1)
+
+        # DataCite indexed the DOI registered by the lost request in the meantime
+        mock_find.return_value = "10.1234/ok"
+        job.status = JobStatus.PENDING
+        job.save()
+        run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.results[str(self.ok.pk)]["doi"], "10.1234/ok")
+        self.assertEqual(mock_create.call_count, 1)
+
+
+class DoiBatchViewTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.url = reverse("doi-batch")
+
+    def test_anonymous_requests_are_rejected(self):
+        job = enqueue_minting(Dataset.objects.none())
+        self.assertEqual(self.client.get(self.url, {"job_id": job.pk}).status_code, 401)
+        self.assertEqual(self.client.post(self.url, {"dataset_ids": []}, content_type="application/json").status_code,
+                         401)
+
+    def test_owner_reads_progress(self):
+        job = enqueue_minting(Dataset.objects.none(), self.user)
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, {"job_id": job.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total"], 0)
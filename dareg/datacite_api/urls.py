@@ -1,10 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
-from .views import DoiViewSet
+from .views import DoiViewSet, DoiBatchViewSet
 
 # router = routers.DefaultRouter()
 # router.register(r"files", FilesViewSet.as_view(), basename="files")
 
 urlpatterns = [
-    path(r"dois/", DoiViewSet.as_view(), name='doi')
+    path(r"dois/", DoiViewSet.as_view(), name='doi'),
+    path(r"dois/batch/", DoiBatchViewSet.as_view(), name='doi-batch'),
 ]
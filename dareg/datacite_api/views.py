@@ -1,20 +1,19 @@
-import requests, os
+import requests
+from django.db.models import Q
 from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse, HttpResponse
-from api.models import Dataset, PermsGroup
+from api.models import Dataset, Job, PermsGroup, Project
 from rest_framework.views import APIView
 from rest_framework import permissions
 from api.permissions import NestedPerms
+from api import resilience
+from datacite_api import client
 from datacite_api.backends import build_datacite_request
+from datacite_api.minting import enqueue_minting
 
-DATACITE_API_URL = os.getenv("DATACITE_API_URL", "https://api.test.datacite.org/dois")
-DATACITE_API_USERNAME = os.getenv("DATACITE_API_USERNAME", "")
-DATACITE_API_PASSWORD = os.getenv("DATACITE_API_PASSWORD", "")
 
-headers = {
-    'Content-Type': 'application/vnd.api+json',
-}
-auth = (DATACITE_API_USERNAME, DATACITE_API_PASSWORD)
+def unavailable(error):
+    return JsonResponse({"error": f"DataCite is currently unavailable. {error}"}, status=503)
 
 
 class DoiViewSet(APIView):
@@ -28,8 +27,16 @@ class DoiViewSet(APIView):
         if current_dataset.perm_atleast(request, PermsGroup.VIEWER):
 
             if current_dataset.doi:
-                response = requests.get(f"{DATACITE_API_URL}/{current_dataset.doi}", headers=headers, auth=auth)
-                return JsonResponse(response.json()['data'])
+                try:
+                    record = client.get_doi(current_dataset.doi, refresh=request.GET.get('refresh') == 'true')
+                except requests.HTTPError as e:
+                    if e.response.status_code >= 500:
+                        return unavailable(e)
+                    return JsonResponse({"error": f"DataCite returned {e.response.status_code}."},
+                                        status=e.response.status_code)
+                except (resilience.ServiceUnavailable, requests.RequestException) as e:
+                    return unavailable(e)
+                return JsonResponse(record)
 
             else:
                 return JsonResponse({
@@ -51,7 +58,10 @@ class DoiViewSet(APIView):
 
             metadata = build_datacite_request(current_dataset)
 
-            response = requests.post(DATACITE_API_URL, json=metadata, headers=headers, auth=auth)
+            try:
+                response = client.create_doi(metadata)
+            except (resilience.ServiceUnavailable, requests.RequestException) as e:
+                return unavailable(e)
             
             if response.status_code == 201:
                 current_dataset.doi = response.json()['data']['id']
@@ -73,7 +83,10 @@ class DoiViewSet(APIView):
 
             metadata = build_datacite_request(current_dataset)
 
-            response = requests.put(f"{DATACITE_API_URL}/{current_dataset.doi}/", json=metadata, headers=headers, auth=auth)
+            try:
+                response = client.update_doi(current_dataset.doi, metadata)
+            except (resilience.ServiceUnavailable, requests.RequestException) as e:
+                return unavailable(e)
 
             return JsonResponse({
                 "success": response.status_code == 200,
@@ -89,7 +102,10 @@ class DoiViewSet(APIView):
 
         if current_dataset.perm_atleast(request, PermsGroup.EDITOR):
 
-            response = requests.delete(f"{DATACITE_API_URL}/{current_dataset.doi}/", headers=headers, auth=auth)
+            try:
+                response = client.delete_doi(current_dataset.doi)
+            except (resilience.ServiceUnavailable, requests.RequestException) as e:
+                return unavailable(e)
 
             return JsonResponse({
                 "success": response.status_code == 200,
@@ -98,3 +114,48 @@ class DoiViewSet(APIView):
 
         else:
             return HttpResponse('', status=403, content_type='text/html')
+
+
+class DoiBatchViewSet(APIView):
+    """
+    `POST {"project_id": ...}` or `POST {"dataset_ids": [...]}` registers DOIs for all given
+    datasets without one in a background job; `GET ?job_id=` reports its progress to the user who
+    started it.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+
+        job = get_object_or_404(Job, pk=request.GET.get('job_id'), kind="mint_dois")
+
+        if job.created_by_id != request.user.id:
+            return HttpResponse('', status=403, content_type='text/html')
+
+        return JsonResponse({
+            "job_id": job.id,
+            "status": job.status,
+            "total": job.total,
+            "processed": job.processed,
+            "failed": job.failed,
+            "results": job.results,
+        })
+
+    def post(self, request):
+
+        if request.data.get('project_id'):
+            project = get_object_or_404(Project, pk=request.data.get('project_id'))
+            if not project.perm_atleast(request, PermsGroup.EDITOR):
+                return HttpResponse('', status=403, content_type='text/html')
+            datasets = Dataset.objects.filter(project=project)
+        else:
+            datasets = Dataset.objects.filter(pk__in=request.data.get('dataset_ids') or [])
+            if not all(dataset.perm_atleast(request, PermsGroup.EDITOR) for dataset in datasets):
+                return HttpResponse('', status=403, content_type='text/html')
+
+        job = enqueue_minting(datasets.filter(Q(doi__isnull=True) | Q(doi="")), request.user)
+
+        return JsonResponse({
+            "job_id": job.id,
+            "total": job.total,
+        }, status=202)
@@ -0,0 +1,183 @@
+"""
+Django cache backed lookups of Onedata data.
+
+Space metadata rarely changes and is cached for a long time, so are the paths of
+entries DAREG created or renamed. Directory listings are cached briefly and invalidated explicitly by bumping a per-directory version
+whenever DAREG itself changes the directory.
+"""
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.cache import cache
+from onedata_wrapper.models.space.space_request import SpaceRequest
+
+from onedata_api.clients import token_fingerprint
+
+
+def space_cache_key(space_id: str) -> str:
+    return f"onedata:space:{space_id}"
+
+
+def get_space_info(client, space_id: str, refresh: bool = False) -> dict:
+    """
+    Return `{"space_id", "name", "root_dir_id"}` of the space.
+
+    The root directory of a space never changes, so the result is cached with a long TTL.
+    Pass `refresh=True` to bypass the cache, e.g. after a provider error.
+    """
+    key = space_cache_key(space_id)
+    info = None if refresh else cache.get(key)
+    if info is None:
+        space = client.call(client.space_api.get_space, SpaceRequest(space_id=space_id))
+        root_dir = client.call(client.file_op_api.get_root, space).root_dir
+        info = {
+            "space_id": space_id,
+            "name": getattr(space, "name", None) or getattr(root_dir, "name", None),
+            "root_dir_id": root_dir.file_id,
+        }
+        cache.set(key, info, settings.ONEDATA_SPACE_CACHE_TTL)
+    return info
+
+
+def invalidate_space_info(space_id: str):
+    cache.delete(space_cache_key(space_id))
+
+
+def path_cache_key(file_id: str) -> str:
+    return f"onedata:path:{file_id}"
+
+
+def remember_path(file_id: str, path: str, parent_id: str = None):
+    """Store the path of an entry created or renamed by DAREG."""
+    cache.set(path_cache_key(file_id), {"path": path, "parent_id": parent_id}, settings.ONEDATA_PATH_CACHE_TTL)
+
+
+def cached_entry_path(file_id: str):
+    return cache.get(path_cache_key(file_id))
+
+
+def get_entry_path(client, file_id: str, refresh: bool = False) -> dict:
+    """
+    Return `{"path", "parent_id"}` of the entry. Paths of descendants go stale when a
+    directory is renamed, callers should retry with `refresh=True` when the path is not found.
+    """
+    entry = None if refresh else cached_entry_path(file_id)
+    if entry is None:
+        response = client.request("GET", f"{client.provider_url}/data/{file_id}",
+                                  headers={"X-Auth-Token": client.token},
+                                  params=[("attribute", "path"), ("attribute", "parent_id")])
+        response.raise_for_status()
+        body = response.json()
+        entry = {"path": body["path"], "parent_id": body.get("parent_id")}
+        cache.set(path_cache_key(file_id), entry, settings.ONEDATA_PATH_CACHE_TTL)
+    return entry
+
+
+def temp_token_cache_key(facility, path: str) -> str:
+    # the fingerprint keeps tokens minted with a replaced facility token from being reused
+    return f"onedata:temp-token:{facility.pk}:{token_fingerprint(facility.onedata_token)}:{path}"
+
+
+_inflight: dict = {}
+_inflight_lock = threading.Lock()
+
+
+def coalesce(key: str, fetch):
+    """
+    Call `fetch()` once for all threads of this process asking for the same `key`
+    at the same time; the others wait for and share its result (or exception).
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+
+    if not leader:
+        return future.result()
+
+    try:
+        future.set_result(fetch())
+    except Exception as e:
+        future.set_exception(e)
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+    return future.result()
+
+
+# attributes returned for every child in a directory listing
+LISTING_ATTRIBUTES = ["file_id", "name", "type", "mode", "size", "mtime", "atime", "ctime", "parent_id",
+                      "owner_id", "shares", "index"]
+
+
+def listing_version_key(file_id: str) -> str:
+    return f"onedata:children-version:{file_id}"
+
+
+def listing_version(file_id: str) -> int:
+    key = listing_version_key(file_id)
+    cache.add(key, 1, None)
+    return cache.get(key) or 1
+
+
+def invalidate_listing(file_id: str):
+    """Drop every cached page of the directory listing."""
+    if not file_id:
+        return
+    key = listing_version_key(file_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def fetch_children_page(client, file_id: str, limit: int, token: str = None, offset: int = None) -> dict:
+    params = [("limit", limit)] + [("attribute", attribute) for attribute in LISTING_ATTRIBUTES]
+    if token:
+        params.append(("token", token))
+    elif offset:
+        params.append(("offset", offset))
+
+    response = client.request("GET", f"{client.provider_url}/data/{file_id}/children",
+                              headers={"X-Auth-Token": client.token}, params=params)
+    response.raise_for_status()
+    body = response.json()
+    return {
+        "children": body.get("children", []),
+        "next_token": body.get("nextPageToken"),
+        "is_last": body.get("isLast", True),
+    }
+
+
+def get_children_page(client, file_id: str, limit: int, token: str = None, offset: int = None,
+                      refresh: bool = False) -> dict:
+    """
+    Return one page of the directory listing as `{"children", "next_token", "is_last"}`.
+
+    Paging (`limit` with a continuation `token` or an `offset`) is passed through to the
+    provider. Pages are cached for ONEDATA_LISTING_CACHE_TTL seconds and concurrent
+    requests for the same page share one upstream call.
+    """
+    key = f"onedata:children:{file_id}:{listing_version(file_id)}:{limit}:{token or ''}:{offset or 0}"
+    page = None if refresh else cache.get(key)
+    if page is None:
+        def fetch():
+            result = fetch_children_page(client, file_id, limit, token, offset)
+            cache.set(key, result, settings.ONEDATA_LISTING_CACHE_TTL)
+            return result
+
+        page = coalesce(key, fetch)
+    return page
+
+
+def get_children(client, file_id: str, refresh: bool = False) -> list:
+    """Return the whole directory listing, fetched in cached pages of ONEDATA_LISTING_MAX_PAGE_SIZE."""
+    children, token = [], None
+    while True:
+        page = get_children_page(client, file_id, settings.ONEDATA_LISTING_MAX_PAGE_SIZE, token=token, refresh=refresh)
+        children += page["children"]
+        token = page["next_token"]
+        if page["is_last"] or not token:
+            return children
@@ -0,0 +1,256 @@
+"""
+Consumer of the Onedata file change streams driving the state of active experiments.
+
+A change source yields normalized events `{"seq", "file_id", "path", "type", "deleted", "time"}`
+for one space. `ChangeConsumer` collects events of all sources into batches and, per batch:
+
+- sets `Experiment.last_activity` and moves PREPARED/RUNNING experiments receiving files to
+  SYNCHRONIZING,
+- refreshes file counts and sizes of the touched datasets through the tree mirror, listing
+  only the directories holding changed files,
+- moves SYNCHRONIZING experiments with a known `end_time` to SUCCESS once no change was
+  seen for ONEDATA_CHANGES_IDLE_TIMEOUT seconds (since `end_time` when none was seen at all),
+- publishes the status changes as events (`api.events`),
+- stores the last applied sequence number of every space in `SyncState`, so a restarted
+  consumer resumes where it stopped.
+"""
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone as django_timezone
+
+from api.events import publish, status_event
+from api.models import Dataset, Experiment, ExperimentStatus, SyncState
+from onedata_api.cache import get_entry_path
+from onedata_api.clients import get_client
+from onedata_api.mirror import sync_changes
+
+ACTIVE_STATUSES = [ExperimentStatus.PREPARED, ExperimentStatus.RUNNING, ExperimentStatus.SYNCHRONIZING]
+
+
+def cursor_key(space_id: str) -> str:
+    return f"onedata:changes:{space_id}"
+
+
+class OnedataChangeSource:
+    """Reads the `/changes/metadata/{space_id}` stream of a provider, reconnecting when it ends."""
+
+    # observed attributes, `always` makes the provider send them with every event
+    spec = {
+        "fileMeta": {"fields": ["name", "type", "deleted"], "always": True},
+        "times": {"fields": ["mtime"], "always": True},
+    }
+
+    def __init__(self, client, space_id: str, last_seq=None):
+        self.client = client
+        self.space_id = space_id
+        self.last_seq = last_seq
+
+    def events(self):
+        while True:
+            params = {"timeout": int(settings.ONEDATA_READ_TIMEOUT * 1000 / 2)}
+            if self.last_seq is not None:
+                params["last_seq"] = self.last_seq
+            response = self.client.request("POST", f"{self.client.provider_url}/changes/metadata/{self.space_id}",
+                                           headers={"X-Auth-Token": self.client.token}, params=params,
+                                           json=self.spec, stream=True)
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue  # heartbeat
+                event = self.normalize(json.loads(line))
+                self.last_seq = event["seq"]
+                yield event
+
+    @staticmethod
+    def normalize(change: dict) -> dict:
+        meta = change.get("fileMeta", {}).get("fields", {})
+        times = change.get("times", {}).get("fields", {})
+        return {
+            "seq": change.get("seq"),
+            "file_id": change.get("fileId"),
+            "path": change.get("filePath", ""),
+            "type": meta.get("type"),
+            "deleted": meta.get("deleted", False),
+            "time": times.get("mtime"),
+        }
+
+    def resolve_path(self, file_id: str) -> str:
+        return get_entry_path(self.client, file_id)["path"]
+
+
+class FakeChangeSource:
+    """In-memory source for tests and local development."""
+
+    def __init__(self, space_id: str, events=(), paths=None):
+        self.space_id = space_id
+        self.pending = list(events)
+        self.paths = paths or {}
+
+    def events(self):
+        while self.pending:
+            yield self.pending.pop(0)
+
+    def resolve_path(self, file_id: str) -> str:
+        return self.paths[file_id]
+
+
+class ChangeConsumer:
+
+    def __init__(self, sources=(), batch_size=None, flush_interval=None, lister_factory=None):
+        self.sources = {}
+        self.batch_size = batch_size or settings.ONEDATA_CHANGES_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.ONEDATA_CHANGES_FLUSH_INTERVAL
+        self.lister_factory = lister_factory
+        self.paths = {}  # space id -> {experiment id: path of its directory}
+        self.queue = queue.Queue(maxsize=self.batch_size * 10)
+        self.add_sources(sources)
+
+    def read(self, source):
+        while True:
+            try:
+                for event in source.events():
+                    self.queue.put((source.space_id, event))
+                return
+            except Exception as e:
+                print(f"Onedata change stream of space {source.space_id} failed, reconnecting. {e}", flush=True)
+                time.sleep(self.flush_interval)
+
+    def add_sources(self, sources):
+        """Start reading the sources of spaces not consumed yet."""
+        for source in sources:
+            if source.space_id in self.sources:
+                continue
+            self.sources[source.space_id] = source
+            threading.Thread(target=self.read, args=(source,), daemon=True,
+                             name=f"onedata-changes-{source.space_id}").start()
+
+    def next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self, once=False, refresh=None, refresh_interval=60):
+        """
+        Apply batches until stopped; every `refresh_interval` seconds the experiment directories
+        are resolved again and `refresh()` is called, returning the sources to add, e.g. for spaces
+        of newly started experiments.
+        """
+        refreshed = time.monotonic()
+        while True:
+            batch = self.next_batch()
+            close_old_connections()
+            self.apply(batch)
+            if once and self.queue.empty():
+                return
+            if time.monotonic() - refreshed >= refresh_interval:
+                # directories of experiments are resolved again, datasets may have been renamed meanwhile
+                self.paths = {}
+                if refresh is not None:
+                    self.add_sources(refresh())
+                refreshed = time.monotonic()
+
+    def experiment_paths(self, space_id):
+        """
+        Directory paths of the active experiments in the space, resolved once per experiment
+        until the next refresh. Experiments that are no longer active are forgotten.
+        """
+        experiments = Experiment.objects.filter(status__in=ACTIVE_STATUSES, dataset__project__onedata_space_id=space_id) \
+            .exclude(onedata_file_id__isnull=True).exclude(onedata_file_id="").only("id", "onedata_file_id")
+        known = self.paths.get(space_id, {})
+        self.paths[space_id] = {}
+        paths = {}
+        for experiment in experiments:
+            if experiment.pk in known:
+                self.paths[space_id][experiment.pk] = known[experiment.pk]
+            else:
+                try:
+                    self.paths[space_id][experiment.pk] = self.sources[space_id].resolve_path(experiment.onedata_file_id)
+                except Exception as e:
+                    print(f"Failed to resolve the directory of experiment {experiment.pk}. {e}", flush=True)
+                    continue
+            paths[self.paths[space_id][experiment.pk].rstrip("/") + "/"] = experiment.pk
+        return paths
+
+    def apply(self, batch):
+        now = django_timezone.now()
+        activity = {}  # experiment id -> time of the last change
+        changed_paths = {}  # experiment id -> paths of changed entries relative to its directory
+        last_seq = {}
+        for space_id, events in group_by_space(batch).items():
+            paths = self.experiment_paths(space_id)
+            for event in events:
+                last_seq[space_id] = event["seq"]
+                for prefix, experiment_id in paths.items():
+                    if event["path"].startswith(prefix):
+                        changed = datetime.fromtimestamp(event["time"], tz=timezone.utc) if event["time"] else now
+                        activity[experiment_id] = max(activity.get(experiment_id, changed), changed)
+                        changed_paths.setdefault(experiment_id, []).append(event["path"][len(prefix):])
+                        break
+
+        events = []
+        if activity:
+            experiments = list(Experiment.objects.select_related("dataset__project").filter(pk__in=activity.keys()))
+            for experiment in experiments:
+                experiment.last_activity = max(filter(None, [experiment.last_activity, activity[experiment.pk]]))
+                if experiment.status in (ExperimentStatus.PREPARED, ExperimentStatus.RUNNING):
+                    previous, experiment.status = experiment.status, ExperimentStatus.SYNCHRONIZING
+                    events.append(status_event(experiment, previous))
+            Experiment.objects.bulk_update(experiments, ["last_activity", "status"])
+
+            changes = {}  # dataset id -> {experiment directory id: changed paths}
+            for experiment in experiments:
+                changes.setdefault(experiment.dataset_id, {})[experiment.onedata_file_id] = changed_paths[experiment.pk]
+            datasets = Dataset.objects.select_related("project__facility").filter(pk__in=changes.keys())
+            for dataset in datasets:
+                try:
+                    sync_changes(dataset, changes[dataset.pk], self.lister_factory(dataset) if self.lister_factory else None)
+                except Exception as e:
+                    print(f"Failed to refresh statistics of dataset {dataset.pk}. {e}", flush=True)
+
+        if settings.ONEDATA_CHANGES_IDLE_TIMEOUT:
+            idle_since = now - timedelta(seconds=settings.ONEDATA_CHANGES_IDLE_TIMEOUT)
+            finished = list(Experiment.objects.select_related("dataset__project").filter(
+                Q(last_activity__lt=idle_since) | Q(last_activity__isnull=True, end_time__lt=idle_since),
+                status=ExperimentStatus.SYNCHRONIZING, end_time__isnull=False))
+            Experiment.objects.filter(pk__in=[experiment.pk for experiment in finished],
+                                      status=ExperimentStatus.SYNCHRONIZING).update(status=ExperimentStatus.SUCCESS)
+            for experiment in finished:
+                experiment.status = ExperimentStatus.SUCCESS
+                events.append(status_event(experiment, ExperimentStatus.SYNCHRONIZING))
+        publish(events)
+
+        for space_id, seq in last_seq.items():
+            SyncState.put(cursor_key(space_id), {"last_seq": seq})
+        return activity
+
+
+def group_by_space(batch):
+    grouped = {}
+    for space_id, event in batch:
+        grouped.setdefault(space_id, []).append(event)
+    return grouped
+
+
+def active_sources():
+    """One provider change source per space holding active experiments."""
+    sources = {}
+    experiments = Experiment.objects.filter(status__in=ACTIVE_STATUSES).select_related("dataset__project__facility")
+    for experiment in experiments:
+        project = experiment.dataset.project
+        if project.onedata_space_id and project.onedata_space_id not in sources:
+            last_seq = (SyncState.get(cursor_key(project.onedata_space_id)) or {}).get("last_seq")
+            sources[project.onedata_space_id] = OnedataChangeSource(get_client(project.facility),
+                                                                    project.onedata_space_id, last_seq)
+    return list(sources.values())
@@ -0,0 +1,114 @@
+"""
+Pooled, keep-alive clients for Onedata providers.
+
+Every facility gets one `OnedataClient` holding the generated oneprovider API
+wrappers and a `requests.Session` for the raw REST/CDMI calls. Both share the
+same pool size and retry policy configured in settings.
+
+Clients are never mutated after construction, so they can be shared between
+threads. They are cached by `(provider_url, token fingerprint)` and dropped
+when the `Facility` is saved.
+
+All calls go through `request()` or `call()`, which run them under the circuit
+breaker and bulkhead of the provider host (see `api.resilience`).
+"""
+import hashlib
+import threading
+from urllib.parse import urlparse
+
+import oneprovider_client
+import requests
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from onedata_wrapper.api.file_operations_api import FileOperationsApi
+from onedata_wrapper.api.share_api import ShareApi
+from onedata_wrapper.api.space_api import SpaceApi
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from api import resilience
+from api.models import Facility
+
+
+def build_retry():
+    # only idempotent methods are retried on 5xx, connection errors are retried for all of them
+    return Retry(
+        total=settings.ONEDATA_RETRIES,
+        backoff_factor=settings.ONEDATA_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        raise_on_status=False,
+    )
+
+
+class OnedataClient:
+
+    def __init__(self, provider_url: str, token: str):
+        self.provider_url = provider_url
+        self.token = token
+        self.timeout = (settings.ONEDATA_CONNECT_TIMEOUT, settings.ONEDATA_READ_TIMEOUT)
+
+        self.configuration = oneprovider_client.configuration.Configuration()
+        self.configuration.host = provider_url
+        self.configuration.api_key['X-Auth-Token'] = token
+        self.configuration.connection_pool_maxsize = settings.ONEDATA_POOL_SIZE
+        self.configuration.retries = build_retry()
+
+        self.file_op_api = FileOperationsApi(self.configuration)
+        self.space_api = SpaceApi(oneprovider_configuration=self.configuration)
+        self.share_api = ShareApi(self.configuration)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=settings.ONEDATA_POOL_SIZE, max_retries=build_retry())
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @property
+    def cdmi_url(self):
+        return self.provider_url.replace("/api/v3/oneprovider", "/cdmi")  # TODO: not sure if this is ideal
+
+    @property
+    def host(self):
+        return urlparse(self.provider_url).netloc
+
+    def request(self, method: str, url: str, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return resilience.request("onedata", self.host, method, url, session=self.session, **kwargs)
+
+    def call(self, func, *args, **kwargs):
+        """Call a method of `file_op_api`, `space_api` or `share_api`."""
+        return resilience.call("onedata", self.host, func, *args, **kwargs)
+
+
+def token_fingerprint(token: str) -> str:
+    return hashlib.sha256((token or "").encode()).hexdigest()[:16]
+
+
+_clients: dict = {}
+_facility_keys: dict = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(facility) -> OnedataClient:
+    """Return the shared client for the facility's provider URL and token."""
+    key = (facility.onedata_provider_url, token_fingerprint(facility.onedata_token))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OnedataClient(facility.onedata_provider_url, facility.onedata_token)
+            _clients[key] = client
+        _facility_keys[facility.pk] = key
+        return client
+
+
+def invalidate_client(facility):
+    with _clients_lock:
+        key = _facility_keys.pop(facility.pk, None)
+        if key is not None:
+            _clients.pop(key, None)
+
+
+@receiver(post_save, sender=Facility)
+@receiver(post_delete, sender=Facility)
+def facility_changed(sender, instance, **kwargs):
+    invalidate_client(instance)
@@ -0,0 +1,272 @@
+"""
+In-process fake of the Oneprovider REST/CDMI and Onezone token endpoints used by
+`onedata_api.middleware` and `onedata_api.views`, for tests and `manage.py benchmark_onedata`.
+
+    with FakeOnedataServer(latency=0.01, error_rate=0.05) as server:
+        space_id, root_id = server.add_space("Space")
+        facility = Facility(onedata_provider_url=server.provider_url, onedata_token="token")
+
+Every request waits `latency` seconds (plus up to `jitter`) and fails with HTTP 500 with
+probability `error_rate`; `errors` maps a path regex to a status code returned every time.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+PROVIDER_PREFIX = "/api/v3/oneprovider"
+ONEZONE_PREFIX = "/api/v3/onezone"
+
+
+class FakeOnedataServer:
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, errors=None, token="token"):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.errors = errors or {}
+        self.token = token
+        self.entries = {}  # file id -> attributes
+        self.spaces = {}  # space id -> {"name", "root_id"}
+        self.shares = {}
+        self.datasets = {}
+        self.requests = []  # (method, path) of every request
+        self.lock = threading.Lock()
+        self.httpd = None
+
+    # state
+
+    def add_space(self, name):
+        space_id = uuid.uuid4().hex
+        root_id = self.add_entry(name, "DIR", parent_id=None)
+        self.spaces[space_id] = {"name": name, "root_id": root_id}
+        return space_id, root_id
+
+    def add_entry(self, name, type="REG", parent_id=None, size=0):
+        with self.lock:
+            file_id = uuid.uuid4().hex
+            self.entries[file_id] = {"file_id": file_id, "name": name, "type": type, "parent_id": parent_id,
+                                     "size": size, "mode": "0755", "mtime": int(time.time()), "shares": []}
+            if parent_id in self.entries:
+                self.entries[parent_id]["mtime"] = int(time.time())
+            return file_id
+
+    def path(self, file_id):
+        names = []
+        while file_id is not None:
+            entry = self.entries[file_id]
+            names.append(entry["name"])
+            file_id = entry["parent_id"]
+        return "/" + "/".join(reversed(names))
+
+    def find(self, path):
+        for file_id in list(self.entries):
+            if self.path(file_id) == path:
+                return file_id
+        return None
+
+    def children(self, file_id):
+        return sorted((entry for entry in self.entries.values() if entry["parent_id"] == file_id),
+                      key=lambda entry: entry["name"])
+
+    # server
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def provider_url(self):
+        return f"{self.url}{PROVIDER_PREFIX}"
+
+    @property
+    def onezone_url(self):
+        return self.url
+
+    def start(self):
+        server = self
+
+        class Handler(FakeOnedataHandler):
+            fake = server
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True, name="fake-onedata").start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeOnedataHandler(BaseHTTPRequestHandler):
+    fake: FakeOnedataServer = None
+
+    routes = [
+        ("GET", r"/spaces", "list_spaces"),
+        ("GET", r"/spaces/(?P<space_id>[^/]+)", "get_space"),
+        ("GET", r"/data/(?P<file_id>[^/]+)/children", "list_children"),
+        ("POST", r"/data/(?P<file_id>[^/]+)/children", "create_child"),
+        ("GET", r"/data/(?P<file_id>[^/]+)", "get_attributes"),
+        ("PUT", r"/data/(?P<file_id>[^/]+)", "set_attributes"),
+        ("DELETE", r"/data/(?P<file_id>[^/]+)", "remove"),
+        ("POST", r"/shares", "create_share"),
+        ("POST", r"/datasets", "create_dataset"),
+        ("POST", r"/lookup-file-id/(?P<path>.+)", "lookup_file_id"),
+    ]
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        fake = self.fake
+        url = urlparse(self.path)
+        self.query = parse_qs(url.query)
+        length = int(self.headers.get("Content-Length") or 0)
+        self.body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+        fake.requests.append((method, url.path))
+
+        time.sleep(fake.latency + random.uniform(0, fake.jitter))
+        for pattern, status in fake.errors.items():
+            if re.search(pattern, url.path):
+                return self.reply(status, {"error": "injected"})
+        if fake.error_rate and random.random() < fake.error_rate:
+            return self.reply(500, {"error": "injected"})
+        if self.headers.get("X-Auth-Token") != fake.token:
+            return self.reply(401, {"error": "unauthorized"})
+
+        if url.path.startswith("/cdmi/") and method == "PUT":
+            return self.cdmi_move(unquote(url.path[len("/cdmi"):]))
+        if url.path == f"{ONEZONE_PREFIX}/user/tokens/temporary" and method == "POST":
+            return self.reply(201, {"token": f"temporary-{uuid.uuid4().hex}"})
+        if url.path.startswith(PROVIDER_PREFIX):
+            path = url.path[len(PROVIDER_PREFIX):]
+            for route_method, pattern, handler in self.routes:
+                match = re.fullmatch(pattern, path)
+                if route_method == method and match:
+                    return getattr(self, handler)(**match.groupdict())
+        return self.reply(404, {"error": "not found"})
+
+    def reply(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def attributes(self, entry):
+        requested = self.query.get("attribute") or self.body.get("attributes")
+        attributes = {**entry, "path": self.fake.path(entry["file_id"])}
+        return {key: value for key, value in attributes.items() if not requested or key in requested}
+
+    # provider endpoints
+
+    def list_spaces(self):
+        return self.reply(200, [{"spaceId": space_id, "name": space["name"]}
+                                for space_id, space in self.fake.spaces.items()])
+
+    def get_space(self, space_id):
+        space = self.fake.spaces.get(space_id)
+        if space is None:
+            return self.reply(404, {"error": "no such space"})
+        return self.reply(200, {"spaceId": space_id, "name": space["name"], "fileId": space["root_id"],
+                                "dirId": space["root_id"], "providers": {}})
+
+    def list_children(self, file_id):
+        if file_id not in self.fake.entries:
+            return self.reply(404, {"error": "no such file"})
+        children = self.fake.children(file_id)
+        limit = int(self.query.get("limit", ["1000"])[0])
+        start = int(self.query.get("token", self.query.get("offset", ["0"]))[0])
+        page = children[start:start + limit]
+        is_last = start + limit >= len(children)
+        return self.reply(200, {"children": [self.attributes(entry) for entry in page], "isLast": is_last,
+                                "nextPageToken": None if is_last else str(start + limit)})
+
+    def create_child(self, file_id):
+        if file_id not in self.fake.entries:
+            return self.reply(404, {"error": "no such file"})
+        name = self.query.get("name", [""])[0]
+        if any(entry["name"] == name for entry in self.fake.children(file_id)):
+            return self.reply(409, {"error": "already exists"})
+        type = self.query.get("type", ["REG"])[0].upper()
+        return self.reply(201, {"fileId": self.fake.add_entry(name, type, parent_id=file_id)})
+
+    def get_attributes(self, file_id):
+        entry = self.fake.entries.get(file_id)
+        if entry is None:
+            return self.reply(404, {"error": "no such file"})
+        return self.reply(200, self.attributes(entry))
+
+    def set_attributes(self, file_id):
+        entry = self.fake.entries.get(file_id)
+        if entry is None:
+            return self.reply(404, {"error": "no such file"})
+        entry["mode"] = self.body.get("mode", entry["mode"])
+        return self.reply(204)
+
+    def remove(self, file_id):
+        with self.fake.lock:
+            if file_id not in self.fake.entries:
+                return self.reply(404, {"error": "no such file"})
+            pending = [file_id]
+            while pending:
+                entry = self.fake.entries.pop(pending.pop())
+                pending.extend(child["file_id"] for child in self.fake.children(entry["file_id"]))
+        return self.reply(204)
+
+    def create_share(self):
+        entry = self.fake.entries.get(self.body.get("fileId"))
+        if entry is None:
+            return self.reply(404, {"error": "no such file"})
+        share_id = uuid.uuid4().hex
+        self.fake.shares[share_id] = self.body
+        entry["shares"].append(share_id)
+        return self.reply(201, {"shareId": share_id})
+
+    def create_dataset(self):
+        if self.body.get("rootFileId") not in self.fake.entries:
+            return self.reply(404, {"error": "no such file"})
+        dataset_id = uuid.uuid4().hex
+        self.fake.datasets[dataset_id] = self.body
+        return self.reply(201, {"datasetId": dataset_id})
+
+    def lookup_file_id(self, path):
+        file_id = self.fake.find("/" + unquote(path))
+        if file_id is None:
+            return self.reply(404, {"error": "no such path"})
+        return self.reply(200, {"fileId": file_id})
+
+    # CDMI
+
+    def cdmi_move(self, to_path):
+        with self.fake.lock:
+            file_id = self.fake.find(self.body.get("move", ""))
+            if file_id is None:
+                return self.reply(404, {"error": "no such path"})
+            self.fake.entries[file_id]["name"] = to_path.rstrip("/").rsplit("/", 1)[-1]
+        return self.reply(201, {"objectID": file_id})
@@ -1,59 +1,111 @@
+import posixpath
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from datetime import datetime, timezone, timedelta
-from http.client import responses
+from urllib.parse import quote, urlparse
+
+from django.conf import settings
+from django.core.cache import cache
 
-import requests
-import oneprovider_client
-from onedata_wrapper.api.file_operations_api import FileOperationsApi
-from onedata_wrapper.api.space_api import SpaceApi
-from onedata_wrapper.api.share_api import ShareApi
 from onedata_wrapper.models.filesystem.dir_entry import DirEntry
 from onedata_wrapper.models.filesystem.file_entry import FileEntry
-from onedata_wrapper.models.space.space_request import SpaceRequest
 from onedata_wrapper.models.filesystem.entry_request import EntryRequest
 from onedata_wrapper.models.filesystem.new_directory_request import NewDirectoryRequest
 from onedata_wrapper.models.share.new_share_request import NewShareRequest
 from onedata_wrapper.selectors.file_attribute import ALL as FA_ALL
+from api import resilience
 from api.models import Project, Dataset, Facility
+from onedata_api.cache import get_space_info, invalidate_listing, temp_token_cache_key, coalesce, get_entry_path, \
+    remember_path, cached_entry_path
+from onedata_api.clients import get_client
 import base64
 
 
+_executor = None
+_executor_lock = threading.Lock()
 
-def create_public_share(project: Project, dataset_name: str, dataset_description: str, file_entry: FileEntry):
-    oneprovider_configuration = oneprovider_client.configuration.Configuration()
-    oneprovider_configuration.host = project.facility.onedata_provider_url
-    oneprovider_configuration.api_key['X-Auth-Token'] = project.facility.onedata_token
 
-    share_api = ShareApi(oneprovider_configuration)
-    new_share = None
-    error = None
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.ONEDATA_PARALLEL_CALLS,
+                                           thread_name_prefix="onedata")
+        return _executor
+
+
+def _timed(func, *args):
+    started = time.perf_counter()
+    try:
+        value, error = func(*args), None
+    except Exception as e:
+        value, error = None, {"error": str(e)}
+    return value, error, round((time.perf_counter() - started) * 1000, 3)
+
+
+def run_concurrently(calls: dict, deadline: float = None):
+    """
+    Run independent provider calls in parallel on the shared bounded thread pool.
+
+    `calls` maps a step name to `(func, *args)`. Returns a dict mapping every name to
+    `(value, error, duration_ms)`; a call raising an exception or missing the deadline
+    (ONEDATA_CALL_DEADLINE seconds for the whole batch by default) gets an error dict.
+    The calls must not touch the database, they run outside the request's connection.
+    """
+    deadline = settings.ONEDATA_CALL_DEADLINE if deadline is None else deadline
+    started = time.monotonic()
+    futures = {name: get_executor().submit(_timed, *call) for name, call in calls.items()}
+
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=max(0.0, started + deadline - time.monotonic()))
+        except TimeoutError:
+            future.cancel()
+            results[name] = (None, {"error": f"{name} did not finish within {deadline}s"},
+                             round((time.monotonic() - started) * 1000, 3))
+        print(f"Onedata call {name} took {results[name][2]} ms", flush=True)
+    return results
+
+
+def set_mode(client, file_id: str, mode: str = "0645"):
+    response = None
     try:
-        print(f"Setting permissions for the dataset {dataset_name} to 0645", flush=True)
-        url = f"{oneprovider_configuration.host}/data/{file_entry.file_id}"
+        url = f"{client.provider_url}/data/{file_id}"
         headers = {
-            "X-Auth-Token": oneprovider_configuration.api_key['X-Auth-Token'],
+            "X-Auth-Token": client.token,
             "Content-Type": "application/json"
         }
         data = {
-            "mode": "0645"
+            "mode": mode
         }
-        print(f"PUT {url} {headers} {data}", flush=True)
-        response = requests.put(url, headers=headers, json=data)   
+        print(f"PUT {url} {data}", flush=True)
+        response = client.request("PUT", url, headers=headers, json=data)
     except Exception as e:
-        error = {"error": f"Failed to set permissions for the dataset. {e} {response.text}"}
-        print(f"Failed to set permissions for the dataset. {e} {response.text}", flush=True)
+        print(f"Failed to set permissions for {file_id}. {e} {getattr(response, 'text', '')}", flush=True)
+        return response, {"error": f"Failed to set permissions for {file_id}. {e} {getattr(response, 'text', '')}"}
+    return response, None
+
+
+def create_public_share(project: Project, dataset_name: str, dataset_description: str, file_entry: FileEntry):
+    client = get_client(project.facility)
+
+    new_share = None
+    print(f"Setting permissions for the dataset {dataset_name} to 0645", flush=True)
+    _, error = set_mode(client, file_entry.file_id)
 
     try:
         share = NewShareRequest(entry=file_entry, name=f"Default share for {dataset_name}", description=dataset_description)
-        new_share = share_api.new_share(share)
+        new_share = client.call(client.share_api.new_share, share)
     except Exception as e:
         error = {"error": f"Failed to create the share for the dataset. {e}"}
-        
+
     return new_share, error
 
 def establish_dataset(project: Project, file_entry: FileEntry | str):
-    oneprovider_configuration = oneprovider_client.configuration.Configuration()
-    oneprovider_configuration.host = project.facility.onedata_provider_url
-    oneprovider_configuration.api_key['X-Auth-Token'] = project.facility.onedata_token
+    client = get_client(project.facility)
     error = None
     file_id = ""
     if isinstance(file_entry, FileEntry) or isinstance(file_entry, DirEntry):
@@ -64,15 +116,15 @@ def establish_dataset(project: Project, file_entry: FileEntry | str):
     dataset_id = None
     try:
         print(f"Establishing dataset on top of directory {file_id}", flush=True)
-        url = f"{oneprovider_configuration.host}/datasets"
+        url = f"{client.provider_url}/datasets"
         headers = {
-            "X-Auth-Token": oneprovider_configuration.api_key['X-Auth-Token'],
+            "X-Auth-Token": client.token,
             "Content-Type": "application/json"
         }
         data = {
             "rootFileId": file_id
         }
-        response = requests.post(url, headers=headers, json=data)
+        response = client.request("POST", url, headers=headers, json=data)
         print(response.status_code, flush=True)
 
         if response.status_code == 201:
@@ -82,126 +134,179 @@ def establish_dataset(project: Project, file_entry: FileEntry | str):
 
     return dataset_id, error
 
-def create_new_dataset(project: Project, dataset_name: str):
-    oneprovider_configuration = oneprovider_client.configuration.Configuration()
-    oneprovider_configuration.host = project.facility.onedata_provider_url
-    oneprovider_configuration.api_key['X-Auth-Token'] = project.facility.onedata_token
+def lookup_file_id(client, path: str):
+    """File id of the entry at `path` (`/<space name>/...`), None if there is none."""
+    response = client.request("POST", f"{client.provider_url}/lookup-file-id/{quote(path.lstrip('/'))}",
+                              headers={"X-Auth-Token": client.token})
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()["fileId"]
+
+
+def remove_entry(client, file_id: str):
+    """Remove the file or directory with all its content, an entry that is already gone is fine."""
+    print(f"DELETE {client.provider_url}/data/{file_id}", flush=True)
+    response = client.request("DELETE", f"{client.provider_url}/data/{file_id}", headers={"X-Auth-Token": client.token})
+    if response.status_code != 404:
+        response.raise_for_status()
+
+
+def remove_entries(project: Project, file_ids: list, parent_id: str = None):
+    """
+    Remove the entries (of the directory `parent_id`) concurrently, return `{file_id: error}`
+    of those that could not be removed.
+    """
+    client = get_client(project.facility)
+    results = run_concurrently({file_id: (remove_entry, client, file_id) for file_id in file_ids})
+    if parent_id:
+        invalidate_listing(parent_id)
+    return {file_id: error["error"] for file_id, (_, error, _) in results.items() if error}
+
+
+def create_new_dataset(project: Project, dataset_name: str, adopt: bool = False):
+    """
+    Create the directory of a dataset in the space root. An existing directory of the same name
+    is only adopted with `adopt`, when an earlier attempt for the same dataset may have created it.
+    The error of an attempt that may have created the directory is marked `unconfirmed`.
+    """
+    client = get_client(project.facility)
     error = None
 
-    file_op_api = FileOperationsApi(oneprovider_configuration)
-    space_api = SpaceApi(oneprovider_configuration=oneprovider_configuration)
-
     space_id = project.onedata_space_id
-    
-    space_request = SpaceRequest(space_id=space_id)
-    space = space_api.get_space(space_request)
-    
-    file_id = file_op_api.get_root(space).root_dir.file_id
 
-    parent_er = EntryRequest(file_id=file_id)
     new_file = None
-    try:
-        dir_request = NewDirectoryRequest(parent=parent_er, name=dataset_name)
-        newfile_entry_request = file_op_api.new_entry(dir_request)
-        new_file = file_op_api.get_file(newfile_entry_request, FA_ALL)
-    except Exception as e:
-        error = {"error": f"Failed to create the dataset. {e}"}
-
-        
+    unconfirmed = False
+    # retry once with a fresh root directory id in case the cached one is stale
+    for refresh in (False, True):
+        try:
+            space = get_space_info(client, space_id, refresh=refresh)
+            root_dir_id = space["root_dir_id"]
+            dir_request = NewDirectoryRequest(parent=EntryRequest(file_id=root_dir_id), name=dataset_name)
+            try:
+                newfile_entry_request = client.call(client.file_op_api.new_entry, dir_request)
+            except Exception as e:
+                file_id = None
+                if (adopt or unconfirmed) and space["name"]:
+                    file_id = lookup_file_id(client, f"/{space['name']}/{dataset_name}")
+                if file_id is None:
+                    # without an answer of the provider the directory may have been created anyway
+                    status = getattr(e, "status", None)
+                    unconfirmed = unconfirmed or not status or status >= 500
+                    raise
+                newfile_entry_request = EntryRequest(file_id=file_id)
+            new_file = client.call(client.file_op_api.get_file, newfile_entry_request, FA_ALL)
+            invalidate_listing(root_dir_id)
+            if space["name"]:
+                remember_path(new_file.file_id, f"/{space['name']}/{dataset_name}", root_dir_id)
+            error = None
+            break
+        except Exception as e:
+            error = {"error": f"Failed to create the dataset. {e}"}
+
+    if error and unconfirmed:
+        error["unconfirmed"] = True
     return new_file, error
 
 
-def rename_entry(project: Project, file_entry_id: str, new_name: str):
-    oneprovider_configuration = oneprovider_client.configuration.Configuration()
-    oneprovider_configuration.host = project.facility.onedata_provider_url
-    oneprovider_configuration.api_key['X-Auth-Token'] = project.facility.onedata_token
+def move_entry(client, from_path: str, to_path: str):
+    url = f"{client.cdmi_url}{quote(to_path)}"
+    headers = {
+        "X-Auth-Token": client.token,
+        "Content-Type": "application/cdmi-object",
+        "X-CDMI-Specification-Version": "1.1.1"
+    }
+    data = {
+        "move": from_path
+    }
+    print(f"PUT {url} {data}", flush=True)
+    return client.request("PUT", url, headers=headers, json=data)
 
-    path = None
-    try:
-        url = f"{oneprovider_configuration.host}/data/{file_entry_id}"
-        headers = {
-            "X-Auth-Token": oneprovider_configuration.api_key['X-Auth-Token'],
-            "Content-Type": "application/json"
-        }
-        data = {
-            "attributes": ["path"]
-        }
-        response = requests.get(url, headers=headers, json=data)
-        if response.status_code == 200:
-            path = response.json().get("path")
-    except Exception as e:
-        return {"error": f"Failed to get path for the directory {file_entry_id}. {e}"}
 
+def rename_entry(project: Project, file_entry_id: str, new_name: str):
+    """
+    Rename the entry in place with a CDMI move. The current path comes from the path cache,
+    it is looked up again only when the cached one no longer exists.
+    """
+    if not new_name or "/" in new_name or new_name in (".", ".."):
+        return {"error": f"Invalid name {new_name!r}."}
+
+    client = get_client(project.facility)
+    response = None
     try:
-        print(f"Rename directory", flush=True)
-
-        from_path = path
-        to_path = path.replace(path.split("/")[-1], new_name) # TODO: May replace more than one occurence
-
-        cdmi_url = project.facility.onedata_provider_url.replace("/api/v3/oneprovider", "/cdmi") # TODO: not sure if this is ideal
-        url = f"{cdmi_url}{to_path}"
-        headers = {
-            "X-Auth-Token": oneprovider_configuration.api_key['X-Auth-Token'],
-            "Content-Type": "application/cdmi-object",
-            "X-CDMI-Specification-Version": "1.1.1"
-        }
-        data = {
-            "move": from_path
-        }
-        print(f"PUT {url} {headers} {data}", flush=True)
-        response = requests.put(url, headers=headers, json=data) 
-        print(response.status_code, response.text, flush=True)  
+        for refresh in (False, True):
+            entry = get_entry_path(client, file_entry_id, refresh=refresh)
+            from_path = entry["path"]
+            if posixpath.basename(from_path) == new_name:
+                return None  # already renamed, e.g. by a previous attempt of the job
+            to_path = posixpath.join(posixpath.dirname(from_path), new_name)
+
+            print(f"Rename directory", flush=True)
+            response = move_entry(client, from_path, to_path)
+            print(response.status_code, response.text, flush=True)
+            if response.status_code != 404:
+                break
+        response.raise_for_status()
     except Exception as e:
-        print(f"Failed to rename directory. {e} {response.text}", flush=True)
-        return {"error": f"Failed to rename directory. {e} {response.text}"}
+        print(f"Failed to rename directory. {e} {getattr(response, 'text', '')}", flush=True)
+        return {"error": f"Failed to rename directory. {e} {getattr(response, 'text', '')}"}
 
+    remember_path(file_entry_id, to_path, entry["parent_id"])
+    invalidate_listing(entry["parent_id"])
 
-def create_new_experiment(dataset: Dataset, experiment_id: str):
-    oneprovider_configuration = oneprovider_client.configuration.Configuration()
-    oneprovider_configuration.host = dataset.project.facility.onedata_provider_url
-    oneprovider_configuration.api_key['X-Auth-Token'] = dataset.project.facility.onedata_token
-    error = None
 
-    file_op_api = FileOperationsApi(oneprovider_configuration)
+def create_new_experiment(dataset: Dataset, experiment_id: str):
+    client = get_client(dataset.project.facility)
 
     parent_er = EntryRequest(file_id=dataset.onedata_file_id)
-    new_file = None
     try:
         dir_request = NewDirectoryRequest(parent=parent_er, name=experiment_id)
-        newfile_entry_request = file_op_api.new_entry(dir_request)
-        new_file = file_op_api.get_file(newfile_entry_request, FA_ALL)
-    except Exception as e:
-        error = {"error": f"Failed to create the dataset. {e}"}
-
-    try:
-        print(f"Setting permissions for the experiment {experiment_id} to 0645", flush=True)
-        url = f"{oneprovider_configuration.host}/data/{new_file.file_id}"
-        headers = {
-            "X-Auth-Token": oneprovider_configuration.api_key['X-Auth-Token'],
-            "Content-Type": "application/json"
-        }
-        data = {
-            "mode": "0645"
-        }
-        print(f"PUT {url} {headers} {data}", flush=True)
-        response = requests.put(url, headers=headers, json=data)
+        newfile_entry_request = client.call(client.file_op_api.new_entry, dir_request)
     except Exception as e:
-        error = {"error": f"Failed to set permissions for the dataset. {e} {response.text}"}
-        print(f"Failed to set permissions for the dataset. {e} {response.text}", flush=True)
-
-    return new_file, error
-
-
-def create_new_temp_token(facility: Facility, project: Project, dataset: Dataset):
-    oneprovider_configuration = oneprovider_client.configuration.Configuration()
-    oneprovider_configuration.host = facility.onedata_provider_url
-    oneprovider_configuration.api_key['X-Auth-Token'] = facility.onedata_token
+        return None, {"error": f"Failed to create the experiment directory. {e}"}
+    invalidate_listing(dataset.onedata_file_id)
+    parent = cached_entry_path(dataset.onedata_file_id)
+    if parent is not None:
+        remember_path(newfile_entry_request.file_id, posixpath.join(parent["path"], experiment_id),
+                      dataset.onedata_file_id)
+
+    print(f"Setting permissions for the experiment {experiment_id} to 0645", flush=True)
+    # fetching the attributes and setting the mode only depend on the new directory
+    results = run_concurrently({
+        "get_file": (client.call, client.file_op_api.get_file, newfile_entry_request, FA_ALL),
+        "set_mode": (set_mode, client, newfile_entry_request.file_id),
+    })
+
+    new_file, error, _ = results["get_file"]
+    if error is None:
+        mode_result, error, _ = results["set_mode"]
+        if error is None:
+            _, error = mode_result
+    if error:
+        # do not leave a directory no experiment points to
+        try:
+            remove_entry(client, newfile_entry_request.file_id)
+            invalidate_listing(dataset.onedata_file_id)
+        except Exception as e:
+            print(f"Failed to remove the experiment directory {newfile_entry_request.file_id}. {e}", flush=True)
+        return None, {"error": f"Failed to create the experiment directory. {error['error']}"}
+    return new_file, None
+
+
+# seconds a caller waits for a token being issued by another process
+TEMP_TOKEN_LOCK_TIMEOUT = 10
+
+
+def issue_temp_token(facility: Facility, path: str, onezone_url: str = None):
+    client = get_client(facility)
+    onezone_url = onezone_url or settings.ONEZONE_URL
     error = None
     token = None
+    valid_until = int((datetime.now(timezone.utc) + timedelta(seconds=settings.ONEDATA_TEMP_TOKEN_TTL)).timestamp())
+    response = None
     try:
         print(f"Create temp token", flush=True)
-        #TODO: configurable url
-        url = f"https://onezone.devel.onedata.e-infra.cz/api/v3/onezone/user/tokens/temporary"
+        url = f"{onezone_url}/api/v3/onezone/user/tokens/temporary"
         headers = {
             "X-Auth-Token": facility.onedata_token,
             "Content-Type": "application/json"
@@ -211,38 +316,80 @@ def create_new_temp_token(facility: Facility, project: Project, dataset: Dataset
             "caveats": [
                 {
                     "type": "time",
-                    "validUntil": int((datetime.now(timezone.utc) + timedelta(hours=5)).timestamp())
+                    "validUntil": valid_until
                 },
                 {
                     "type": "data.path",
                     "whitelist": [
-                        base64.b64encode(f"/{project.onedata_space_id}/{dataset.name}".encode("ascii")).decode("ascii")
+                        base64.b64encode(path.encode("ascii")).decode("ascii")
                     ]
                 }
             ]
         }
-        print(f"POST {url} {headers} {data}", flush=True)
-        response = requests.post(url, headers=headers, json=data)
-        print(response.status_code, response.text, flush=True)
+        print(f"POST {url} {data['caveats'][1]}", flush=True)
+        # Onezone failures must not open the circuit of the provider
+        response = resilience.request("onezone", urlparse(onezone_url).netloc, "POST", url,
+                                      session=client.session, headers=headers, json=data)
+        print(response.status_code, flush=True)
         if response.status_code == 201:
             token = response.json().get("token")
     except Exception as e:
-        error = {"error": f"Failed to set permissions for the dataset. {e} {response.text}"}
-        print(f"Failed to set permissions for the dataset. {e} {response.text}", flush=True)
-
-    return token, error
+        error = {"error": f"Failed to create a temporary token. {e} {getattr(response, 'text', '')}"}
+        print(f"Failed to create a temporary token. {e} {getattr(response, 'text', '')}", flush=True)
+
+    return token, valid_until, error
+
+
+def create_new_temp_token(facility: Facility, project: Project, dataset: Dataset, onezone_url: str = None):
+    """
+    Return a temporary token restricted to the dataset directory, issued by `onezone_url`
+    (ONEZONE_URL by default).
+
+    Tokens are cached per facility and path and reused until ONEDATA_TEMP_TOKEN_MARGIN
+    seconds before they expire; concurrent callers share a single issuance.
+    """
+    path = f"/{project.onedata_space_id}/{dataset.name}"
+    key = temp_token_cache_key(facility, path)
+
+    cached = cache.get(key)
+    if cached is not None:
+        return cached, None
+
+    def issue():
+        # other worker processes wait for the token being issued instead of minting their own
+        lock = f"{key}:lock"
+        owner = uuid.uuid4().hex
+        waited = 0.0
+        acquired = cache.add(lock, owner, TEMP_TOKEN_LOCK_TIMEOUT)
+        while not acquired and waited < TEMP_TOKEN_LOCK_TIMEOUT:
+            time.sleep(0.1)
+            waited += 0.1
+            token = cache.get(key)
+            if token is not None:
+                return token, None
+            acquired = cache.add(lock, owner, TEMP_TOKEN_LOCK_TIMEOUT)
+
+        # after waiting in vain the token is issued without the lock, which stays with its holder
+        try:
+            token, valid_until, error = issue_temp_token(facility, path, onezone_url)
+            reuse_for = valid_until - datetime.now(timezone.utc).timestamp() - settings.ONEDATA_TEMP_TOKEN_MARGIN
+            if token is not None and reuse_for > 0:
+                cache.set(key, token, int(reuse_for))
+            return token, error
+        finally:
+            if acquired and cache.get(lock) == owner:
+                cache.delete(lock)
+
+    return coalesce(key, issue)
 
 
 def get_file_metadata(project: Project, file_id: str):
-    oneprovider_configuration = oneprovider_client.configuration.Configuration()
-    oneprovider_configuration.host = project.facility.onedata_provider_url
-    oneprovider_configuration.api_key['X-Auth-Token'] = project.facility.onedata_token
+    client = get_client(project.facility)
     error = None
     metadata = None
 
     try:
-        file_op_api = FileOperationsApi(oneprovider_configuration)
-        metadata = file_op_api.get_file(EntryRequest(file_id), FA_ALL)
+        metadata = client.call(client.file_op_api.get_file, EntryRequest(file_id), FA_ALL)
     except Exception as e:
         error = {"error": f"Failed to create the dataset. {e}"}
 
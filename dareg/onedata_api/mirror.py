@@ -0,0 +1,226 @@
+"""
+Mirror of the datasets' Onedata directory trees, used to store size, file count and
+last modification time on `Dataset` and `Experiment` without asking the provider.
+
+Only directories are mirrored (`api.models.OnedataDirectory`). A directory whose Onedata
+mtime did not change since the last sync is not listed again, only its subdirectories are
+visited. Growing files do not change the mtime of their directory, so `full=True` lists
+every directory again, and `sync_changes` lists exactly the directories holding changed files.
+"""
+from datetime import datetime, timezone
+
+from django.db import transaction
+from django.utils import timezone as django_timezone
+
+from api.models import Dataset, Experiment, OnedataDirectory
+from onedata_api.cache import fetch_children_page
+from onedata_api.clients import get_client
+
+
+class OnedataLister:
+    """Reads the tree through the provider REST API, pages of `page_size` entries at a time."""
+
+    page_size = 1000
+
+    def __init__(self, client):
+        self.client = client
+
+    def list_children(self, file_id: str):
+        token = None
+        while True:
+            page = fetch_children_page(self.client, file_id, self.page_size, token=token)
+            yield from page["children"]
+            token = page["next_token"]
+            if page["is_last"] or not token:
+                return
+
+    def stat(self, file_id: str) -> dict:
+        response = self.client.request("GET", f"{self.client.provider_url}/data/{file_id}",
+                                       headers={"X-Auth-Token": self.client.token},
+                                       params=[("attribute", "file_id"), ("attribute", "type"),
+                                               ("attribute", "mtime")])
+        response.raise_for_status()
+        return response.json()
+
+
+def is_directory(entry: dict) -> bool:
+    return str(entry.get("type", "")).upper() == "DIR"
+
+
+def to_datetime(mtime):
+    return datetime.fromtimestamp(mtime, tz=timezone.utc) if mtime else None
+
+
+def latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def sync_dataset(dataset: Dataset, lister=None, full=False) -> dict:
+    """
+    Walk the tree under `dataset.onedata_file_id` and store the totals on the dataset and
+    its experiments. Returns `{file_id: (size, file_count, last_modified)}` of all directories.
+    """
+    lister = lister or OnedataLister(get_client(dataset.project.facility))
+    mirrored = {node.file_id: node for node in OnedataDirectory.objects.filter(dataset=dataset)}
+    subdirectories = {}
+    for node in mirrored.values():
+        subdirectories.setdefault(node.parent_id, []).append(node.file_id)
+
+    nodes = {}
+    totals = {}
+    now = django_timezone.now()
+
+    def visit(file_id, parent_id, name, mtime):
+        node = mirrored.get(file_id) or OnedataDirectory(dataset=dataset, file_id=file_id)
+        if full or node.pk is None or node.mtime != mtime:
+            node.size, node.file_count, node.last_modified = 0, 0, None
+            children = []
+            for entry in lister.list_children(file_id):
+                if is_directory(entry):
+                    children.append((entry["file_id"], entry.get("name", ""), entry.get("mtime")))
+                else:
+                    node.size += entry.get("size") or 0
+                    node.file_count += 1
+                    node.last_modified = latest(node.last_modified, to_datetime(entry.get("mtime")))
+        else:
+            children = []
+            for child_id in subdirectories.get(file_id, []):
+                child = lister.stat(child_id)
+                children.append((child_id, mirrored[child_id].name, child.get("mtime")))
+        node.parent_id, node.name, node.mtime, node.synced = parent_id, name, mtime or 0, now
+        nodes[file_id] = node
+
+        size, file_count, last_modified = node.size, node.file_count, node.last_modified
+        for child in children:
+            child_id, child_name, child_mtime = child
+            child_size, child_count, child_modified = visit(child_id, file_id, child_name, child_mtime)
+            size += child_size
+            file_count += child_count
+            last_modified = latest(last_modified, child_modified)
+        totals[file_id] = (size, file_count, last_modified)
+        return totals[file_id]
+
+    root = lister.stat(dataset.onedata_file_id)
+    visit(dataset.onedata_file_id, "", dataset.name, root.get("mtime"))
+
+    store(dataset, nodes, nodes.values(), totals, now)
+    return totals
+
+
+def sync_changes(dataset: Dataset, changes: dict, lister=None) -> dict:
+    """
+    List again only the directories holding changed entries and recompute the totals of the
+    dataset from the mirror. `changes` maps the file id of a mirrored directory (e.g. of an
+    experiment) to paths of changed entries relative to it, as reported by the change stream.
+
+    New subdirectories are listed recursively, vanished ones are dropped with their subtree.
+    A dataset without a mirror yet, or with changes in an unknown directory that is not
+    directly in the dataset root, is walked by `sync_dataset`.
+    """
+    lister = lister or OnedataLister(get_client(dataset.project.facility))
+    mirrored = {node.file_id: node for node in OnedataDirectory.objects.filter(dataset=dataset)}
+    if dataset.onedata_file_id not in mirrored:
+        return sync_dataset(dataset, lister)
+    subdirectories = {}
+    for node in mirrored.values():
+        subdirectories.setdefault(node.parent_id, []).append(node.file_id)
+
+    directories = set()
+    for base_id, paths in changes.items():
+        if base_id not in mirrored:
+            # a directory created after the last sync (e.g. of a new experiment) is found by listing the dataset root
+            directories.add(dataset.onedata_file_id)
+            continue
+        by_path = {"": base_id}
+        pending = [("", base_id)]
+        while pending:
+            path, file_id = pending.pop()
+            for child_id in subdirectories.get(file_id, []):
+                child_path = f"{path}/{mirrored[child_id].name}".lstrip("/")
+                by_path[child_path] = child_id
+                pending.append((child_path, child_id))
+        for path in paths:
+            # the closest mirrored directory above the entry, a new directory is found by listing its parent
+            parent = path.strip("/").rpartition("/")[0]
+            while parent not in by_path:
+                parent = parent.rpartition("/")[0]
+            directories.add(by_path[parent])
+
+    now = django_timezone.now()
+    listed = {}
+    removed = set()
+
+    def relist(file_id):
+        node = mirrored[file_id]
+        node.size, node.file_count, node.last_modified, node.synced = 0, 0, None, now
+        listed[file_id] = node
+        present = set()
+        for entry in lister.list_children(file_id):
+            if not is_directory(entry):
+                node.size += entry.get("size") or 0
+                node.file_count += 1
+                node.last_modified = latest(node.last_modified, to_datetime(entry.get("mtime")))
+                continue
+            present.add(entry["file_id"])
+            child = mirrored.get(entry["file_id"])
+            if child is None:
+                mirrored[entry["file_id"]] = OnedataDirectory(dataset=dataset, file_id=entry["file_id"], parent_id=file_id,
+                                                              name=entry.get("name", ""), mtime=entry.get("mtime") or 0)
+                relist(entry["file_id"])
+            elif child.name != entry.get("name", child.name):
+                child.name = entry["name"]
+                listed[child.file_id] = child
+        pending = [child_id for child_id in subdirectories.get(file_id, []) if child_id not in present]
+        while pending:
+            child_id = pending.pop()
+            removed.add(child_id)
+            pending.extend(subdirectories.get(child_id, []))
+
+    for file_id in directories:
+        if file_id not in removed:
+            relist(file_id)
+    if any(base_id not in mirrored for base_id in changes):
+        # deeper than the dataset root, only a walk of the whole tree finds it
+        return sync_dataset(dataset, lister)
+
+    nodes = {file_id: node for file_id, node in mirrored.items() if file_id not in removed}
+    children = {}
+    for node in nodes.values():
+        children.setdefault(node.parent_id, []).append(node.file_id)
+    totals = {}
+
+    def total(file_id):
+        node = nodes[file_id]
+        size, file_count, last_modified = node.size, node.file_count, node.last_modified
+        for child_id in children.get(file_id, []):
+            child_size, child_count, child_modified = total(child_id)
+            size += child_size
+            file_count += child_count
+            last_modified = latest(last_modified, child_modified)
+        totals[file_id] = (size, file_count, last_modified)
+        return totals[file_id]
+
+    total(dataset.onedata_file_id)
+    store(dataset, nodes, [node for file_id, node in listed.items() if file_id not in removed], totals, now)
+    return totals
+
+
+def store(dataset, nodes, changed, totals, now):
+    """Save the mirror `nodes` of the dataset (`changed` ones updated) and the `totals` on the dataset and experiments."""
+    new_nodes = [node for node in changed if node.pk is None]
+    changed_nodes = [node for node in changed if node.pk is not None]
+    with transaction.atomic():
+        OnedataDirectory.objects.filter(dataset=dataset).exclude(file_id__in=nodes.keys()).delete()
+        OnedataDirectory.objects.bulk_create(new_nodes)
+        OnedataDirectory.objects.bulk_update(changed_nodes, ["parent_id", "name", "mtime", "size", "file_count", "last_modified",
+                                              "synced"])
+
+        size, file_count, last_modified = totals[dataset.onedata_file_id]
+        Dataset.objects.filter(pk=dataset.pk).update(size=size, file_count=file_count, last_modified=last_modified,
+                                                     stats_synced=now)
+        experiments = list(Experiment.objects.filter(dataset=dataset, onedata_file_id__in=totals.keys()))
+        for experiment in experiments:
+            experiment.size, experiment.file_count, experiment.last_modified = totals[experiment.onedata_file_id]
+            experiment.stats_synced = now
+        Experiment.objects.bulk_update(experiments, ["size", "file_count", "last_modified", "stats_synced"])
@@ -0,0 +1,256 @@
+"""
+Onedata provisioning of new datasets, executed as `provision_dataset` jobs, the
+`dataset_batch` jobs running one step for many datasets (DatasetAdmin bulk actions)
+and the `rename_entry` jobs renaming directories of datasets and experiments.
+
+Every step is idempotent: it is skipped when the corresponding Onedata id is already
+stored on the dataset, so a retried job continues where the previous attempt failed.
+Steps of one stage are independent of each other and run in parallel.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from onedata_wrapper.models.filesystem.entry_request import EntryRequest
+
+from api.jobs import job_handler, enqueue, save_job_progress
+from api.models import Dataset, Experiment, ProvisioningStatus
+from onedata_api.middleware import create_new_dataset, create_public_share, establish_dataset, run_concurrently, \
+    rename_entry
+
+
+class ProvisioningError(Exception):
+    pass
+
+
+def step_folder(dataset: Dataset):
+    if dataset.onedata_file_id:
+        return
+    state = step_state(dataset, "folder")
+    # only a directory an earlier attempt of this dataset may have created is adopted
+    folder, error = create_new_dataset(dataset.project, dataset.name, adopt=state.get("unconfirmed") == dataset.name)
+    if error and error.get("unconfirmed"):
+        state["unconfirmed"] = dataset.name
+    if error or folder is None:
+        raise ProvisioningError(error or "Onedata folder was not created")
+    dataset.onedata_file_id = folder.file_id
+
+
+def check_folder(dataset: Dataset):
+    """Reject a directory that is used by another dataset, must not run in the worker threads."""
+    if Dataset.objects.filter(onedata_file_id=dataset.onedata_file_id).exclude(pk=dataset.pk).exists():
+        file_id, dataset.onedata_file_id = dataset.onedata_file_id, None
+        raise ProvisioningError(f"Onedata folder {file_id} is used by another dataset")
+
+
+def step_checked_folder(dataset: Dataset):
+    step_folder(dataset)
+    check_folder(dataset)
+
+
+def step_share(dataset: Dataset):
+    if dataset.onedata_share_id:
+        return
+    share, error = create_public_share(dataset.project, dataset.name, dataset.description,
+                                       EntryRequest(file_id=dataset.onedata_file_id))
+    if error or share is None or share.share_id is None:
+        raise ProvisioningError(error or "Onedata share was not created")
+    dataset.onedata_share_id = share.share_id
+
+
+def step_dataset(dataset: Dataset):
+    if dataset.onedata_dataset_id:
+        return
+    dataset_id, error = establish_dataset(dataset.project, dataset.onedata_file_id)
+    if error or dataset_id is None:
+        raise ProvisioningError(error or "Onedata dataset was not established")
+    dataset.onedata_dataset_id = dataset_id
+
+
+STAGES = [
+    # a single step runs in the job thread
+    [("folder", step_checked_folder)],
+    # both only need the folder id
+    [("share", step_share), ("dataset", step_dataset)],
+]
+STEPS = [step for stage in STAGES for step in stage]
+
+
+def save_progress(dataset: Dataset):
+    Dataset.objects.filter(pk=dataset.pk).update(
+        onedata_file_id=dataset.onedata_file_id,
+        onedata_share_id=dataset.onedata_share_id,
+        onedata_dataset_id=dataset.onedata_dataset_id,
+        provisioning_status=dataset.provisioning_status,
+        provisioning_steps=dataset.provisioning_steps,
+    )
+
+
+def step_state(dataset: Dataset, name):
+    return dataset.provisioning_steps.setdefault(name, {"status": ProvisioningStatus.PENDING, "attempts": 0})
+
+
+def run_step(dataset: Dataset, name, step, save=True):
+    state = step_state(dataset, name)
+    if state["status"] == ProvisioningStatus.SUCCESS:
+        return
+    state.update(status=ProvisioningStatus.RUNNING, attempts=state["attempts"] + 1)
+    started = time.perf_counter()
+    try:
+        step(dataset)
+    except Exception as e:
+        state.update(status=ProvisioningStatus.FAILURE, error=str(e))
+        raise
+    else:
+        state.update(status=ProvisioningStatus.SUCCESS, error=None)
+    finally:
+        state["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        if save:
+            save_progress(dataset)
+
+
+def run_stage(dataset: Dataset, stage):
+    steps = [(name, step) for name, step in stage if step_state(dataset, name)["status"] != ProvisioningStatus.SUCCESS]
+    if len(steps) <= 1:
+        for name, step in steps:
+            run_step(dataset, name, step)
+        return
+
+    # the worker threads only talk to Onedata, progress is saved here once all steps are done
+    results = run_concurrently({name: (run_step, dataset, name, step, False) for name, step in steps})
+    errors = {}
+    for name, (_, error, duration_ms) in results.items():
+        if error is None:
+            continue
+        state = step_state(dataset, name)
+        if state["status"] == ProvisioningStatus.RUNNING:
+            # the step missed the deadline and is still running
+            state.update(status=ProvisioningStatus.FAILURE, error=error["error"], duration_ms=duration_ms)
+        errors[name] = state["error"]
+    save_progress(dataset)
+    if errors:
+        raise ProvisioningError(errors)
+
+
+@job_handler("provision_dataset")
+def provision_dataset(job, dataset: Dataset = None):
+    """
+    Run the provisioning stages of `payload["dataset_id"]`, or of `dataset` when given
+    (`manage.py benchmark_onedata` passes unsaved datasets).
+    """
+    if dataset is None:
+        dataset = Dataset.objects.select_related("project__facility").get(pk=job.payload["dataset_id"])
+    dataset.provisioning_status = ProvisioningStatus.RUNNING
+    save_progress(dataset)
+
+    try:
+        for stage in STAGES:
+            run_stage(dataset, stage)
+    except Exception:
+        last_attempt = job.attempts >= job.max_attempts
+        dataset.provisioning_status = ProvisioningStatus.FAILURE if last_attempt else ProvisioningStatus.PENDING
+        save_progress(dataset)
+        raise
+
+    dataset.provisioning_status = ProvisioningStatus.SUCCESS
+    save_progress(dataset)
+
+
+def enqueue_provisioning(dataset: Dataset, user=None):
+    dataset.provisioning_status = ProvisioningStatus.PENDING
+    dataset.provisioning_steps = {name: {"status": ProvisioningStatus.PENDING, "attempts": 0} for name, _ in STEPS}
+    save_progress(dataset)
+    return enqueue("provision_dataset", {"dataset_id": str(dataset.pk)}, dataset=dataset, created_by=user)
+
+
+# batch action -> (step, Onedata id it stores)
+BATCH_ACTIONS = {
+    "folder": (step_folder, "onedata_file_id"),
+    "share": (step_share, "onedata_share_id"),
+    "dataset": (step_dataset, "onedata_dataset_id"),
+}
+
+
+def run_batch_step(dataset: Dataset, action):
+    step, _ = BATCH_ACTIONS[action]
+    if action != "folder" and not dataset.onedata_file_id:
+        raise ProvisioningError("Dataset doesn't have any directory.")
+    step(dataset)
+
+
+@job_handler("dataset_batch")
+def dataset_batch(job):
+    """
+    Run one provisioning step for every dataset of `payload["dataset_ids"]` with at most
+    ONEDATA_BATCH_CONCURRENCY provider calls at once. A failing dataset is recorded in
+    `job.results` and does not stop the batch; a retried job skips finished datasets.
+    """
+    action = job.payload["action"]
+    _, field = BATCH_ACTIONS[action]
+    done = {key for key, result in job.results.items() if result["status"] != ProvisioningStatus.FAILURE}
+    datasets = Dataset.objects.select_related("project__facility") \
+        .filter(pk__in=job.payload["dataset_ids"]).exclude(pk__in=done)
+
+    # restart the counters of the datasets that are processed again
+    job.failed = 0
+    job.processed = len(done)
+    pending = []
+    for dataset in datasets:
+        if getattr(dataset, field):
+            job.results[str(dataset.pk)] = {"status": "skipped", "error": None}
+            job.processed += 1
+        else:
+            pending.append(dataset)
+    save_job_progress(job)
+
+    # worker threads only talk to Onedata, the results are saved here
+    with ThreadPoolExecutor(max_workers=settings.ONEDATA_BATCH_CONCURRENCY) as executor:
+        futures = {executor.submit(run_batch_step, dataset, action): dataset for dataset in pending}
+        for future in as_completed(futures):
+            dataset = futures[future]
+            try:
+                future.result()
+                if action == "folder":
+                    check_folder(dataset)
+            except Exception as e:
+                job.results[str(dataset.pk)] = {"status": ProvisioningStatus.FAILURE, "error": str(e)}
+                job.failed += 1
+                # keeps whether the folder may exist for the next attempt
+                Dataset.objects.filter(pk=dataset.pk).update(provisioning_steps=dataset.provisioning_steps)
+            else:
+                Dataset.objects.filter(pk=dataset.pk).update(**{field: getattr(dataset, field)})
+                job.results[str(dataset.pk)] = {"status": ProvisioningStatus.SUCCESS, "error": None}
+            job.processed += 1
+            save_job_progress(job)
+
+
+def enqueue_batch(action, datasets, user=None):
+    dataset_ids = [str(pk) for pk in datasets.values_list("pk", flat=True)]
+    return enqueue("dataset_batch", {"action": action, "dataset_ids": dataset_ids}, created_by=user,
+                   total=len(dataset_ids))
+
+
+@job_handler("rename_entry")
+def rename(job):
+    """
+    Rename the directory of the dataset or experiment to its name at run time, so a retried
+    older job does not undo a newer rename.
+    """
+    if job.payload["model"] == "experiment":
+        instance = Experiment.objects.select_related("dataset__project__facility").get(pk=job.payload["object_id"])
+        project = instance.dataset.project
+    else:
+        instance = Dataset.objects.select_related("project__facility").get(pk=job.payload["object_id"])
+        project = instance.project
+    if not instance.onedata_file_id:
+        return
+    error = rename_entry(project, instance.onedata_file_id, instance.name)
+    if error:
+        raise ProvisioningError(error)
+
+
+def enqueue_rename(instance, user=None):
+    """Schedule renaming the directory of a `Dataset` or `Experiment` after its name changed."""
+    dataset = instance if isinstance(instance, Dataset) else instance.dataset
+    return enqueue("rename_entry", {"model": instance._meta.model_name, "object_id": str(instance.pk)},
+                   dataset=dataset, created_by=user)
@@ -1,3 +1,573 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+from unittest.mock import MagicMock, patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from api import resilience
+from api.jobs import run_job
+from api.models import Facility, Project, Dataset, Experiment, OnedataDirectory, ExperimentStatus, SyncState
+from onedata_api.changes import ChangeConsumer, FakeChangeSource, cursor_key
+from onedata_api.cache import get_children, get_children_page, invalidate_listing, remember_path, cached_entry_path, \
+    temp_token_cache_key
+from onedata_api.clients import get_client
+from onedata_api.fake_server import FakeOnedataServer
+from onedata_api.middleware import run_concurrently, create_new_temp_token, rename_entry, establish_dataset, \
+    create_new_dataset, lookup_file_id, remove_entries
+from onedata_api.mirror import sync_changes, sync_dataset
+from onedata_api.provisioning import ProvisioningError, check_folder, enqueue_rename, step_folder
+
+
+class ProviderError(Exception):
+    """Error of a provider call that got an answer, like `ApiException`."""
+
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.status = status
+
+
+class ClientRegistryTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.facility = Facility.objects.create(name="Test Facility", abbreviation="TF",
+                                                onedata_provider_url="https://provider.url/api/v3/oneprovider",
+                                                onedata_token="token-1", created_by=self.user)
+
+    def test_client_is_shared(self):
+        self.assertIs(get_client(self.facility), get_client(self.facility))
+
+    def test_client_is_invalidated_on_save(self):
+        client = get_client(self.facility)
+
+        self.facility.onedata_token = "token-2"
+        self.facility.save()
+
+        new_client = get_client(self.facility)
+        self.assertIsNot(client, new_client)
+        self.assertEqual(new_client.token, "token-2")
+        self.assertEqual(client.token, "token-1")
+
+
+class RunConcurrentlyTest(SimpleTestCase):
+    @staticmethod
+    def slow(value, delay):
+        time.sleep(delay)
+        return value
+
+    def test_calls_overlap(self):
+        started = time.monotonic()
+        results = run_concurrently({"a": (self.slow, 1, 0.2), "b": (self.slow, 2, 0.2)})
+        self.assertLess(time.monotonic() - started, 0.35)
+        self.assertEqual(results["a"][:2], (1, None))
+        self.assertEqual(results["b"][:2], (2, None))
+        self.assertGreaterEqual(results["a"][2], 200)
+
+    def test_deadline_and_errors(self):
+        def fail():
+            raise ValueError("boom")
+
+        results = run_concurrently({"slow": (self.slow, 1, 0.5), "fail": (fail,)}, deadline=0.05)
+        self.assertIsNone(results["slow"][0])
+        self.assertIn("did not finish", results["slow"][1]["error"])
+        self.assertEqual(results["fail"][1], {"error": "boom"})
+
+
+# the shared cache lives in the database, which a SimpleTestCase may not use
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class ChildrenListingTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = MagicMock(provider_url="https://provider.url/api/v3/oneprovider", token="token")
+        self.client.request.return_value.json.return_value = {
+            "children": [{"file_id": "child", "name": "a.txt"}], "isLast": False, "nextPageToken": "next"}
+
+    def test_page_is_cached(self):
+        page = get_children_page(self.client, "dir", 10)
+        self.assertEqual(page, {"children": [{"file_id": "child", "name": "a.txt"}], "next_token": "next",
+                                "is_last": False})
+        self.assertEqual(get_children_page(self.client, "dir", 10), page)
+        self.assertEqual(self.client.request.call_count, 1)
+
+        params = self.client.request.call_args.kwargs["params"]
+        self.assertIn(("limit", 10), params)
+
+        get_children_page(self.client, "dir", 10, token="next")
+        self.assertEqual(self.client.request.call_count, 2)
+        self.assertIn(("token", "next"), self.client.request.call_args.kwargs["params"])
+
+    def test_whole_listing_follows_tokens(self):
+        self.client.request.return_value.json.side_effect = [
+            {"children": [{"file_id": "first"}], "isLast": False, "nextPageToken": "next"},
+            {"children": [{"file_id": "second"}], "isLast": True},
+        ]
+
+        self.assertEqual(get_children(self.client, "dir"), [{"file_id": "first"}, {"file_id": "second"}])
+        self.assertIn(("token", "next"), self.client.request.call_args.kwargs["params"])
+
+    def test_invalidation(self):
+        get_children_page(self.client, "dir", 10)
+        invalidate_listing("dir")
+        get_children_page(self.client, "dir", 10)
+        self.assertEqual(self.client.request.call_count, 2)
+
+    def test_concurrent_requests_are_coalesced(self):
+        response = self.client.request.return_value
+
+        def slow_request(*args, **kwargs):
+            time.sleep(0.2)
+            return response
+
+        self.client.request.side_effect = slow_request
+        threads = [threading.Thread(target=get_children_page, args=(self.client, "dir", 10)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.client.request.call_count, 1)
+
+
+class TempTokenCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.facility = Facility.objects.create(name="Test Facility", abbreviation="TF",
+                                                onedata_provider_url="https://provider.url/api/v3/oneprovider",
+                                                onedata_token="token-1", created_by=self.user)
+        self.project = Project.objects.create(name="Test Project", facility=self.facility, description="desc",
+                                              created_by=self.user)
+        self.dataset = Dataset.objects.create(name="Test Dataset", project=self.project, description="desc",
+                                              created_by=self.user)
+
+    @staticmethod
+    def valid_for(seconds):
+        return int(datetime.now(timezone.utc).timestamp()) + seconds
+
+    @patch("onedata_api.middleware.issue_temp_token")
+    def test_token_is_reused(self, mock_issue):
+        mock_issue.return_value = ("temp-token", self.valid_for(5 * 3600), None)
+
+        self.assertEqual(create_new_temp_token(self.facility, self.project, self.dataset), ("temp-token", None))
+        self.assertEqual(create_new_temp_token(self.facility, self.project, self.dataset), ("temp-token", None))
+        mock_issue.assert_called_once()
+
+        # a different facility token must not get the cached token
+        self.facility.onedata_token = "token-2"
+        create_new_temp_token(self.facility, self.project, self.dataset)
+        self.assertEqual(mock_issue.call_count, 2)
+
+    @patch("onedata_api.middleware.issue_temp_token")
+    def test_token_close_to_expiry_is_not_reused(self, mock_issue):
+        mock_issue.return_value = ("temp-token", self.valid_for(60), None)
+
+        create_new_temp_token(self.facility, self.project, self.dataset)
+        create_new_temp_token(self.facility, self.project, self.dataset)
+        self.assertEqual(mock_issue.call_count, 2)
+
+    @patch("onedata_api.middleware.issue_temp_token")
+    def test_failed_issuance_is_not_cached(self, mock_issue):
+        mock_issue.return_value = (None, self.valid_for(5 * 3600), {"error": "unauthorized"})
+
+        self.assertEqual(create_new_temp_token(self.facility, self.project, self.dataset),
+                         (None, {"error": "unauthorized"}))
+        create_new_temp_token(self.facility, self.project, self.dataset)
+        self.assertEqual(mock_issue.call_count, 2)
+
+    @patch("onedata_api.middleware.TEMP_TOKEN_LOCK_TIMEOUT", 0.3)
+    @patch("onedata_api.middleware.issue_temp_token")
+    def test_lock_of_another_process_is_kept(self, mock_issue):
+        mock_issue.return_value = ("temp-token", self.valid_for(5 * 3600), None)
+        lock = temp_token_cache_key(self.facility, f"/{self.project.onedata_space_id}/{self.dataset.name}") + ":lock"
+        cache.set(lock, "other-process", 60)
+
+        self.assertEqual(create_new_temp_token(self.facility, self.project, self.dataset), ("temp-token", None))
+        self.assertEqual(cache.get(lock), "other-process")
+
+
+class FakeLister:
+    """Serves a directory tree given as `{file_id: {"mtime": ..., "children": [entry, ...]}}`."""
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.listed = []
+
+    def list_children(self, file_id):
+        self.listed.append(file_id)
+        return self.tree[file_id]["children"]
+
+    def stat(self, file_id):
+        return {"file_id": file_id, "type": "DIR", "mtime": self.tree[file_id]["mtime"]}
+
+
+class TreeMirrorTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.facility = Facility.objects.create(name="Test Facility", abbreviation="TF",
+                                                onedata_provider_url="https://provider.url/api/v3/oneprovider",
+                                                onedata_token="token-1", created_by=self.user)
+        self.project = Project.objects.create(name="Test Project", facility=self.facility, description="desc",
+                                              created_by=self.user)
+        self.dataset = Dataset.objects.create(name="Test Dataset", project=self.project, description="desc",
+                                              created_by=self.user, onedata_file_id="root")
+        self.experiment = Experiment.objects.create(dataset=self.dataset, name="Experiment", created_by=self.user,
+                                                    onedata_file_id="exp")
+        self.tree = {
+            "root": {"mtime": 100, "children": [
+                {"file_id": "readme", "name": "README", "type": "REG", "size": 10, "mtime": 100},
+                {"file_id": "exp", "name": "exp", "type": "DIR", "mtime": 200},
+            ]},
+            "exp": {"mtime": 200, "children": [
+                {"file_id": "a", "name": "a.tif", "type": "REG", "size": 1000, "mtime": 150},
+                {"file_id": "b", "name": "b.tif", "type": "REG", "size": 2000, "mtime": 300},
+            ]},
+        }
+
+    def test_sync(self):
+        sync_dataset(self.dataset, FakeLister(self.tree))
+
+        self.dataset.refresh_from_db()
+        self.experiment.refresh_from_db()
+        self.assertEqual((self.dataset.size, self.dataset.file_count), (3010, 3))
+        self.assertEqual((self.experiment.size, self.experiment.file_count), (3000, 2))
+        self.assertEqual(self.dataset.last_modified, datetime.fromtimestamp(300, tz=timezone.utc))
+        self.assertIsNotNone(self.experiment.stats_synced)
+        self.assertEqual(OnedataDirectory.objects.filter(dataset=self.dataset).count(), 2)
+
+    def test_unchanged_directories_are_not_listed(self):
+        sync_dataset(self.dataset, FakeLister(self.tree))
+
+        lister = FakeLister(self.tree)
+        sync_dataset(self.dataset, lister)
+        self.assertEqual(lister.listed, [])
+
+        self.tree["exp"]["mtime"] = 400
+        self.tree["exp"]["children"].append({"file_id": "c", "name": "c.tif", "type": "REG", "size": 5, "mtime": 400})
+        lister = FakeLister(self.tree)
+        sync_dataset(self.dataset, lister)
+        self.assertEqual(lister.listed, ["exp"])
+
+        self.experiment.refresh_from_db()
+        self.assertEqual((self.experiment.size, self.experiment.file_count), (3005, 3))
+
+        lister = FakeLister(self.tree)
+        sync_dataset(self.dataset, lister, full=True)
+        self.assertEqual(lister.listed, ["root", "exp"])
+
+    def test_only_changed_directories_are_listed(self):
+        self.tree["exp"]["children"].append({"file_id": "raw", "name": "raw", "type": "DIR", "mtime": 200})
+        self.tree["raw"] = {"mtime": 200, "children": []}
+        sync_dataset(self.dataset, FakeLister(self.tree))
+
+        # a growing file does not change the mtime of its directory
+        self.tree["exp"]["children"][1]["size"] = 5000
+        self.tree["raw"]["children"].append({"file_id": "c", "name": "c.tif", "type": "REG", "size": 5, "mtime": 400})
+        lister = FakeLister(self.tree)
+        sync_changes(self.dataset, {"exp": ["b.tif", "raw/c.tif"]}, lister)
+        self.assertEqual(sorted(lister.listed), ["exp", "raw"])
+
+        self.dataset.refresh_from_db()
+        self.experiment.refresh_from_db()
+        self.assertEqual((self.experiment.size, self.experiment.file_count), (6005, 3))
+        self.assertEqual((self.dataset.size, self.dataset.file_count), (6015, 4))
+
+    def test_new_directory_is_listed_with_its_parent(self):
+        sync_dataset(self.dataset, FakeLister(self.tree))
+
+        self.tree["exp"]["children"].append({"file_id": "raw", "name": "raw", "type": "DIR", "mtime": 400})
+        self.tree["raw"] = {"mtime": 400, "children": [
+            {"file_id": "c", "name": "c.tif", "type": "REG", "size": 5, "mtime": 400}]}
+        lister = FakeLister(self.tree)
+        sync_changes(self.dataset, {"exp": ["raw/c.tif"]}, lister)
+        self.assertEqual(lister.listed, ["exp", "raw"])
+
+        self.experiment.refresh_from_db()
+        self.assertEqual((self.experiment.size, self.experiment.file_count), (3005, 3))
+        self.assertEqual(OnedataDirectory.objects.filter(dataset=self.dataset).count(), 3)
+
+
+    def test_new_experiment_directory_is_found_in_the_dataset_root(self):
+        sync_dataset(self.dataset, FakeLister(self.tree))
+
+        experiment = Experiment.objects.create(dataset=self.dataset, name="Experiment 2", created_by=self.user,
+                                               onedata_file_id="exp2")
+        self.tree["root"]["children"].append({"file_id": "exp2", "name": "exp2", "type": "DIR", "mtime": 400})
+        self.tree["exp2"] = {"mtime": 400, "children": [
+            {"file_id": "c", "name": "c.tif", "type": "REG", "size": 5, "mtime": 400}]}
+        lister = FakeLister(self.tree)
+        sync_changes(self.dataset, {"exp2": ["c.tif"]}, lister)
+        self.assertEqual(lister.listed, ["root", "exp2"])
+
+        experiment.refresh_from_db()
+        self.dataset.refresh_from_db()
+        self.assertEqual((experiment.size, experiment.file_count), (5, 1))
+        self.assertEqual((self.dataset.size, self.dataset.file_count), (3015, 4))
+
+
+class ChangeConsumerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.facility = Facility.objects.create(name="Test Facility", abbreviation="TF",
+                                                onedata_provider_url="https://provider.url/api/v3/oneprovider",
+                                                onedata_token="token-1", created_by=self.user)
+        self.project = Project.objects.create(name="Test Project", facility=self.facility, description="desc",
+                                              created_by=self.user, onedata_space_id="space")
+        self.dataset = Dataset.objects.create(name="Test Dataset", project=self.project, description="desc",
+                                              created_by=self.user, onedata_file_id="root")
+        self.experiment = Experiment.objects.create(dataset=self.dataset, name="Experiment", created_by=self.user,
+                                                    onedata_file_id="exp", status=ExperimentStatus.RUNNING,
+                                                    end_time=datetime(2024, 1, 1, tzinfo=timezone.utc))
+        self.tree = {
+            "root": {"mtime": 100, "children": [{"file_id": "exp", "name": "exp", "type": "DIR", "mtime": 200}]},
+            "exp": {"mtime": 200, "children": [
+                {"file_id": "a", "name": "a.tif", "type": "REG", "size": 1000, "mtime": 150},
+                {"file_id": "b", "name": "b.tif", "type": "REG", "size": 2000, "mtime": 300},
+            ]},
+        }
+
+    def event(self, seq, name, mtime):
+        return {"seq": seq, "file_id": name, "path": f"/Space/Test Dataset/exp/{name}", "type": "REG",
+                "deleted": False, "time": mtime}
+
+    def test_changes_update_experiment(self):
+        source = FakeChangeSource("space", [self.event(1, "a.tif", 150), self.event(2, "b.tif", 300),
+                                            {**self.event(3, "other.txt", 400), "path": "/Space/elsewhere.txt"}],
+                                  paths={"exp": "/Space/Test Dataset/exp"})
+        consumer = ChangeConsumer([source], flush_interval=0.2, lister_factory=lambda dataset: FakeLister(self.tree))
+        consumer.run(once=True)
+
+        self.experiment.refresh_from_db()
+        self.assertEqual(self.experiment.status, ExperimentStatus.SYNCHRONIZING)
+        self.assertEqual(self.experiment.last_activity, datetime.fromtimestamp(300, tz=timezone.utc))
+        self.assertEqual((self.experiment.file_count, self.experiment.size), (2, 3000))
+        self.assertEqual(SyncState.get(cursor_key("space")), {"last_seq": 3})
+
+    def test_paths_of_finished_experiments_are_forgotten(self):
+        consumer = ChangeConsumer([FakeChangeSource("space", paths={"exp": "/Space/Test Dataset/exp"})],
+                                  flush_interval=0.1)
+        self.assertEqual(consumer.experiment_paths("space"), {"/Space/Test Dataset/exp/": self.experiment.pk})
+
+        Experiment.objects.filter(pk=self.experiment.pk).update(status=ExperimentStatus.SUCCESS)
+        self.assertEqual(consumer.experiment_paths("space"), {})
+        self.assertEqual(consumer.paths, {"space": {}})
+
+    @override_settings(ONEDATA_CHANGES_IDLE_TIMEOUT=60)
+    def test_idle_experiment_succeeds(self):
+        Experiment.objects.filter(pk=self.experiment.pk).update(
+            status=ExperimentStatus.SYNCHRONIZING, last_activity=datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+        ChangeConsumer(flush_interval=0.1).apply([])
+
+        self.experiment.refresh_from_db()
+        self.assertEqual(self.experiment.status, ExperimentStatus.SUCCESS)
+
+    @override_settings(ONEDATA_CHANGES_IDLE_TIMEOUT=60)
+    def test_experiment_without_activity_succeeds(self):
+        Experiment.objects.filter(pk=self.experiment.pk).update(status=ExperimentStatus.SYNCHRONIZING)
+
+        ChangeConsumer(flush_interval=0.1).apply([])
+
+        self.experiment.refresh_from_db()
+        self.assertEqual(self.experiment.status, ExperimentStatus.SUCCESS)
+
+
+class RenameEntryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.facility = Facility.objects.create(name="Test Facility", abbreviation="TF",
+                                                onedata_provider_url="https://provider.url/api/v3/oneprovider",
+                                                onedata_token="token-1", created_by=self.user)
+        self.project = Project.objects.create(name="Test Project", facility=self.facility, description="desc",
+                                              created_by=self.user)
+
+    @patch("onedata_api.clients.OnedataClient.request")
+    def test_rename_uses_cached_path(self, mock_request):
+        mock_request.return_value.status_code = 204
+        remember_path("file", "/Space/data/data", "parent")
+
+        self.assertIsNone(rename_entry(self.project, "file", "renamed"))
+
+        # a single CDMI move, only the last path segment changes
+        mock_request.assert_called_once()
+        method, url = mock_request.call_args.args
+        self.assertEqual(method, "PUT")
+        self.assertEqual(url, "https://provider.url/cdmi/Space/data/renamed")
+        self.assertEqual(mock_request.call_args.kwargs["json"], {"move": "/Space/data/data"})
+        self.assertEqual(cached_entry_path("file"), {"path": "/Space/data/renamed", "parent_id": "parent"})
+
+    @patch("onedata_api.clients.OnedataClient.request")
+    def test_stale_path_is_looked_up(self, mock_request):
+        stale_move, lookup, move = MagicMock(status_code=404), MagicMock(status_code=200), MagicMock(status_code=204)
+        lookup.json.return_value = {"path": "/Space/moved/data", "parent_id": "parent"}
+        mock_request.side_effect = [stale_move, lookup, move]
+        remember_path("file", "/Space/old/data", "parent")
+
+        self.assertIsNone(rename_entry(self.project, "file", "renamed"))
+        self.assertEqual(mock_request.call_args.args[1], "https://provider.url/cdmi/Space/moved/renamed")
+
+    def test_invalid_name(self):
+        self.assertIn("error", rename_entry(self.project, "file", "a/b"))
+
+
+class CreateDatasetFolderTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.facility = Facility.objects.create(name="Test Facility", abbreviation="TF",
+                                                onedata_provider_url="https://provider.url/api/v3/oneprovider",
+                                                onedata_token="token-1", created_by=self.user)
+        self.project = Project.objects.create(name="Test Project", facility=self.facility, description="desc",
+                                              created_by=self.user, onedata_space_id="space")
+        self.client = MagicMock(provider_url="https://provider.url/api/v3/oneprovider")
+        self.client.call.side_effect = lambda func, *args: func(*args)
+        # the directory exists already, the provider rejects creating it again
+        self.client.file_op_api.new_entry.side_effect = ProviderError(400, "already exists")
+        self.client.file_op_api.get_file.return_value = MagicMock(file_id="existing")
+        self.client.request.return_value = MagicMock(status_code=200, json=lambda: {"fileId": "existing"})
+        for target, value in [("get_client", self.client), ("get_space_info", {"root_dir_id": "root", "name": "Space"})]:
+            patcher = patch(f"onedata_api.middleware.{target}", return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_existing_directory_adopted(self):
+        folder, error = create_new_dataset(self.project, "Dataset", adopt=True)
+
+        self.assertIsNone(error)
+        self.assertEqual(folder.file_id, "existing")
+        self.assertEqual(self.client.request.call_args.args[1],
+                         "https://provider.url/api/v3/oneprovider/lookup-file-id/Space/Dataset")
+
+    def test_unrelated_directory_not_adopted(self):
+        folder, error = create_new_dataset(self.project, "Dataset")
+
+        self.assertIsNone(folder)
+        self.assertIn("already exists", error["error"])
+        self.assertNotIn("unconfirmed", error)
+        self.client.request.assert_not_called()
+
+    def test_directory_of_lost_response_adopted(self):
+        self.client.file_op_api.new_entry.side_effect = [Exception("read timeout"), ProviderError(400, "already exists")]
+
+        folder, error = create_new_dataset(self.project, "Dataset")
+
+        self.assertIsNone(error)
+        self.assertEqual(folder.file_id, "existing")
+
+    def test_lost_response_recorded_for_next_attempt(self):
+        self.client.file_op_api.new_entry.side_effect = Exception("read timeout")
+        self.client.request.return_value = MagicMock(status_code=404)
+        dataset = Dataset.objects.create(name="Dataset", project=self.project, description="desc", created_by=self.user)
+
+        with self.assertRaises(ProvisioningError):
+            step_folder(dataset)
+        self.assertEqual(dataset.provisioning_steps["folder"]["unconfirmed"], "Dataset")
+
+        # the next attempt finds the directory created by the lost request
+        self.client.file_op_api.new_entry.side_effect = ProviderError(400, "already exists")
+        self.client.request.return_value = MagicMock(status_code=200, json=lambda: {"fileId": "existing"})
+        step_folder(dataset)
+        self.assertEqual(dataset.onedata_file_id, "existing")
+
+    def test_directory_of_another_dataset_rejected(self):
+        Dataset.objects.create(name="Dataset", project=self.project, description="desc", created_by=self.user,
+                               onedata_file_id="existing")
+        dataset = Dataset.objects.create(name="Dataset", project=self.project, description="desc",
+                                         created_by=self.user)
+        dataset.onedata_file_id = "existing"
+
+        with self.assertRaises(ProvisioningError):
+            check_folder(dataset)
+        self.assertIsNone(dataset.onedata_file_id)
+
+
+class FakeServerTest(TestCase):
+    """Raw REST and CDMI calls of the middleware against the in-process fake provider."""
+
+    def setUp(self):
+        cache.clear()
+        resilience.reset()
+        self.server = FakeOnedataServer().start()
+        self.addCleanup(self.server.stop)
+        self.space_id, self.root_id = self.server.add_space("Space")
+
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.facility = Facility.objects.create(name="Test Facility", abbreviation="TF",
+                                                onedata_provider_url=self.server.provider_url,
+                                                onedata_token=self.server.token, created_by=self.user)
+        self.project = Project.objects.create(name="Test Project", facility=self.facility, description="desc",
+                                              created_by=self.user, onedata_space_id=self.space_id)
+        self.dataset = Dataset.objects.create(name="Test Dataset", project=self.project, description="desc",
+                                              created_by=self.user)
+        self.folder_id = self.server.add_entry("Test Dataset", "DIR", parent_id=self.root_id)
+
+    def test_establish_dataset(self):
+        dataset_id, error = establish_dataset(self.project, self.folder_id)
+        self.assertIsNone(error)
+        self.assertIn(dataset_id, self.server.datasets)
+
+    def test_lookup_file_id(self):
+        client = get_client(self.facility)
+        self.assertEqual(lookup_file_id(client, "/Space/Test Dataset"), self.folder_id)
+        self.assertIsNone(lookup_file_id(client, "/Space/Missing"))
+
+    def test_remove_entries(self):
+        file_id = self.server.add_entry("data.tif", parent_id=self.folder_id)
+        other_id = self.server.add_entry("Other", "DIR", parent_id=self.root_id)
+
+        self.assertEqual(remove_entries(self.project, [self.folder_id, other_id]), {})
+        self.assertFalse({self.folder_id, file_id, other_id} & set(self.server.entries))
+        # removing an entry again is not an error
+        self.assertEqual(remove_entries(self.project, [self.folder_id]), {})
+
+    def test_rename(self):
+        self.assertIsNone(rename_entry(self.project, self.folder_id, "Renamed"))
+        self.assertEqual(self.server.path(self.folder_id), "/Space/Renamed")
+
+        # the second rename is served from the path cache
+        requests_before = len(self.server.requests)
+        self.assertIsNone(rename_entry(self.project, self.folder_id, "Renamed again"))
+        self.assertEqual(len(self.server.requests), requests_before + 1)
+        self.assertEqual(self.server.path(self.folder_id), "/Space/Renamed again")
+
+    def test_retried_rename_job_uses_current_name(self):
+        Dataset.objects.filter(pk=self.dataset.pk).update(onedata_file_id=self.folder_id, name="First")
+        first = enqueue_rename(self.dataset)
+        Dataset.objects.filter(pk=self.dataset.pk).update(name="Second")
+        run_job(enqueue_rename(self.dataset))
+
+        # the older job runs last, e.g. retried after a failure
+        run_job(first)
+        self.assertEqual(self.server.path(self.folder_id), "/Space/Second")
+
+    def test_temp_token(self):
+        token, error = create_new_temp_token(self.facility, self.project, self.dataset,
+                                             onezone_url=self.server.onezone_url)
+        self.assertIsNone(error)
+        self.assertTrue(token.startswith("temporary-"))
+        self.assertEqual(sorted(resilience.resilience_state()["breakers"]),
+                         [f"onezone:{urlparse(self.server.onezone_url).netloc}"])
+
+    def test_paging(self):
+        for i in range(5):
+            self.server.add_entry(f"file-{i}", parent_id=self.folder_id, size=10)
+        client = get_client(self.facility)
+
+        first = get_children_page(client, self.folder_id, 3)
+        self.assertEqual([child["name"] for child in first["children"]], ["file-0", "file-1", "file-2"])
+        self.assertFalse(first["is_last"])
+        second = get_children_page(client, self.folder_id, 3, token=first["next_token"])
+        self.assertEqual([child["name"] for child in second["children"]], ["file-3", "file-4"])
+        self.assertTrue(second["is_last"])
+
+    @override_settings(RESILIENCE_FAILURE_THRESHOLD=2)
+    def test_injected_errors_open_the_circuit(self):
+        self.server.errors = {r"/datasets$": 503}
+        for _ in range(2):
+            self.assertIsNone(establish_dataset(self.project, self.folder_id)[0])
+
+        requests_before = len(self.server.requests)
+        dataset_id, error = establish_dataset(self.project, self.folder_id)
+        self.assertIn("unavailable", error["error"])
+        self.assertEqual(len(self.server.requests), requests_before)
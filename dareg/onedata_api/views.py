@@ -1,24 +1,22 @@
+from django.conf import settings
 from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions
-import oneprovider_client
-from onedata_wrapper.api.file_operations_api import FileOperationsApi
 from onedata_wrapper.models.filesystem.dir_entry import DirEntry
 from onedata_wrapper.models.filesystem.file_entry import FileEntry
 from onedata_wrapper.models.space.space_request import SpaceRequest
-from onedata_wrapper.models.filesystem.entry_request import EntryRequest
 from onedata_wrapper.models.filesystem.new_directory_request import NewDirectoryRequest
-from onedata_wrapper.selectors.file_attribute import ALL as FA_ALL
 from api.models import Project, Dataset
+from api.resilience import ServiceUnavailable
+from onedata_api.cache import get_children, get_children_page
+from onedata_api.clients import get_client
 from onedata_api.middleware import create_new_dataset
 
 class SpacesViewSet(APIView):
     
         permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     
-        oneprovider_configuration = oneprovider_client.configuration.Configuration()
-    
         def get(self, request):
     
             if request.GET.get('dataset_id') is None:
@@ -30,13 +28,10 @@ class SpacesViewSet(APIView):
             if facility_token is None or facility_token == "":
                 return Response({"error": "Dataset doesn't have any supported space. Please contact the administrator of DAREG."})
     
-            self.oneprovider_configuration.host = dataset.project.facility.onedata_provider_url
-            self.oneprovider_configuration.api_key['X-Auth-Token'] = facility_token
-    
-            file_op_api = FileOperationsApi(self.oneprovider_configuration)
+            client = get_client(dataset.project.facility)
     
             # requesting list of spaces from Onedata
-            spaces = file_op_api.get_spaces()
+            spaces = client.call(client.file_op_api.get_spaces)
     
             return Response({"spaces": spaces})
 
@@ -44,9 +39,6 @@ class FilesViewSet(APIView):
 
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
 
-    oneprovider_configuration = oneprovider_client.configuration.Configuration()
-    file_op_api = FileOperationsApi(oneprovider_configuration)
-
     def post(self, request):
         # return Response(request.data)
         if request.data.get('collection_id') is None:
@@ -78,18 +70,30 @@ class FilesViewSet(APIView):
         if facility_token is None or facility_token == "":
             return Response({"error": "Facility is not supported by any Onedata space. Please contact the administrator of DAREG."}, status=404)
 
-        self.oneprovider_configuration.host = dataset.project.facility.onedata_provider_url
-        self.oneprovider_configuration.api_key['X-Auth-Token'] = facility_token
-
-
-        # creating SpaceRequest object used for Space retrieval (not using API calls yet)
-        file_request = EntryRequest(file_id=file_id)
-
-        # requesting Space information from Onedata
-        file = self.file_op_api.get_file(file_request, FA_ALL)
-
-        # requesting children for actual directory from Onedata
-        files = self.file_op_api.get_children(file, FA_ALL)
-
-        
-        return Response({"files": files})
+        try:
+            limit = min(int(request.GET.get('limit', settings.ONEDATA_LISTING_PAGE_SIZE)),
+                        settings.ONEDATA_LISTING_MAX_PAGE_SIZE)
+            offset = int(request.GET.get('offset', 0))
+        except ValueError:
+            return Response({"error": "limit and offset must be integers"}, status=400)
+        if limit < 1 or offset < 0:
+            return Response({"error": "limit must be positive and offset must not be negative"}, status=400)
+
+        client = get_client(dataset.project.facility)
+        refresh = request.GET.get('refresh') == "true"
+        # without any paging parameter the whole listing is returned, as before paging was introduced
+        paged = any(request.GET.get(param) for param in ('limit', 'token', 'offset'))
+
+        # requesting (one page of) children for actual directory from Onedata (or the cache)
+        try:
+            if not paged:
+                return Response({"files": get_children(client, file_id, refresh=refresh), "next_token": None,
+                                 "is_last": True})
+            page = get_children_page(client, file_id, limit, token=request.GET.get('token') or None, offset=offset,
+                                     refresh=refresh)
+        except ServiceUnavailable as e:
+            return Response({"error": f"Onedata is currently unavailable. {e}"}, status=503)
+        except Exception as e:
+            return Response({"error": f"Failed to list the directory. {e}"}, status=502)
+
+        return Response({"files": page["children"], "next_token": page["next_token"], "is_last": page["is_last"]})
@@ -47,7 +47,7 @@ class DatasetTests(APITestCase):
                 "metadata": {"meta": "meta1"}
                 }
         response = self.client.post(url, data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
 
         self.dataset_id = response.data["id"]
 
@@ -62,7 +62,7 @@ class DatasetTests(APITestCase):
                 "metadata": {"meta": "meta2"}
                 }
         response = self.client.post(url, data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
 
         response = self.client.get(url)
         self.assertEqual(len(response.data['results']), 2)
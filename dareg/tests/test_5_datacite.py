@@ -55,7 +55,7 @@ class DataciteTests(APITestCase):
                 "metadata": {"meta": "meta1"}
                 }
         response = self.client.post(url, data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
 
         self.dataset_id = response.data["id"]
 
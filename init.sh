@@ -5,12 +5,39 @@
 
 # Django configuration
 python3 /srv/dareg/manage.py collectstatic --noinput
+# the cache shared by all processes lives in the database
+python3 /srv/dareg/manage.py createcachetable
+
+# run a management command in the background, restarted whenever it exits
+keep_running() {
+    while true; do
+        python3 /srv/dareg/manage.py "$@"
+        echo "manage.py $1 exited, restarting in 10 seconds..."
+        sleep 10
+    done &
+}
+
+# background processes, disable with BACKGROUND_PROCESSES=false in containers that only serve requests
+if [ "$BACKGROUND_PROCESSES" != "false" ]; then
+    echo "Start background processes..."
+    # Onedata provisioning, renames and batch actions (api.jobs)
+    keep_running run_jobs
+    # experiment status and statistics from the Onedata change streams (onedata_api.changes)
+    keep_running consume_onedata_changes
+    # reservations from the facility booking system (api.reservation_sync), when one is configured
+    if [ -n "$BOOKING_API_URL" ] || [ -n "$BOOKING_FILE" ]; then
+        keep_running sync_reservations --interval "${RESERVATION_SYNC_INTERVAL:-300}"
+    fi
+    # monthly telemetry partitions and expiry of raw samples (api.telemetry), once a day
+    keep_running maintain_telemetry --interval 86400
+fi
 
 # start web server
 echo "Start web server..."
 if [ -n "$PRODUCTION" ] && [ "$PRODUCTION" == "true" ]; then
     echo "Running in production mode";
-    gunicorn --bind 0.0.0.0:8080 dareg.dareg.wsgi
+    # ASGI workers, the status event stream (api.events) is not served over WSGI
+    gunicorn --bind 0.0.0.0:8080 --worker-class uvicorn.workers.UvicornWorker dareg.dareg.asgi
 else
     echo "Running in development mode";
     python3 /srv/dareg/manage.py runserver 0.0.0.0:8080